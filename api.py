@@ -0,0 +1,368 @@
+"""
+JSON API, mounted at /api/v1
+
+Artists, venues, shows and artist availability, served from the view
+models of views.py. Listings are paginated with ?limit= and the ?after=
+cursor given as 'next' on the previous page; ?fields=a,b picks the
+fields returned. /artists/browse and /venues/browse filter by facets,
+/artists/<id>/matches and /venues/<id>/matches list matchmaking picks.
+/changes is the change feed of changelog.py.
+
+Every response carries a strong ETag derived from the versions of the
+rows it covers. If-None-Match is answered with 304 before anything is
+serialized. PATCH must send If-Match with the ETag of the full resource
+(no ?fields=) and gets 412 when the row has changed since.
+"""
+# Imports
+
+import hashlib
+import json
+
+from flask import Blueprint, abort, current_app, jsonify, request, stream_with_context
+from sqlalchemy import select
+from sqlalchemy.orm.exc import StaleDataError
+from werkzeug.exceptions import HTTPException
+
+import changelog
+from cache import read_refreshing
+from enums import GENRE_NAMES
+from exporter import require_token
+from forms import ArtistForm, VenueForm
+from importer import validate_record
+from matching import top_matches
+from models import db, Artist, Availability, AvailabilityRule, Venue, Show
+from pages import invalidate_artist, invalidate_venue, page_cache, recent_listings
+from queries import (ARTIST_COLUMNS, SHOW_FILTERS, VENUE_COLUMNS, decode_cursor,
+                     encode_cursor, facet_counts, facet_filters, shows_statement)
+from views import ArtistView, ShowSummary, VenueView
+
+api = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# kind: (model, view, selectable columns, form validating edits)
+RESOURCES = {
+    'artists': (Artist, ArtistView, ARTIST_COLUMNS, ArtistForm),
+    'venues': (Venue, VenueView, VENUE_COLUMNS, VenueForm),
+}
+
+SHOW_FIELDS = ShowSummary.__slots__
+
+
+@api.errorhandler(HTTPException)
+def http_error(error):
+    return jsonify({'error': error.description}), error.code
+
+
+# Handlers for a code win over class ones, including the site's HTML pages.
+api.register_error_handler(404, http_error)
+api.register_error_handler(500, http_error)
+
+
+# Conditional requests.
+
+
+def etag(*parts):
+    """ Returns a strong ETag for the representation described by parts """
+    return hashlib.blake2b(repr(parts).encode(), digest_size=16).hexdigest()
+
+
+def conditional(tag, body):
+    """ Returns 304 when If-None-Match matches tag, else the JSON of body() """
+    if request.if_none_match.contains_weak(tag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(body())
+    response.set_etag(tag)
+    # Clients may keep the response but must revalidate before reusing it.
+    response.cache_control.no_cache = True
+    return response
+
+
+# Arguments.
+
+
+def selected_fields(allowed):
+    """ Returns the ?fields= names, every allowed field when absent """
+    raw = request.args.get('fields')
+    if raw is None:
+        return tuple(allowed)
+    fields = tuple(dict.fromkeys(name.strip() for name in raw.split(',') if name.strip()))
+    unknown = sorted(set(fields) - set(allowed))
+    if unknown or not fields:
+        abort(400, f"Unknown fields {', '.join(unknown)}; choose from {', '.join(allowed)}."
+              if unknown else 'fields is empty.')
+    return fields
+
+
+def page_limit():
+    limit = request.args.get('limit', current_app.config['API_PAGE_SIZE'], type=int)
+    return min(max(limit, 1), current_app.config['API_MAX_PAGE_SIZE'])
+
+
+def int_arg(name):
+    """ Returns ?name= as an int, None when absent; 400 when not an int """
+    value = request.args.get(name, type=int)
+    if name in request.args and value is None:
+        abort(400, f'{name} must be an integer.')
+    return value
+
+
+# Artists and venues.
+
+
+def id_page(model, columns, fields, where=()):
+    """ Returns (rows, has_next) of the page after ?after=, in id order """
+    after = int_arg('after')
+    limit = page_limit()
+    stmt = (select(*[column for column in columns if column.key in fields or column.key == 'id'],
+                   model.version)
+            .where(*where)
+            .order_by(model.id)
+            .limit(limit + 1))
+    if after is not None:
+        stmt = stmt.where(model.id > after)
+    rows = db.session.execute(stmt).all()
+    return rows[:limit], len(rows) > limit
+
+
+@api.route('/<any(artists, venues):kind>')
+def list_resources(kind):
+    model, view, columns, _ = RESOURCES[kind]
+    fields = selected_fields([column.key for column in columns])
+    rows, has_next = id_page(model, columns, fields)
+
+    tag = etag(kind, fields, request.args.get('after'), len(rows), has_next,
+               [(row.id, row.version) for row in rows])
+    return conditional(tag, lambda: {
+        'data': [view.from_row(row).to_dict(fields) for row in rows],
+        'next': str(rows[-1].id) if has_next else None,
+    })
+
+
+@api.route('/<any(artists, venues):kind>/browse')
+def browse_resources(kind):
+    """ Lists the artists or venues matching every facet given, with facet counts
+
+    ?genre= (repeatable), ?state=, ?city= and ?seeking=true|false filter;
+    with ?genre_match=any one of the genres is enough.
+    The counts cover all matches, not just the page. They are cached and
+    refreshed in the background once FACET_CACHE_TTL seconds old, so only
+    the first request for a combination of filters waits for them.
+    """
+    model, view, columns, _ = RESOURCES[kind]
+    fields = selected_fields([column.key for column in columns])
+    genres = sorted(set(request.args.getlist('genre')))
+    unknown = [genre for genre in genres if genre not in GENRE_NAMES]
+    if unknown:
+        abort(400, f"Unknown genres {', '.join(unknown)}.")
+    seeking = request.args.get('seeking')
+    if seeking not in (None, 'true', 'false'):
+        abort(400, 'seeking must be true or false.')
+    genre_match = request.args.get('genre_match', 'all')
+    if genre_match not in ('all', 'any'):
+        abort(400, 'genre_match must be all or any.')
+    state, city = request.args.get('state'), request.args.get('city')
+    where = facet_filters(model, genres, state, city,
+                          None if seeking is None else seeking == 'true',
+                          any_genre=genre_match == 'any')
+
+    rows, has_next = id_page(model, columns, fields, where)
+    key = f'facets:{kind}:' + json.dumps([genres, genre_match, state, city, seeking])
+    limit = current_app.config['FACET_LIMIT']
+    total, facets = read_refreshing(
+        current_app._get_current_object(), page_cache, key,
+        lambda: facet_counts(model, where, limit), current_app.config['FACET_CACHE_TTL'])
+
+    tag = etag(kind, 'browse', key, fields, request.args.get('after'), len(rows), has_next,
+               [(row.id, row.version) for row in rows], total, facets)
+    return conditional(tag, lambda: {
+        'data': [view.from_row(row).to_dict(fields) for row in rows],
+        'next': str(rows[-1].id) if has_next else None,
+        'total': total,
+        'facets': facets,
+    })
+
+
+@api.route('/<any(artists, venues):kind>/<int:resource_id>')
+def get_resource(kind, resource_id):
+    model, view, columns, _ = RESOURCES[kind]
+    fields = selected_fields([column.key for column in columns])
+    row = db.session.execute(
+        select(*columns, model.version).where(model.id == resource_id)).first()
+    if row is None:
+        abort(404, f'There is no {kind[:-1]} {resource_id}.')
+    return conditional(etag(kind, resource_id, row.version, fields),
+                       lambda: view.from_row(row).to_dict(fields))
+
+
+@api.route('/<any(artists, venues):kind>/<int:resource_id>', methods=['PATCH'])
+def update_resource(kind, resource_id):
+    """ Applies a partial JSON update, guarded by If-Match """
+    model, _, columns, form_class = RESOURCES[kind]
+    if not request.if_match:
+        abort(428, 'Send If-Match with the ETag from a GET of the resource.')
+    changes = request.get_json(silent=True)
+    if not isinstance(changes, dict):
+        abort(400, 'Expected a JSON object of the fields to change.')
+
+    form = form_class(formdata=None, meta={'csrf': False})
+    unknown = sorted(set(changes) - set(form._fields))
+    if unknown:
+        abort(400, f"Fields {', '.join(unknown)} cannot be changed.")
+
+    instance = db.session.get(model, resource_id)
+    if instance is None:
+        abort(404, f'There is no {kind[:-1]} {resource_id}.')
+    current = etag(kind, resource_id, instance.version,
+                   tuple(column.key for column in columns))
+    if not request.if_match.contains(current):
+        abort(412, f'The {kind[:-1]} has changed, GET it again.')
+
+    record = {name: getattr(instance, name) for name in form._fields}
+    record.update(changes)
+    row, errors = validate_record(form, record)
+    if errors:
+        return jsonify({'error': 'Validation failed.', 'fields': errors}), 400
+
+    for name, value in row.items():
+        setattr(instance, name, value)
+    try:
+        # The UPDATE matches on the version read above, a concurrent edit
+        # in between leaves it matching no row.
+        db.session.commit()
+    except StaleDataError:
+        db.session.rollback()
+        abort(412, f'The {kind[:-1]} has changed, GET it again.')
+
+    if model is Artist:
+        invalidate_artist(resource_id)
+    else:
+        invalidate_venue(resource_id)
+    recent_listings.expire()
+    return get_resource(kind, resource_id)
+
+
+@api.route('/<any(artists, venues):kind>/<int:resource_id>/matches')
+def resource_matches(kind, resource_id):
+    """ Returns the best matching venues of an artist, or artists of a venue """
+    matches = top_matches(kind, resource_id, page_limit(),
+                          current_app.config['MATCH_HORIZON_DAYS'])
+    if matches is None:
+        abort(404, f'There is no {kind[:-1]} {resource_id}.')
+    return conditional(etag(kind, resource_id, 'matches', matches), lambda: {'data': matches})
+
+
+# Shows.
+
+
+@api.route('/shows')
+def list_shows():
+    when = request.args.get('when', 'all')
+    if when not in SHOW_FILTERS:
+        abort(400, f"when must be one of {', '.join(SHOW_FILTERS)}.")
+    try:
+        after = decode_cursor(request.args['after']) if 'after' in request.args else None
+    except ValueError:
+        abort(400, 'after is not a cursor from this API.')
+    fields = selected_fields(SHOW_FIELDS)
+    artist_id, venue_id = int_arg('artist_id'), int_arg('venue_id')
+    limit = page_limit()
+
+    # Names and images come from the joined rows, so their versions count too.
+    stmt = shows_statement(when, after, limit=limit + 1).add_columns(
+        Show.version, Artist.version.label('artist_version'),
+        Venue.version.label('venue_version'))
+    if artist_id is not None:
+        stmt = stmt.where(Show.artist_id == artist_id)
+    if venue_id is not None:
+        stmt = stmt.where(Show.venue_id == venue_id)
+    rows = db.session.execute(stmt).all()
+    rows, has_next = rows[:limit], len(rows) > limit
+
+    tag = etag('shows', when, request.args.get('after'), artist_id, venue_id, fields,
+               limit, has_next,
+               [(row.id, row.version, row.artist_version, row.venue_version) for row in rows])
+    return conditional(tag, lambda: {
+        'data': [ShowSummary.from_row(row).to_dict(fields) for row in rows],
+        'next': encode_cursor(rows[-1].start_time, rows[-1].id) if has_next else None,
+    })
+
+
+@api.route('/shows/<int:show_id>')
+def get_show(show_id):
+    fields = selected_fields(SHOW_FIELDS)
+    row = db.session.execute(
+        shows_statement().add_columns(Show.version, Artist.version.label('artist_version'),
+                                      Venue.version.label('venue_version'))
+        .where(Show.id == show_id)).first()
+    if row is None:
+        abort(404, f'There is no show {show_id}.')
+    tag = etag('show', show_id, row.version, row.artist_version, row.venue_version, fields)
+    return conditional(tag, lambda: ShowSummary.from_row(row).to_dict(fields))
+
+
+# Availability.
+
+
+@api.route('/artists/<int:artist_id>/availability')
+def artist_availability(artist_id):
+    """ Returns the artist's availability ranges and weekly rules
+
+    Rows are never updated in place, saving availability replaces them,
+    so their ids serve as versions.
+    """
+    if db.session.execute(select(Artist.id).where(Artist.id == artist_id)).first() is None:
+        abort(404, f'There is no artist {artist_id}.')
+    ranges = db.session.execute(
+        select(Availability.id, Availability.start_time, Availability.end_time)
+        .where(Availability.artist_id == artist_id)
+        .order_by(Availability.start_time, Availability.id)).all()
+    rules = db.session.execute(
+        select(AvailabilityRule.id, AvailabilityRule.weekday, AvailabilityRule.start_time,
+               AvailabilityRule.end_time, AvailabilityRule.valid_from,
+               AvailabilityRule.valid_until)
+        .where(AvailabilityRule.artist_id == artist_id)
+        .order_by(AvailabilityRule.weekday, AvailabilityRule.start_time, AvailabilityRule.id)
+    ).all()
+
+    tag = etag('availability', artist_id, [row.id for row in ranges], [row.id for row in rules])
+    return conditional(tag, lambda: {
+        'availability': [{'start_time': row.start_time.isoformat(),
+                          'end_time': row.end_time.isoformat()} for row in ranges],
+        'availability_rules': [{
+            'weekday': row.weekday,
+            'start_time': row.start_time.isoformat('minutes'),
+            'end_time': row.end_time.isoformat('minutes'),
+            'valid_from': row.valid_from.isoformat(),
+            'valid_until': row.valid_until.isoformat() if row.valid_until else None,
+        } for row in rules],
+    })
+
+
+# Change feed.
+
+
+@api.route('/changes')
+def list_changes():
+    """ Returns the changes after ?after=, with the cursor to ask for the next ones """
+    try:
+        entries, cursor, has_more = changelog.read(request.args.get('after'), page_limit())
+    except ValueError:
+        abort(400, 'after is not a cursor from this API.')
+    except changelog.CursorExpired:
+        abort(410, 'The cursor has expired, start over from /api/v1/changes/snapshot.')
+    changelog.compact_soon(current_app._get_current_object())
+    response = jsonify({'data': entries, 'next': cursor, 'has_more': has_more})
+    response.cache_control.no_store = True
+    return response
+
+
+@api.route('/changes/snapshot')
+def changes_snapshot():
+    """ Streams every artist, venue and show as NDJSON, after the cursor to follow on with
+
+    A whole-catalogue dump, so it takes EXPORT_TOKEN like /export.
+    """
+    require_token()
+    lines = (json.dumps(line) + '\n' for line in changelog.snapshot())
+    return current_app.response_class(stream_with_context(lines),
+                                      mimetype='application/x-ndjson')
@@ -4,30 +4,104 @@
 """
 # Imports
 
-from collections import defaultdict
 import logging
 import os
+import weakref
+from datetime import datetime, timedelta
 from logging import FileHandler, Formatter
 import babel
 import dateutil.parser
-from flask import (Flask, flash,  
-redirect, render_template, request, url_for)
+from flask import (Blueprint, Flask, abort, current_app, flash, jsonify,
+redirect, render_template, request, stream_template, stream_with_context,
+url_for)
 from flask_migrate import Migrate
 from flask_moment import Moment
+from sqlalchemy import delete, insert, select
+from sqlalchemy.exc import IntegrityError
 
 from forms import *
-from models import db, Artist, Venue, Show
+from enums import GENRE_LABELS
+from models import db, Artist, Availability, AvailabilityRule, Venue, Show
+from api import api
+from availability import ArtistSchedule, availability_labels, is_available
+from cache import detail_key, invalidate, read_through
+from booking import BookingRace, booking_conflict, schedule_shows
+from cli import fyyur_cli
+from counters import count_shows
+from exporter import (EXPORTS, FORMATS as EXPORT_FORMATS, export, export_watermark,
+                      require_token)
+from metrics import Metrics
+from pages import invalidate_artist, invalidate_venue, page_cache, recent_listings
+from queries import ShowPage, all_artists, artist_detail, in_area, venue_areas, venue_detail
+from replicas import primary_only, replicas
+from search import search_by_name, suggest
+from views import ArtistView, VenueView
 
 # App Config.
 
-app = Flask(__name__)
-moment = Moment(app)
-app.config.from_object('config')
-db.init_app(app)
-migrate = Migrate(app, db)
+moment = Moment()
+migrate = Migrate()
+metrics = Metrics()
+main = Blueprint('main', __name__)
+
+
+def create_app(config='config'):
+    """ Returns a new app configured from config, an import path or object """
+    app = Flask(__name__)
+    app.config.from_object(config)
+    moment.init_app(app)
+    db.init_app(app)
+    replicas.init_app(app)
+    migrate.init_app(app, db)
+    page_cache.init_app(app)
+    metrics.init_app(app)
+    recent_listings.max_age = app.config['RECENT_LISTINGS_MAX_AGE']
+    app.cli.add_command(fyyur_cli)
+    app.register_blueprint(main)
+    app.register_blueprint(api)
+    configure_logging(app)
+    _apps.add(app)
+    return app
+
+
+# Apps of this process, held weakly so discarded ones are not kept alive.
+_apps = weakref.WeakSet()
+
+
+def dispose_engines():
+    """ Drops pooled connections inherited from the parent process
+
+    Runs in every forked child, e.g. gunicorn workers of a preloaded app.
+    close=False leaves the parent's sockets alone; the child opens its own.
+    """
+    for app in list(_apps):
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=dispose_engines)
+
+
+def configure_logging(app):
+    if any(isinstance(handler, FileHandler) for handler in app.logger.handlers):
+        return
+    file_handler = FileHandler('error.log')
+    file_handler.setFormatter(
+        Formatter(
+            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+    )
+    app.logger.setLevel(logging.INFO)
+    file_handler.setLevel(logging.INFO)
+    app.logger.addHandler(file_handler)
 
 # Filters.
 
+@main.app_template_filter('genre')
+def format_genre(name):
+    return GENRE_LABELS.get(name, name)
+
+@main.app_template_filter('datetime')
 def format_datetime(value, format='medium'):
     if isinstance(value, str):
         date =dateutil.parser.parse(value)
@@ -42,25 +116,33 @@ def format_datetime(value, format='medium'):
     return babel.dates.format_datetime(date, format)
 
 
-app.jinja_env.filters['datetime'] = format_datetime
-
 # Controllers.
 
 
-@app.route('/')
+@main.route('/')
 def index():
-  
-    recent_artists = Artist.query.order_by(Artist.created_at.desc()).limit(10).all()
+    return render_template('pages/home.html',
+                           recent_listings=recent_listings.get(current_app._get_current_object()))
+
+@main.route('/metrics')
+def prometheus_metrics():
+    return current_app.response_class(metrics.render(), mimetype='text/plain; version=0.0.4')
 
-    recent_venues = Venue.query.order_by(Venue.created_at.desc()).limit(10).all()
+@main.route('/cache/stats')
+def cache_stats():
+    # Per worker, like the fragment.
+    return jsonify({'pid': os.getpid(), 'recent_listings': recent_listings.stats})
 
-    return render_template('pages/home.html',recent_artists=recent_artists, recent_venues=recent_venues)
+
+@main.route('/health')
+def health():
+    return jsonify({'replicas': replicas.status()})
   
 
 pass
 
 # Common Search by city and State
-@app.route('/search', methods=['GET', 'POST'])
+@main.route('/search', methods=['GET', 'POST'])
 def search():
     form = SearchForm()
     artists = []
@@ -70,9 +152,9 @@ def search():
            city = form.city.data
            state = form.state.data
        
-           artists = Artist.query.filter_by(city=city, state=state).all()
+           artists = in_area(Artist, city, state)
        
-           venues = Venue.query.filter_by(city=city, state=state).all()
+           venues = in_area(Venue, city, state)
            return render_template('pages/show_results.html',city=city,state=state,artists=artists, venues=venues)
            
         else:   
@@ -83,33 +165,28 @@ def search():
         
 
 # Artists
-@app.route('/artists')
+@main.route('/artists')
 def artists():
     return render_template('pages/artists.html',
-                           artists=Artist.query.all())
+                           artists=all_artists())
 
 # Artist Search
-@app.route('/artists/search', methods=['POST'])
+@main.route('/artists/search', methods=['POST'])
 def search_artists():
-    search_term = request.form.get('search_term')
-    search_results = Artist.query.filter(
-        Artist.name.ilike('%{}%'.format(search_term))).all()  
-
-    response = {}
-    response['count'] = len(search_results)
-    response['data'] = search_results
+    search_term = request.form.get('search_term', '')
+    response = search_by_name(Artist, search_term, current_app.config['SEARCH_RESULTS_LIMIT'])
 
     return render_template('pages/search_artists.html',
                            results=response,
-                           search_term=request.form.get('search_term', ''))
+                           search_term=search_term)
 
 # Create Artist
-@app.route('/artists/create', methods=['GET'])
+@main.route('/artists/create', methods=['GET'])
 def create_artist_form():
     form = ArtistForm()
     return render_template('forms/new_artist.html', form=form)
 
-@app.route('/artists/create', methods=['POST'])
+@main.route('/artists/create', methods=['POST'])
 def create_artist_submission():
     form = ArtistForm(request.form,meta={'csrf':False})
     if form.validate() :
@@ -127,12 +204,13 @@ def create_artist_submission():
           seeking_description = form.seeking_description.data)
           db.session.add(artist)
           db.session.commit()
+          recent_listings.expire()
           flash('Artist ' + form.name.data +
                   ' was successfully listed!')
           return render_template('pages/home.html')
-       except Exception as e:
+       except Exception:
           db.session.rollback()
-          print(e)
+          current_app.logger.exception('Could not create artist')
           flash('An error occurred. Artist ' +
                   form.name.data + ' could not be listed.')
        finally:
@@ -143,52 +221,31 @@ def create_artist_submission():
         return render_template('forms/new_artist.html', form=form)
 
 # View Artist
-@app.route('/artists/<int:artist_id>')
+@main.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
-    artist = Artist.query.get_or_404(artist_id)
-    past_shows = []
-    upcoming_shows = []
-
-    for show in artist.shows:
-        show_info = {
-            "venue_id": show.venue_id,
-            "venue_name": show.venue.name,
-            "venue_image_link": show.venue.image_link,
-            "start_time": format_datetime(show.start_time)
-        }
-        if show.start_time <= datetime.now():
-            past_shows.append(show_info)
-        else:
-            upcoming_shows.append(show_info)
-
-    data = artist.__dict__
-    data['past_shows'] = past_shows
-    data['upcoming_shows'] = upcoming_shows
-    data['past_shows_count'] = len(past_shows)
-    data['upcoming_shows_count'] = len(upcoming_shows)
-
-    availability_data = []
-    current_datetime = datetime.now()
-
-    if artist.availability:
-        for slot in artist.availability:
-            date_str = slot.get("date")
-            time_str = slot.get("start_time")
-
-            if date_str and time_str:
-                try:
-                    slot_datetime = datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M")
-                    
-                    if slot_datetime > current_datetime:
-                        formatted_slot = f"{date_str}, {time_str}"
-                        availability_data.append(formatted_slot)
-                except ValueError:
-                    continue
-
-    return render_template('pages/show_artist.html', artist=data, availability_data=availability_data)
+    artist = ArtistView.from_dict(read_through(
+        page_cache, detail_key('artist', artist_id),
+        lambda: artist_page(artist_id), current_app.config['DETAIL_CACHE_TTL']))
+    return render_template('pages/show_artist.html', artist=artist,
+                           availability_data=artist.availability_data)
+
+def artist_page(artist_id):
+    """ Returns the artist page view model as a dict and its next upcoming show time
+
+    Read on the primary: the page is cached far longer than a client reads
+    its own writes, a lagging replica would keep serving it stale.
+    """
+    now = datetime.now()
+    with primary_only():
+        artist = artist_detail(artist_id, now)
+        if artist is None:
+            abort(404)
+        artist.availability_data = availability_labels(artist_id, now)
+    next_change = artist.upcoming_shows[0].start_time if artist.upcoming_shows else None
+    return artist.to_dict(), next_change
 
 # Edit Artist
-@app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@main.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
     form = ArtistForm()
     artist = Artist.query.get_or_404(artist_id)
@@ -196,9 +253,10 @@ def edit_artist(artist_id):
     return render_template('forms/edit_artist.html', form=form, artist=artist)
 
 
-@app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@main.route('/artists/<int:artist_id>/edit', methods=['POST'])
 def edit_artist_submission(artist_id):
     form = ArtistForm()
+    updated = False
     try:
         artist = Artist.query.get_or_404(artist_id)
         artist.name = form.name.data
@@ -213,71 +271,58 @@ def edit_artist_submission(artist_id):
         artist.seeking_description = form.seeking_description.data
         db.session.add(artist)
         db.session.commit()
+        updated = True
         flash('Artist ' + form.name.data +
                   ' was successfully updated!')
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(e)
+        current_app.logger.exception('Could not update artist %s', artist_id)
         flash('An error occured. Artist ' +
                   form.name.data + ' Could not be updated!')
     finally:
         db.session.close()
 
-    return redirect(url_for('show_artist', artist_id=artist_id))
+    # Outside the try: the update is committed whatever happens here.
+    if updated:
+        invalidate_artist(artist_id)
+        recent_listings.expire()
+    return redirect(url_for('.show_artist', artist_id=artist_id))
               
 
 # Venue
-@app.route('/venues')
+@main.route('/venues')
 def venues():
-    venues = Venue.query.order_by(Venue.state, Venue.city).all()
-
-    data = defaultdict(lambda :{ "venues":[]})
+    page = max(request.args.get('page', 1, type=int), 1)
+    areas, has_next = venue_areas(page=page,
+                                  per_page=current_app.config['VENUE_AREAS_PER_PAGE'])
 
-    for venue in venues:
-        city_state = (venue.city,venue.state)
-        data[city_state]["city"] = venue.city
-        data[city_state]["state"] = venue.state
-        data[city_state]["venues"].append({
-            'id': venue.id,
-            'name': venue.name,
-            'num_upcoming_shows': len([show for show in venue.shows if show.start_time > datetime.today()])
-        })
-
-    data = [value for value in data.values()]
-
-    return render_template('pages/venues.html', areas=data)
+    return render_template('pages/venues.html', areas=areas,
+                           page=page, has_next=has_next)
 
 # Venue Search
-@app.route('/venues/search', methods=['POST'])
+@main.route('/venues/search', methods=['POST'])
 def search_venues():
-    search_term = request.form.get('search_term')
-    venues = Venue.query.filter(
-        Venue.name.ilike('%{}%'.format(search_term))).all()
-
-    data = []
-    for venue in venues:
-        tmp = {}
-        tmp['id'] = venue.id
-        tmp['name'] = venue.name
-        tmp['num_upcoming_shows'] = len(venue.shows)
-        data.append(tmp)
-
-    response = {}
-    response['count'] = len(data)
-    response['data'] = data
+    search_term = request.form.get('search_term', '')
+    response = search_by_name(Venue, search_term, current_app.config['SEARCH_RESULTS_LIMIT'])
 
     return render_template('pages/search_venues.html',
                            results=response,
-                           search_term=request.form.get('search_term', ''))
+                           search_term=search_term)
+
+# Name autocomplete
+@main.route('/search/suggest')
+def search_suggest():
+    return jsonify(suggest(request.args.get('q', ''),
+                           current_app.config['SEARCH_SUGGEST_LIMIT']))
 
 #  Create Venue
-@app.route('/venues/create', methods=['GET'])
+@main.route('/venues/create', methods=['GET'])
 def create_venue_form():
     form = VenueForm()
     return render_template('forms/new_venue.html', form=form)
 
 
-@app.route('/venues/create', methods=['POST'])
+@main.route('/venues/create', methods=['POST'])
 def create_venue_submission():
     form = VenueForm(request.form,meta={'csrf':False})
     if form.validate():
@@ -296,13 +341,14 @@ def create_venue_submission():
              seeking_description = form.seeking_description.data)
              db.session.add(venue)
              db.session.commit()
+             recent_listings.expire()
              flash('Venue ' + form.name.data +
                   ' was successfully listed!')
              return render_template('pages/home.html')
-         except Exception as e :
+         except Exception:
              error = True
              db.session.rollback()
-             print(e)
+             current_app.logger.exception('Could not create venue')
              flash('An error occured. Venue Could not be listed!')
          finally:
              db.session.close()
@@ -312,43 +358,38 @@ def create_venue_submission():
         return render_template('forms/new_venue.html', form=form)
         
 # View Venue
-@app.route('/venues/<int:venue_id>')
+@main.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
-    venue = Venue.query.get_or_404(venue_id)
-    past_shows=[]
-    upcoming_shows=[]
-
-    for show in venue.shows:
-        show_info = {
-            "artist_id" : show.artist_id,
-            "artist_name" : show.artist.name,
-            "artist_image_link" : show.artist.image_link,
-            "start_time" : format_datetime(show.start_time)
-        }
-        if show.start_time <= datetime.now():
-            past_shows.append(show_info)
-        else:
-            upcoming_shows.append(show_info)
-
-    data = venue.__dict__
-    data['past_shows']= past_shows
-    data['upcoming_shows']= upcoming_shows
-    data['past_shows_count']=len(past_shows)
-    data['upcoming_shows_count']= len(upcoming_shows)
-    
-    return render_template('pages/show_venue.html', venue=data)
+    venue = VenueView.from_dict(read_through(
+        page_cache, detail_key('venue', venue_id),
+        lambda: venue_page(venue_id), current_app.config['DETAIL_CACHE_TTL']))
+    return render_template('pages/show_venue.html', venue=venue)
+
+def venue_page(venue_id):
+    """ Returns the venue page view model as a dict and its next upcoming show time
+
+    Read on the primary, like artist_page().
+    """
+    now = datetime.now()
+    with primary_only():
+        venue = venue_detail(venue_id, now)
+    if venue is None:
+        abort(404)
+    next_change = venue.upcoming_shows[0].start_time if venue.upcoming_shows else None
+    return venue.to_dict(), next_change
         
 # Edit venue
-@app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@main.route('/venues/<int:venue_id>/edit', methods=['GET'])
 def edit_venue(venue_id):
     form = VenueForm()
     venue = Venue.query.get_or_404(venue_id)
     return render_template('forms/edit_venue.html', form=form, venue=venue)
 
 
-@app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@main.route('/venues/<int:venue_id>/edit', methods=['POST'])
 def edit_venue_submission(venue_id):
     form = VenueForm()
+    updated = False
     try:
         venue = Venue.query.get_or_404(venue_id)
         venue.name = form.name.data
@@ -364,42 +405,41 @@ def edit_venue_submission(venue_id):
         venue.seeking_description = form.seeking_description.data
         db.session.add(venue)
         db.session.commit()
+        updated = True
         flash('Venue ' + form.name.data +
                   ' was successfully updated!')
-    except Exception as e:
+    except Exception:
         db.session.rollback()
-        print(e)
+        current_app.logger.exception('Could not update venue %s', venue_id)
         flash('An error occurred. Venue ' +
                   form.name.data + ' could not be updated.')
     finally:
         db.session.close()
-               
-    return redirect(url_for('show_venue', venue_id=venue_id))
+
+    if updated:
+        invalidate_venue(venue_id)
+        recent_listings.expire()
+    return redirect(url_for('.show_venue', venue_id=venue_id))
 
 #  Shows
-@app.route('/shows')
+@main.route('/shows')
 def shows():
-    shows = Show.query.all()
-    data = []
-    for show in shows:
-        data.append({
-            'venue_id': show.venue.id,
-            'venue_name': show.venue.name,
-            'artist_id': show.artist.id,
-            'artist_name': show.artist.name,
-            'artist_image_link': show.artist.image_link,
-            'start_time': show.start_time.isoformat()
-        })
-
-    return render_template('pages/shows.html', shows=data)
+    when = request.args.get('when', 'all')
+    try:
+        page = ShowPage(when=when, after=request.args.get('after'),
+                        per_page=current_app.config['SHOWS_PER_PAGE'])
+    except ValueError:
+        abort(400)
+
+    return stream_template('pages/shows.html', shows=page, when=when)
 
 # Create Show 
-@app.route('/shows/create')
+@main.route('/shows/create')
 def create_shows():
     form = ShowForm()
     return render_template('forms/new_show.html', form=form)
 
-@app.route('/shows/create', methods=['POST'])
+@main.route('/shows/create', methods=['POST'])
 def create_show_submission():
     form = ShowForm(request.form,meta={'csrf':False})
     if form.validate() :
@@ -410,46 +450,65 @@ def create_show_submission():
             start_time= form.start_time.data
              )
             
-            show_date = show.start_time.date().isoformat()  
-            show_time = show.start_time.time().strftime("%H:%M")
-
-            if is_artist_available(show.artist_id, show_date, show_time) :
+            if is_artist_available(show.artist_id, show.start_time) :
                  db.session.add(show)
+                 count_shows([(show.artist_id, show.venue_id, show.start_time)])
+                 artist_id, venue_id = show.artist_id, show.venue_id
                  db.session.commit()
                  flash('Requested show was successfully listed')
-                 return render_template('pages/home.html')
             else:
                  flash("The artist is not available at the requested date and time.")
-                 return redirect(url_for('create_shows'))
-         except Exception as e:
+                 return redirect(url_for('.create_shows'))
+         except IntegrityError as e:
             db.session.rollback()
-            print(e)
+            flash(booking_conflict(e) or 'An error occurred. show could not be listed.')
+            return redirect(url_for('.create_shows'))
+         except Exception:
+            db.session.rollback()
+            current_app.logger.exception('Could not create show')
             flash('An error occurred. show could not be listed.')
-            return redirect(url_for('create_shows'))
+            return redirect(url_for('.create_shows'))
          finally:
             db.session.close()
-           
+
+         invalidate(page_cache, artists=[artist_id], venues=[venue_id])
+         return render_template('pages/home.html')
     else:
         errors = ", ".join([f"{field}:{error}" for field, errs in form.errors.items() for error in errs])
         flash(f'please fix the following errors: {errors}')  
 
     return render_template('pages/shows.html', form=form)
 
-def is_artist_available(artist_id, show_date, show_time):
+# Batch booking
+@main.route('/shows/batch', methods=['POST'])
+def create_shows_batch():
+    payload = request.get_json(silent=True)
+    entries = payload.get('shows') if isinstance(payload, dict) else payload
+    if not isinstance(entries, list):
+        return jsonify({'error': 'Expected a JSON list of shows.'}), 400
+    if len(entries) > current_app.config['SHOW_BATCH_LIMIT']:
+        return jsonify({'error': f"At most {current_app.config['SHOW_BATCH_LIMIT']} shows per batch."}), 413
 
-    artist = Artist.query.get_or_404(artist_id)
-    available_slots = artist.availability 
+    try:
+        results = schedule_shows(entries)
+    except BookingRace as e:
+        return jsonify({'error': f'{e} Nothing was booked, please retry.'}), 409
+    finally:
+        db.session.close()
 
-    for slot in available_slots:
-        available_date = slot.get("date")
-        available_time = slot.get("start_time")
+    created = [entries[result['index']] for result in results if result['status'] == 'created']
+    invalidate(page_cache,
+               artists=[int(entry['artist_id']) for entry in created],
+               venues=[int(entry['venue_id']) for entry in created])
+    created = len(created)
+    return jsonify({'created': created, 'results': results}), 201 if created else 200
 
-        if show_date == available_date and show_time == available_time:
-            return True
-    return False    
+def is_artist_available(artist_id, start_time):
+    """ Slots are kept to the minute, like the availability form """
+    return is_available(artist_id, start_time.replace(second=0, microsecond=0))
 
 # Set Availability
-@app.route('/artists/<int:artist_id>/set_availability', methods=['GET', 'POST'])
+@main.route('/artists/<int:artist_id>/set_availability', methods=['GET', 'POST'])
 def set_availability(artist_id):
     artist = Artist.query.get_or_404(artist_id)
     form = AvailabilityForm(request.form, meta={'csrf': False})
@@ -457,50 +516,94 @@ def set_availability(artist_id):
     if request.method == 'POST':
         if form.validate():
             try:
-                entries = [
-                    {"date": entry.date.data.strftime('%Y-%m-%d'), "start_time": entry.start_time.data.strftime('%H:%M')}
-                    for entry in form.entries
-                ]
-                artist.availability = entries  
+                entries = []
+                rules = []
+                for entry in form.entries:
+                    end_time = entry.end_time.data or entry.start_time.data
+                    if entry.repeat_weekly.data:
+                        rules.append({"artist_id": artist_id,
+                                      "weekday": entry.date.data.weekday(),
+                                      "start_time": entry.start_time.data,
+                                      "end_time": end_time,
+                                      "valid_from": entry.date.data})
+                    else:
+                        entries.append({"artist_id": artist_id,
+                                        "start_time": datetime.combine(entry.date.data, entry.start_time.data),
+                                        "end_time": datetime.combine(entry.date.data, end_time)})
+
+                db.session.execute(delete(Availability).where(Availability.artist_id == artist_id))
+                db.session.execute(delete(AvailabilityRule).where(AvailabilityRule.artist_id == artist_id))
+                if entries:
+                    db.session.execute(insert(Availability), entries)
+                if rules:
+                    db.session.execute(insert(AvailabilityRule), rules)
                 db.session.commit()
+                updated = True
                 flash('Availability updated successfully!', 'success')
-                return redirect(url_for('show_artist', artist_id=artist_id))
-            except Exception as e:
+            except Exception:
+                updated = False
                 db.session.rollback()
-                print(e)
+                current_app.logger.exception('Could not set availability of artist %s', artist_id)
                 flash('An error occurred. Unable to Update it !!!.')
             finally:
                 db.session.close()
+
+            if updated:
+                invalidate(page_cache, artists=[artist_id])
+                return redirect(url_for('.show_artist', artist_id=artist_id))
         else:
             errors = ", ".join([f"{field}: {error}" for field, errs in form.errors.items() for error in errs])
             flash(f'Please fix the following errors: {errors}')
 
     return render_template('forms/set_availability.html', form=form, artist=artist, entries=entries)
 
+# Free windows
+@main.route('/artists/<int:artist_id>/free_windows')
+def free_windows(artist_id):
+    if db.session.execute(select(Artist.id).where(Artist.id == artist_id)).first() is None:
+        abort(404)
+    since = request.args.get('from', type=datetime.fromisoformat) or datetime.now()
+    count = min(request.args.get('n', 10, type=int), current_app.config['FREE_WINDOWS_LIMIT'])
+
+    schedule = ArtistSchedule.load(artist_id, since,
+                                   timedelta(minutes=current_app.config['SHOW_DURATION_MINUTES']))
+    windows = schedule.free_windows(
+        since, count, timedelta(days=current_app.config['AVAILABILITY_HORIZON_DAYS']))
+
+    return jsonify({
+        'artist_id': artist_id,
+        'windows': [{'start': start.isoformat(), 'end': end.isoformat()}
+                    for start, end in windows]
+    })
+
+# Export
+@main.route('/export/<kind>.<fmt>')
+def export_catalogue(kind, fmt):
+    require_token()
+    if kind not in EXPORTS or fmt not in EXPORT_FORMATS:
+        abort(404)
+    since = request.args.get('since', type=datetime.fromisoformat)
+    if 'since' in request.args and since is None:
+        abort(400)
+
+    watermark = export_watermark()
+    return current_app.response_class(
+        stream_with_context(export(kind, fmt, since=since)),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={'X-Export-Watermark': watermark.isoformat()})
+
      
  #error handler - 404 
-@app.errorhandler(404)
+@main.app_errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
 
 #error handler - 500
-@app.errorhandler(500)
+@main.app_errorhandler(500)
 def server_error(error):
     return render_template('errors/500.html'), 500
 
 
-if not app.debug:
-    file_handler = FileHandler('error.log')
-    file_handler.setFormatter(
-        Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
-    )
-    app.logger.setLevel(logging.INFO)
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.info('errors')
-
-
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5010))
-    app.run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=port, debug=True)
\ No newline at end of file
@@ -0,0 +1,225 @@
+"""
+Artist availability engine
+
+Availability is the union of one-off ranges (the availability table) and
+weekly rules (availability_rules). Booking checks run as one indexed
+EXISTS query. Free-window listings load one artist's schedule into
+IntervalIndex objects and expand the weekly rules lazily, one day at a
+time, only as far as the caller reads.
+"""
+# Imports
+
+import calendar
+import heapq
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+from sqlalchemy import case, func, or_, select
+
+from models import db, Availability, AvailabilityRule, Show
+
+# Interval index.
+
+
+class IntervalIndex:
+    """ Disjoint, sorted closed intervals searchable by bisection
+
+    Overlapping and touching inputs are merged on construction, which
+    keeps both the start and end lists sorted.
+    """
+    __slots__ = ('starts', 'ends')
+
+    def __init__(self, intervals=()):
+        self.starts = []
+        self.ends = []
+        for start, end in sorted(intervals):
+            if self.ends and start <= self.ends[-1]:
+                self.ends[-1] = max(self.ends[-1], end)
+            else:
+                self.starts.append(start)
+                self.ends.append(end)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __iter__(self):
+        return zip(self.starts, self.ends)
+
+    def covers(self, point):
+        """ Returns True when an interval contains point, in O(log n) """
+        i = bisect_right(self.starts, point) - 1
+        return i >= 0 and point <= self.ends[i]
+
+    def overlapping(self, start, end):
+        """ Yields the intervals that intersect [start, end] """
+        i = bisect_left(self.ends, start)
+        while i < len(self.starts) and self.starts[i] <= end:
+            yield self.starts[i], self.ends[i]
+            i += 1
+
+    def since(self, point):
+        """ Yields the intervals ending at or after point, clipped to it """
+        for i in range(bisect_left(self.ends, point), len(self.starts)):
+            yield max(self.starts[i], point), self.ends[i]
+
+
+# Schedule.
+
+
+class ArtistSchedule:
+    """ One artist's ranges, weekly rules and booked shows
+
+    No show may start within show_duration of another, see booking.Slots,
+    so each booked show blocks show_duration either side of its start.
+    """
+
+    def __init__(self, ranges, rules, booked, show_duration):
+        self.ranges = IntervalIndex(ranges)
+        self.rules = {}
+        for rule in rules:
+            self.rules.setdefault(rule.weekday, []).append(rule)
+        self.booked = IntervalIndex((start - show_duration, start + show_duration)
+                                    for start in booked)
+        self._days = {}
+
+    @classmethod
+    def load(cls, artist_id, since, show_duration):
+        """ Loads everything relevant from since onwards, three indexed queries """
+        ranges = db.session.execute(
+            select(Availability.start_time, Availability.end_time)
+            .where(Availability.artist_id == artist_id,
+                   Availability.end_time >= since)).all()
+        rules = db.session.execute(
+            select(AvailabilityRule.weekday, AvailabilityRule.start_time,
+                   AvailabilityRule.end_time, AvailabilityRule.valid_from,
+                   AvailabilityRule.valid_until)
+            .where(AvailabilityRule.artist_id == artist_id,
+                   or_(AvailabilityRule.valid_until.is_(None),
+                       AvailabilityRule.valid_until >= since.date()))).all()
+        booked = db.session.execute(
+            select(Show.start_time)
+            .where(Show.artist_id == artist_id,
+                   Show.start_time >= since - show_duration)).scalars().all()
+        return cls(ranges, rules, booked, show_duration)
+
+    def day(self, date):
+        """ Returns the IntervalIndex of rule occurrences on date """
+        if date not in self._days:
+            self._days[date] = IntervalIndex(
+                (datetime.combine(date, rule.start_time),
+                 datetime.combine(date, rule.end_time))
+                for rule in self.rules.get(date.weekday(), ())
+                if rule.valid_from <= date
+                and (rule.valid_until is None or date <= rule.valid_until))
+        return self._days[date]
+
+    def covers(self, when):
+        """ Returns True when a range or a weekly rule covers when """
+        return self.ranges.covers(when) or self.day(when.date()).covers(when)
+
+    def available(self, since, until):
+        """ Yields merged available intervals between since and until """
+        occurrences = [self.ranges.since(since)]
+        if self.rules:
+            occurrences.append(self._rule_occurrences(since, until))
+
+        current = None
+        for start, end in heapq.merge(*occurrences):
+            if start > until:
+                break
+            if current and start <= current[1]:
+                current = (current[0], max(current[1], end))
+                continue
+            if current:
+                yield current
+            current = (start, end)
+        if current:
+            yield current
+
+    def _rule_occurrences(self, since, until):
+        date = since.date()
+        while date <= until.date():
+            yield from self.day(date).since(since)
+            date += timedelta(days=1)
+
+    def free_windows(self, since, count, horizon):
+        """ Returns the next count available windows not taken by a show
+
+        Windows are of start times: a show starting anywhere in one,
+        including its ends, overlaps no booked show.
+        """
+        windows = []
+        for start, end in self.available(since, since + horizon):
+            for booked_start, booked_end in self.booked.overlapping(start, end):
+                if start < booked_start:
+                    windows.append((start, booked_start))
+                start = max(start, booked_end)
+                if start >= end:
+                    break
+            else:
+                windows.append((start, end))
+            if len(windows) >= count:
+                break
+        return windows[:count]
+
+
+# Queries.
+
+
+def is_available(artist_id, when):
+    """ Returns True when a range or a weekly rule of the artist covers when
+
+    A single statement of two EXISTS probes, each served by an index
+    leading on artist_id.
+    """
+    in_range = (select(Availability.id)
+                .where(Availability.artist_id == artist_id,
+                       Availability.start_time <= when,
+                       Availability.end_time >= when)
+                .exists())
+    in_rule = (select(AvailabilityRule.id)
+               .where(AvailabilityRule.artist_id == artist_id,
+                      AvailabilityRule.weekday == when.weekday(),
+                      AvailabilityRule.start_time <= when.time(),
+                      AvailabilityRule.end_time >= when.time(),
+                      AvailabilityRule.valid_from <= when.date(),
+                      or_(AvailabilityRule.valid_until.is_(None),
+                          AvailabilityRule.valid_until >= when.date()))
+               .exists())
+    return db.session.execute(select(or_(in_range, in_rule))).scalar()
+
+
+def availability_labels(artist_id, now=None):
+    """ Returns display strings for the artist's future availability
+
+    One-off ranges are formatted by the database, weekly rules follow.
+    """
+    now = now or datetime.now()
+    end_format = case(
+        (func.date(Availability.end_time) == func.date(Availability.start_time), 'HH24:MI'),
+        else_='YYYY-MM-DD, HH24:MI')
+    label = func.concat(
+        func.to_char(Availability.start_time, 'YYYY-MM-DD, HH24:MI'),
+        case((Availability.end_time > Availability.start_time,
+              func.concat(' - ', func.to_char(Availability.end_time, end_format))),
+             else_=''))
+    labels = db.session.execute(
+        select(label)
+        .where(Availability.artist_id == artist_id,
+               Availability.end_time > now)
+        .order_by(Availability.start_time)).scalars().all()
+
+    rules = db.session.execute(
+        select(AvailabilityRule.weekday, AvailabilityRule.start_time,
+               AvailabilityRule.end_time, AvailabilityRule.valid_from)
+        .where(AvailabilityRule.artist_id == artist_id,
+               or_(AvailabilityRule.valid_until.is_(None),
+                   AvailabilityRule.valid_until >= now.date()))
+        .order_by(AvailabilityRule.weekday, AvailabilityRule.start_time))
+    for rule in rules:
+        hours = rule.start_time.strftime('%H:%M')
+        if rule.end_time > rule.start_time:
+            hours += ' - ' + rule.end_time.strftime('%H:%M')
+        labels.append(f'Every {calendar.day_name[rule.weekday]}, {hours}'
+                      f' (from {rule.valid_from.isoformat()})')
+    return labels
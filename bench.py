@@ -0,0 +1,229 @@
+"""
+Route-level benchmarks, run as `flask fyyur bench`
+
+For each dataset size the catalogue is regenerated with datagen, then
+every route is driven through the Flask test client. Per route the report
+holds throughput, p50/p99 latency, SQL statements per request and the
+peak memory allocated by one request, as JSON that can be diffed across
+commits.
+
+The catalogue tables are emptied first: point the app at a local
+benchmark database.
+"""
+# Imports
+
+import json
+import math
+import random
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sqlalchemy import event
+
+from datagen import clear_catalogue, generate
+from enums import Genre
+from models import db
+from pages import page_cache, recent_listings
+
+# Requests.
+
+
+class RequestFactory:
+    """ Builds request arguments with ids drawn from the generated dataset """
+
+    def __init__(self, dataset, seed=0):
+        self.dataset = dataset
+        self.random = random.Random(seed)
+        self.serial = 0
+
+    def artist_id(self):
+        return self.random.randint(1, self.dataset['artists'])
+
+    def venue_id(self):
+        return self.random.randint(1, self.dataset['venues'])
+
+    def genre(self):
+        return self.random.choice(list(Genre.__members__))
+
+    def start_time(self):
+        return (datetime.now() + timedelta(days=self.random.randrange(1, 365),
+                                           hours=self.random.randrange(24))
+                ).replace(minute=0, second=0, microsecond=0)
+
+    def artist_form(self):
+        self.serial += 1
+        return {'name': f'Bench Artist {self.serial}', 'city': 'San Francisco',
+                'state': 'CA', 'phone': '415-555-0100', 'genres': ['Jazz', 'Blues'],
+                'facebook_link': 'https://www.facebook.com/bench',
+                'seeking_venue': 'y', 'seeking_description': 'Benchmark'}
+
+    def venue_form(self):
+        self.serial += 1
+        return {'name': f'Bench Venue {self.serial}', 'city': 'San Francisco',
+                'state': 'CA', 'address': '1 Bench St', 'phone': '415-555-0100',
+                'genres': ['Jazz'], 'facebook_link': 'https://www.facebook.com/bench'}
+
+
+# name: (method, path, request kwargs); path and kwargs may be callables
+# of the RequestFactory.
+ROUTES = {
+    'index': ('GET', '/', None),
+    'artists': ('GET', '/artists', None),
+    'venues': ('GET', '/venues', None),
+    'venues_page': ('GET', lambda f: f'/venues?page={f.random.randint(1, 5)}', None),
+    'shows': ('GET', '/shows', None),
+    'shows_upcoming': ('GET', '/shows?when=upcoming', None),
+    'shows_past': ('GET', '/shows?when=past', None),
+    'show_artist': ('GET', lambda f: f'/artists/{f.artist_id()}', None),
+    'show_venue': ('GET', lambda f: f'/venues/{f.venue_id()}', None),
+    'free_windows': ('GET', lambda f: f'/artists/{f.artist_id()}/free_windows?n=10', None),
+    'search_suggest': ('GET', lambda f: f'/search/suggest?q=Artist {f.random.randint(1, 99)}', None),
+    'search_artists': ('POST', '/artists/search',
+                       lambda f: {'data': {'search_term': f'Artist {f.random.randint(1, 999)}'}}),
+    'search_venues': ('POST', '/venues/search',
+                      lambda f: {'data': {'search_term': f'Venue {f.random.randint(1, 999)}'}}),
+    'search_city': ('POST', '/search', {'data': {'city': 'CA City 1', 'state': 'CA'}}),
+    'create_artist_form': ('GET', '/artists/create', None),
+    'create_artist': ('POST', '/artists/create', lambda f: {'data': f.artist_form()}),
+    'edit_artist_form': ('GET', lambda f: f'/artists/{f.artist_id()}/edit', None),
+    'edit_artist': ('POST', lambda f: f'/artists/{f.artist_id()}/edit',
+                    lambda f: {'data': f.artist_form()}),
+    'create_venue_form': ('GET', '/venues/create', None),
+    'create_venue': ('POST', '/venues/create', lambda f: {'data': f.venue_form()}),
+    'edit_venue_form': ('GET', lambda f: f'/venues/{f.venue_id()}/edit', None),
+    'edit_venue': ('POST', lambda f: f'/venues/{f.venue_id()}/edit',
+                   lambda f: {'data': f.venue_form()}),
+    'create_show_form': ('GET', '/shows/create', None),
+    'create_show': ('POST', '/shows/create',
+                    lambda f: {'data': {'artist_id': f.artist_id(), 'venue_id': f.venue_id(),
+                                        'start_time': f.start_time().strftime('%Y-%m-%d %H:%M:%S')}}),
+    'create_shows_batch': ('POST', '/shows/batch',
+                           lambda f: {'json': [{'artist_id': f.artist_id(), 'venue_id': f.venue_id(),
+                                                'start_time': f.start_time().isoformat()}
+                                               for _ in range(20)]}),
+    'set_availability_form': ('GET', lambda f: f'/artists/{f.artist_id()}/set_availability', None),
+    'set_availability': ('POST', lambda f: f'/artists/{f.artist_id()}/set_availability',
+                         lambda f: {'data': {'entries-0-date': f.start_time().strftime('%Y-%m-%d'),
+                                             'entries-0-start_time': '18:00',
+                                             'entries-0-end_time': '23:00',
+                                             'entries-0-repeat_weekly': 'y'}}),
+    'export_shows': ('GET', '/export/shows.ndjson',
+                     {'headers': {'Authorization': 'Bearer bench'}}),
+    'api_artists': ('GET', '/api/v1/artists', None),
+    'api_artist': ('GET', lambda f: f'/api/v1/artists/{f.artist_id()}', None),
+    'api_shows': ('GET', '/api/v1/shows?when=upcoming', None),
+    'api_browse': ('GET', lambda f: f'/api/v1/venues/browse?genre={f.genre()}&seeking=true', None),
+    'api_matches': ('GET', lambda f: f'/api/v1/venues/{f.venue_id()}/matches?limit=10', None),
+    'metrics': ('GET', '/metrics', None),
+    'cache_stats': ('GET', '/cache/stats', None),
+}
+
+
+def build(route, factory):
+    """ Returns (method, path, kwargs) for one request to route """
+    method, path, kwargs = ROUTES[route]
+    if callable(path):
+        path = path(factory)
+    if callable(kwargs):
+        kwargs = kwargs(factory)
+    return method, path, dict(kwargs or {})
+
+
+# Measurement.
+
+
+def percentile(sorted_values, fraction):
+    """ Returns the nearest-rank percentile of an ascending list """
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+def measure(client, route, factory, requests):
+    """ Sends requests to route, returns its throughput, latency and SQL stats """
+    statements = [0]
+
+    def before_cursor_execute(*args):
+        statements[0] += 1
+
+    latencies, queries, statuses = [], [], {}
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        for _ in range(requests):
+            method, path, kwargs = build(route, factory)
+            statements[0] = 0
+            started = time.perf_counter()
+            response = client.open(path, method=method, **kwargs)
+            response.get_data()
+            response.close()
+            latencies.append(time.perf_counter() - started)
+            queries.append(statements[0])
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+        method, path, kwargs = build(route, factory)
+        tracemalloc.start()
+        response = client.open(path, method=method, **kwargs)
+        response.get_data()
+        response.close()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+    latencies.sort()
+    return {
+        'requests': requests,
+        'throughput_rps': round(requests / sum(latencies), 1),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'sql_mean': round(sum(queries) / requests, 2),
+        'sql_max': max(queries),
+        'peak_memory_kb': round(peak / 1024, 1),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+def dataset_for(artists):
+    """ Returns the row counts generated for a size given in artists """
+    return {'artists': artists, 'venues': max(1, artists // 4),
+            'shows': artists * 5, 'slots': artists * 2}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(app, sizes, requests=50, routes=None, seed=0, report=print):
+    """ Benchmarks routes at every size, returns the JSON-able results """
+    app.config.update(WTF_CSRF_ENABLED=False, EXPORT_TOKEN='bench')
+    client = app.test_client()
+    results = {'commit': git_commit(), 'seed': seed, 'requests': requests, 'runs': []}
+
+    for artists in sizes:
+        dataset = dataset_for(artists)
+        started = time.perf_counter()
+        clear_catalogue()
+        generate(seed=seed, **dataset)
+        db.session.remove()
+        page_cache.clear()
+        recent_listings.expire()
+        report(f"{artists} artists: generated in {time.perf_counter() - started:.1f}s")
+
+        factory = RequestFactory(dataset, seed)
+        run_routes = {}
+        for route in routes or ROUTES:
+            run_routes[route] = measure(client, route, factory, requests)
+            report(f"  {route}: {run_routes[route]['p50_ms']}ms p50, "
+                   f"{run_routes[route]['sql_mean']} statements")
+        results['runs'].append({'dataset': dataset, 'routes': run_routes})
+    return results
+
+
+def write(results, handle):
+    json.dump(results, handle, indent=2)
+    handle.write('\n')
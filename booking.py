@@ -0,0 +1,235 @@
+"""
+Show booking rules
+
+A show takes SHOW_DURATION_MINUTES from its start. Double bookings are
+rejected by the database, no matter how many workers insert at once:
+exclusion constraints refuse a show overlapping another of the same venue
+or artist, and where btree_gist is not installed unique constraints at
+least refuse the same start time. This module turns the resulting
+IntegrityError into a message for the user, and books batches of shows
+with a handful of set-based queries, checking overlaps up front.
+"""
+# Imports
+
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import (Date, DateTime, Integer, Time, and_, cast, column, extract,
+                        insert, or_, select, values)
+from sqlalchemy.exc import IntegrityError
+
+import changelog
+from counters import count_shows
+from models import db, Artist, Availability, AvailabilityRule, Venue, Show
+
+# Conflicts.
+
+CONFLICT_MESSAGES = {
+    'uq_shows_venue_start': 'The venue already has a show at that time.',
+    'uq_shows_artist_start': 'The artist already has a show at that time.',
+    'ex_shows_venue_overlap': 'The venue already has a show at that time.',
+    'ex_shows_artist_overlap': 'The artist already has a show at that time.',
+    'shows_venue_id_fkey': 'There is no venue with that ID.',
+    'shows_artist_id_fkey': 'There is no artist with that ID.',
+}
+
+
+def constraint_name(error):
+    """ Returns the name of the constraint an IntegrityError violated """
+    diag = getattr(getattr(error, 'orig', None), 'diag', None)
+    return getattr(diag, 'constraint_name', None)
+
+
+def booking_conflict(error):
+    """ Returns the user message for a rejected show insert, or None """
+    if not isinstance(error, IntegrityError):
+        return None
+    return CONFLICT_MESSAGES.get(constraint_name(error))
+
+
+# Batch scheduling.
+
+
+class BookingRace(Exception):
+    """ A slot was booked concurrently; the batch was rolled back """
+
+
+def parse_entry(entry):
+    """ Returns (artist_id, venue_id, start_time) from one batch entry
+
+    Raises ValueError when a field is missing or malformed. Show times
+    are naive local times, so a start_time with a UTC offset is malformed.
+    """
+    if not isinstance(entry, dict):
+        raise ValueError('expected an object with artist_id, venue_id and start_time')
+    try:
+        start_time = datetime.fromisoformat(str(entry['start_time']))
+        row = int(entry['artist_id']), int(entry['venue_id']), start_time
+    except KeyError as e:
+        raise ValueError(f'missing field {e}') from e
+    except TypeError as e:
+        raise ValueError(str(e)) from e
+    if start_time.tzinfo is not None:
+        raise ValueError('start_time must be a local time without a UTC offset')
+    return row
+
+
+def available_candidates(candidates):
+    """ Returns the indexes of candidates the artist is available for
+
+    candidates is a list of (index, artist_id, start_time). One statement
+    joins them, as a VALUES list, against availability ranges and rules.
+    """
+    rows = values(column('idx', Integer), column('artist_id', Integer),
+                  column('start_time', DateTime), name='candidates').data(candidates)
+    in_range = (select(Availability.id)
+                .where(Availability.artist_id == rows.c.artist_id,
+                       Availability.start_time <= rows.c.start_time,
+                       Availability.end_time >= rows.c.start_time)
+                .exists())
+    day = cast(rows.c.start_time, Date)
+    time_of_day = cast(rows.c.start_time, Time)
+    in_rule = (select(AvailabilityRule.id)
+               .where(AvailabilityRule.artist_id == rows.c.artist_id,
+                      AvailabilityRule.weekday == extract('isodow', rows.c.start_time) - 1,
+                      AvailabilityRule.start_time <= time_of_day,
+                      AvailabilityRule.end_time >= time_of_day,
+                      AvailabilityRule.valid_from <= day,
+                      or_(AvailabilityRule.valid_until.is_(None),
+                          AvailabilityRule.valid_until >= day))
+               .exists())
+    return set(db.session.execute(
+        select(rows.c.idx).where(or_(in_range, in_rule))).scalars())
+
+
+class Slots:
+    """ Start times of the shows of each venue or artist
+
+    (id, start) in slots is true when a show starting then would overlap
+    one of them, each taking duration. Starts are kept sorted, so only the
+    two neighbours of start are compared.
+    """
+
+    def __init__(self, duration):
+        self.duration = duration
+        self.starts = {}
+
+    def add(self, slot):
+        owner, start = slot
+        insort(self.starts.setdefault(owner, []), start)
+
+    def __contains__(self, slot):
+        owner, start = slot
+        starts = self.starts.get(owner, ())
+        position = bisect_left(starts, start)
+        return any(abs(start - other) < self.duration
+                   for other in starts[max(position - 1, 0):position + 1])
+
+
+def booked_slots(rows):
+    """ Returns the venue and artist Slots of the shows overlapping rows
+
+    rows are (artist_id, venue_id, start_time). One statement joins them,
+    as a VALUES list, against the shows of the same venue or artist.
+    """
+    duration = timedelta(minutes=current_app.config['SHOW_DURATION_MINUTES'])
+    venues, artists = Slots(duration), Slots(duration)
+    rows = list(rows)
+    if not rows:
+        return venues, artists
+
+    wanted = values(column('artist_id', Integer), column('venue_id', Integer),
+                    column('start_time', DateTime), name='wanted').data(rows)
+    near = and_(Show.start_time > wanted.c.start_time - duration,
+                Show.start_time < wanted.c.start_time + duration)
+    taken = db.session.execute(
+        select(Show.artist_id, Show.venue_id, Show.start_time).distinct()
+        .join(wanted, or_(and_(Show.venue_id == wanted.c.venue_id, near),
+                          and_(Show.artist_id == wanted.c.artist_id, near))))
+
+    for artist_id, venue_id, start in taken:
+        venues.add((venue_id, start))
+        artists.add((artist_id, start))
+    return venues, artists
+
+
+def schedule_shows(entries):
+    """ Validates and books a list of shows in one transaction
+
+    Every entry gets a result: created (with the new id), invalid,
+    unavailable or conflict. Valid entries are inserted with a single
+    multi-row INSERT. When a concurrent booking takes a slot between the
+    checks and the insert, nothing is inserted and BookingRace is raised.
+    """
+    results = [None] * len(entries)
+    parsed = {}
+    for index, entry in enumerate(entries):
+        try:
+            parsed[index] = parse_entry(entry)
+        except ValueError as e:
+            results[index] = {'index': index, 'status': 'invalid', 'error': str(e)}
+
+    artist_ids = {artist_id for artist_id, _, _ in parsed.values()}
+    venue_ids = {venue_id for _, venue_id, _ in parsed.values()}
+    known_artists = set(db.session.execute(
+        select(Artist.id).where(Artist.id.in_(artist_ids))).scalars())
+    known_venues = set(db.session.execute(
+        select(Venue.id).where(Venue.id.in_(venue_ids))).scalars())
+
+    for index, (artist_id, venue_id, _) in list(parsed.items()):
+        error = None
+        if artist_id not in known_artists:
+            error = CONFLICT_MESSAGES['shows_artist_id_fkey']
+        elif venue_id not in known_venues:
+            error = CONFLICT_MESSAGES['shows_venue_id_fkey']
+        if error:
+            results[index] = {'index': index, 'status': 'invalid', 'error': error}
+            del parsed[index]
+
+    if parsed:
+        # Slots are kept to the minute, like the availability form.
+        available = available_candidates([
+            (index, artist_id, start.replace(second=0, microsecond=0))
+            for index, (artist_id, _, start) in parsed.items()])
+        taken_venues, taken_artists = booked_slots(parsed.values())
+    else:
+        available = set()
+        taken_venues, taken_artists = booked_slots(())
+
+    accepted = []
+    for index, (artist_id, venue_id, start) in parsed.items():
+        status, error = 'created', None
+        if index not in available:
+            status, error = 'unavailable', 'The artist is not available at that time.'
+        elif (venue_id, start) in taken_venues:
+            status, error = 'conflict', CONFLICT_MESSAGES['uq_shows_venue_start']
+        elif (artist_id, start) in taken_artists:
+            status, error = 'conflict', CONFLICT_MESSAGES['uq_shows_artist_start']
+
+        if error:
+            results[index] = {'index': index, 'status': status, 'error': error}
+            continue
+
+        # Later entries of the same batch see this slot as taken.
+        taken_venues.add((venue_id, start))
+        taken_artists.add((artist_id, start))
+        accepted.append(index)
+        results[index] = {'index': index, 'status': status}
+
+    if accepted:
+        try:
+            ids = db.session.execute(
+                insert(Show).returning(Show.id, sort_by_parameter_order=True),
+                [{'artist_id': parsed[index][0], 'venue_id': parsed[index][1],
+                  'start_time': parsed[index][2]} for index in accepted]).scalars().all()
+            count_shows(parsed[index] for index in accepted)
+            changelog.record('shows', 'insert', ids)
+            db.session.commit()
+        except IntegrityError as e:
+            db.session.rollback()
+            raise BookingRace(booking_conflict(e)) from e
+        for index, show_id in zip(accepted, ids):
+            results[index]['id'] = show_id
+
+    return results
@@ -0,0 +1,460 @@
+"""
+Read-through cache for detail page view models
+
+Entries are plain JSON-able dicts keyed by entity, e.g. 'v2:artist:4'. The
+view model is cached rather than the HTML, so flash messages and the
+rest of the layout stay per request.
+
+Backends share one interface, get(key), set(key, value, ttl),
+delete(*keys) and clear():
+    LocalCache   in-process LRU with per-entry TTL, the default
+    SharedCache  any redis-style client, so every worker sees the same
+                 entries and invalidations; used when CACHE_URL is set
+
+Every gunicorn worker has its own LocalCache, so PageCache broadcasts its
+deletes with Postgres NOTIFY and each process drops the keys it is told
+about. A process serves nothing from its LocalCache unless it is
+listening: entries it holds when it starts or resumes listening are
+dropped, as invalidations may have been missed meanwhile.
+
+A build can read the database before a write commits and finish after
+the write's invalidation. PageCache keeps a generation per key, bumped
+by every delete, local or broadcast; read_through() stores a build only
+if the generation it started under is still current.
+
+Fragment keeps one pre-rendered piece of HTML that has no per-request
+content, such as the home page listings, and refreshes it in the
+background.
+"""
+# Imports
+
+import itertools
+import json
+import logging
+import os
+import select
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy import func
+
+# Backends.
+
+
+class LocalCache:
+    """ Thread-safe LRU cache whose entries also expire after their TTL """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class SharedCache:
+    """ Stores JSON-encoded entries in a redis-style client """
+
+    def __init__(self, client, prefix='fyyur:'):
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return None if value is None else json.loads(value)
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, json.dumps(value), ex=max(1, int(ttl)))
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*(self.prefix + key for key in keys))
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+def make_cache(config):
+    """ Returns the backend configured by CACHE_URL, LocalCache when unset """
+    url = config.get('CACHE_URL')
+    if not url:
+        return LocalCache(config.get('CACHE_MAX_ENTRIES', 1024))
+    try:
+        import redis
+    except ImportError:
+        raise RuntimeError('CACHE_URL is set but the redis package is not installed.')
+    return SharedCache(redis.Redis.from_url(url))
+
+
+class Broadcast:
+    """ Deletes keys from the PageCache of every process, through Postgres NOTIFY
+
+    Each process listens on its own connection, from a thread started on
+    first use so that forked workers start theirs. Received keys go to
+    cache.forget(), which leaves them unpublished.
+    """
+    CHANNEL = 'fyyur_cache'
+    RETRY_SECONDS = 1
+
+    def __init__(self, engine, cache):
+        self.engine = engine
+        self.cache = cache
+        self.listening = False
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """ Starts this process's listener unless it runs already """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.listening = False
+        threading.Thread(target=self._listen, daemon=True).start()
+
+    def publish(self, keys):
+        with self.engine.begin() as connection:
+            connection.execute(func.pg_notify(self.CHANNEL, '\n'.join(keys)).select())
+
+    def _listen(self):
+        while True:
+            try:
+                pooled = self.engine.raw_connection()
+                connection = pooled.driver_connection
+                # Held for good, outside the pool.
+                pooled.detach()
+                try:
+                    self._receive(connection)
+                finally:
+                    self.listening = False
+                    connection.close()
+            except Exception:
+                logging.getLogger(__name__).exception('Cache invalidations are not received.')
+            time.sleep(self.RETRY_SECONDS)
+
+    def _receive(self, connection):
+        connection.autocommit = True
+        connection.cursor().execute(f'LISTEN {self.CHANNEL}')
+        self.cache.clear()
+        self.listening = True
+        while True:
+            if select.select([connection], [], [], 60) == ([], [], []):
+                # Also notices a dropped connection while idle.
+                connection.cursor().execute('SELECT 1')
+                continue
+            connection.poll()
+            while connection.notifies:
+                self.cache.forget(*connection.notifies.pop(0).payload.split('\n'))
+
+
+class PageCache:
+    """ The backend chosen by make_cache() once init_app() has seen the config
+
+    Keys dropped recently are given a new generation. Keys it no longer
+    remembers share the floor, which moves past every generation handed
+    out whenever one is forgotten, so a build never outlives a delete
+    unnoticed.
+    """
+    MAX_GENERATIONS = 4096
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.broadcast = None
+        self._counter = itertools.count(1)
+        self._generations = OrderedDict()
+        self._floor = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.backend = make_cache(app.config)
+        self.broadcast = None
+        if isinstance(self.backend, LocalCache) and app.config.get('CACHE_BROADCAST', True):
+            with app.app_context():
+                engine = app.extensions['sqlalchemy'].engine
+            self.broadcast = Broadcast(engine, self)
+
+    def get(self, key):
+        if self.broadcast is not None:
+            self.broadcast.start()
+            if not self.broadcast.listening:
+                return None
+        return self.backend.get(key)
+
+    def generation(self, key):
+        """ Returns the generation of key, to pass to set() after a build """
+        with self._lock:
+            return self._generations.get(key, self._floor)
+
+    def set(self, key, value, ttl, generation=None):
+        """ Stores value, unless key was deleted since generation was read """
+        if self.broadcast is not None and not self.broadcast.listening:
+            return
+        with self._lock:
+            if generation is None or generation == self._generations.get(key, self._floor):
+                self.backend.set(key, value, ttl)
+
+    def delete(self, *keys):
+        """ Deletes keys here and, through the broadcast, in every other process
+
+        Callers delete after their write has committed, so a failed
+        broadcast is logged rather than raised: other processes then serve
+        the old pages until they expire.
+        """
+        self.forget(*keys)
+        if self.broadcast is not None and keys:
+            try:
+                self.broadcast.publish(keys)
+            except Exception:
+                logging.getLogger(__name__).exception('Could not broadcast the deletion of %s',
+                                                      ', '.join(keys))
+
+    def forget(self, *keys):
+        """ Deletes keys in this process only """
+        with self._lock:
+            for key in keys:
+                self._generations[key] = next(self._counter)
+                self._generations.move_to_end(key)
+            while len(self._generations) > self.MAX_GENERATIONS:
+                self._generations.popitem(last=False)
+                self._floor = next(self._counter)
+            self.backend.delete(*keys)
+
+    def clear(self):
+        with self._lock:
+            self._generations.clear()
+            self._floor = next(self._counter)
+            self.backend.clear()
+
+
+# Detail pages.
+
+
+# Bumped whenever the cached view models change shape, so a shared cache
+# never hands entries written by the previous release to the new one.
+DETAIL_VERSION = 2
+
+
+def detail_key(kind, entity_id):
+    """ Returns the cache key of the artist or venue detail page """
+    return f'v{DETAIL_VERSION}:{kind}:{entity_id}'
+
+
+def expires_in(max_ttl, next_change, now=None):
+    """ Returns the TTL capped at next_change, when the page goes stale
+
+    next_change is the next upcoming show's start, after which that show
+    belongs under past shows. Returns 0 when it has already passed.
+    """
+    if next_change is None:
+        return max_ttl
+    now = now or datetime.now()
+    return max(0, min(max_ttl, (next_change - now).total_seconds()))
+
+
+class _Flight:
+    """ One build of a key, which concurrent callers wait for """
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+_flights = {}
+_flights_lock = threading.Lock()
+_refreshing = set()
+
+
+def single_flight(key, build):
+    """ Returns build(), run once in this process for concurrent callers of key
+
+    Callers arriving while it runs wait and share its result or exception.
+    key may be any hashable, e.g. a cache key and its generation.
+    """
+    with _flights_lock:
+        flight = _flights.get(key)
+        leader = flight is None
+        if leader:
+            flight = _flights[key] = _Flight()
+    if leader:
+        try:
+            flight.value = build()
+        except Exception as e:
+            flight.error = e
+        finally:
+            with _flights_lock:
+                del _flights[key]
+            flight.done.set()
+    else:
+        flight.done.wait()
+    if flight.error is not None:
+        raise flight.error
+    return flight.value
+
+
+def read_through(cache, key, build, max_ttl):
+    """ Returns the cached value of key, building and storing it on a miss
+
+    build returns (value, next_change). cache is a PageCache. Concurrent
+    misses of a key share a single build, unless the key is deleted
+    meanwhile: the build is then neither stored nor joined by later misses.
+    """
+    def build_and_store():
+        value, next_change = build()
+        ttl = expires_in(max_ttl, next_change)
+        if ttl > 0:
+            cache.set(key, value, ttl, generation)
+        return value
+
+    value = cache.get(key)
+    if value is None:
+        generation = cache.generation(key)
+        value = single_flight((key, generation), build_and_store)
+    return value
+
+
+# Entries of read_refreshing() outlive max_age by this factor, serving stale.
+STALE_FACTOR = 10
+
+
+def read_refreshing(app, cache, key, build, max_age):
+    """ Returns the cached value of key, rebuilt in the background once max_age old
+
+    Stale-while-revalidate, like Fragment: a stale entry is served while
+    one thread of this process rebuilds it in an app context of app. Only
+    a missing entry is built inline, once however many requests want it.
+    build returns the value. Deletes are honoured as by read_through().
+    """
+    def build_and_store(generation):
+        entry = {'value': build(), 'built_at': time.time()}
+        cache.set(key, entry, max_age * STALE_FACTOR, generation)
+        return entry
+
+    def build_once():
+        generation = cache.generation(key)
+        return single_flight((key, generation), lambda: build_and_store(generation))
+
+    def refresh():
+        try:
+            with app.app_context():
+                build_once()
+        except Exception:
+            app.logger.exception('Could not refresh %s', key)
+        finally:
+            with _flights_lock:
+                _refreshing.discard(key)
+
+    entry = cache.get(key)
+    if entry is None:
+        return build_once()['value']
+    if time.time() - entry['built_at'] > max_age:
+        with _flights_lock:
+            start = key not in _refreshing
+            _refreshing.add(key)
+        if start:
+            threading.Thread(target=refresh, daemon=True).start()
+    return entry['value']
+
+
+def invalidate(cache, artists=(), venues=()):
+    """ Drops the detail pages of the given artist and venue ids """
+    cache.delete(*[detail_key('artist', artist_id) for artist_id in set(artists)],
+                 *[detail_key('venue', venue_id) for venue_id in set(venues)])
+
+
+# Fragments.
+
+
+class Fragment:
+    """ A pre-rendered fragment refreshed in the background
+
+    Stale-while-revalidate: once the fragment is older than max_age, or
+    has been expired by a write, requests keep getting the last rendering
+    while a single background thread renders the next one. Only the first
+    request after start-up renders inline. render(app) is given the app so
+    the background thread can push its own app context.
+    """
+
+    def __init__(self, render, max_age=60):
+        self.render = render
+        self.max_age = max_age
+        self.value = None
+        self.rendered_at = 0
+        self.stats = {'hits': 0, 'misses': 0, 'refreshes': 0, 'errors': 0}
+        self._refreshing = False
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, app):
+        """ Returns the rendered fragment, scheduling a refresh when stale """
+        with self._lock:
+            value = self.value
+            stale = time.monotonic() - self.rendered_at > self.max_age
+            if value is None:
+                self.stats['misses'] += 1
+            else:
+                self.stats['hits'] += 1
+                if stale and not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._refresh, args=(app,), daemon=True).start()
+        if value is None:
+            generation = self._generation
+            value = self._store(self.render(app), generation)
+        return value
+
+    def expire(self):
+        """ Marks the fragment stale, the next request triggers a refresh """
+        with self._lock:
+            self._generation += 1
+            self.rendered_at = 0
+
+    def _store(self, value, generation):
+        with self._lock:
+            self.value = value
+            # A rendering started before an expire() is kept but stays stale.
+            if generation == self._generation:
+                self.rendered_at = time.monotonic()
+        return value
+
+    def _refresh(self, app):
+        generation = self._generation
+        try:
+            self._store(self.render(app), generation)
+            self.stats['refreshes'] += 1
+        except Exception:
+            # The stale rendering keeps being served, the next request retries.
+            self.stats['errors'] += 1
+        finally:
+            self._refreshing = False
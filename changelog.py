@@ -0,0 +1,248 @@
+"""
+Change log behind the change feed, /api/v1/changes and `flask fyyur changes`
+
+Every insert, update and delete of an artist, venue or show appends a row
+to the changes table in the transaction that makes it: ORM flushes through
+the after_flush hook below, bulk inserts by calling record(). A client
+keeps the cursor of the last page it read and only fetches what changed
+since. Entries carry the row as it is now, the feed says what changed and
+not how, so applying them again is harmless.
+
+Positions are (txid, id), txid being the writing transaction. A page only
+holds transactions below the xmin of the reader's snapshot, which have all
+finished, so one committing late can never land behind a cursor already
+handed out.
+
+Compaction drops changes superseded by a later change of the same row once
+they are CHANGELOG_COMPACT_AFTER seconds old, then delete tombstones older
+than CHANGELOG_TOMBSTONE_TTL. Cursors from before the newest dropped
+tombstone are refused with CursorExpired; such a client starts over from
+snapshot(), whose first line is the cursor to follow the feed from.
+Deleting an artist or venue through the ORM cascades to its shows, which
+are flushed as deletes too and get tombstones of their own.
+"""
+# Imports
+
+import base64
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, event, exists, func, insert, literal_column, select, text, tuple_
+
+from models import db, Artist, Change, ChangeLogState, Venue, Show
+from queries import ARTIST_COLUMNS, VENUE_COLUMNS
+from replicas import RoutingSession, primary_only
+from views import ArtistView, ShowSummary, VenueView
+
+KINDS = {Artist: 'artists', Venue: 'venues', Show: 'shows'}
+
+SHOW_COLUMNS = (Show.id, Show.start_time, Show.artist_id, Show.venue_id)
+
+# kind: (view, columns of the data sent with a change)
+DATA = {
+    'artists': (ArtistView, ARTIST_COLUMNS),
+    'venues': (VenueView, VENUE_COLUMNS),
+    'shows': (ShowSummary, SHOW_COLUMNS),
+}
+
+# Every transaction below it has committed or aborted.
+HORIZON = literal_column('pg_snapshot_xmin(pg_current_snapshot())::text::bigint')
+
+COMPACT_LOCK = 0x66797572
+
+
+class CursorExpired(Exception):
+    """ The cursor is older than the log, the client must take a snapshot """
+
+
+# Recording.
+
+
+def record(kind, op, ids):
+    """ Appends a change of each id to the log, in the current transaction """
+    rows = [{'kind': kind, 'entity_id': entity_id, 'op': op} for entity_id in ids]
+    if rows:
+        db.session.connection().execute(insert(Change.__table__), rows)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _record_flush(session, flush_context):
+    rows = []
+    for op, instances in (('insert', session.new), ('update', session.dirty),
+                          ('delete', session.deleted)):
+        for instance in instances:
+            kind = KINDS.get(type(instance))
+            if kind is None:
+                continue
+            if op == 'update' and not session.is_modified(instance, include_collections=False):
+                continue
+            rows.append({'kind': kind, 'entity_id': instance.id, 'op': op})
+    if rows:
+        # Not session.execute(), which must not run inside a flush.
+        session.connection().execute(insert(Change.__table__), rows)
+
+
+def reset():
+    """ Empties the log and expires every cursor, for when the catalogue is replaced """
+    db.session.execute(text('TRUNCATE changes RESTART IDENTITY'))
+    db.session.execute(ChangeLogState.__table__.update().values(
+        expired_txid=literal_column('pg_current_xact_id()::text::bigint'), expired_id=0))
+
+
+# Cursors.
+
+
+def encode_position(txid, change_id):
+    return base64.urlsafe_b64encode(f'{txid}.{change_id}'.encode()).decode().rstrip('=')
+
+
+def decode_position(cursor):
+    """ Returns (txid, id) of a cursor; ValueError when it is not one """
+    try:
+        txid, change_id = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)) \
+            .decode().split('.')
+        return int(txid), int(change_id)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f'{cursor!r} is not a change feed cursor')
+
+
+# Reading.
+
+
+def _current(kind, ids):
+    """ Returns {id: data} of the rows of kind that still exist """
+    view, columns = DATA[kind]
+    fields = [column.key for column in columns]
+    rows = db.session.execute(select(*columns).where(columns[0].in_(ids)))
+    return {row.id: view.from_row(row).to_dict(fields) for row in rows}
+
+
+def read(cursor=None, limit=100):
+    """ Returns (entries, next cursor, has_more) of the changes after cursor
+
+    A row changed several times within the page is listed once, at its
+    last change. Without a cursor the log is read from its start.
+    """
+    after = decode_position(cursor) if cursor else (0, 0)
+    changes = db.session.execute(
+        select(Change.txid, Change.id, Change.kind, Change.entity_id, Change.op,
+               Change.changed_at)
+        .where(tuple_(Change.txid, Change.id) > tuple_(*after), Change.txid < HORIZON)
+        .order_by(Change.txid, Change.id)
+        .limit(limit + 1)).all()
+    # Read after the page, so a compaction in between is noticed.
+    state = db.session.execute(
+        select(ChangeLogState.expired_txid, ChangeLogState.expired_id)).one()
+    if after < tuple(state):
+        raise CursorExpired(cursor)
+
+    changes, has_more = changes[:limit], len(changes) > limit
+    latest = {}
+    for change in changes:
+        latest.pop((change.kind, change.entity_id), None)
+        latest[change.kind, change.entity_id] = change
+
+    current = {}
+    for kind in DATA:
+        ids = [entity_id for entity_kind, entity_id in latest if entity_kind == kind]
+        if ids:
+            current[kind] = _current(kind, ids)
+
+    entries = []
+    for (kind, entity_id), change in latest.items():
+        data = current[kind].get(entity_id)
+        entries.append({'kind': kind, 'id': entity_id,
+                        'op': 'delete' if data is None else change.op,
+                        'changed_at': change.changed_at.isoformat(), 'data': data})
+    next_cursor = encode_position(changes[-1].txid, changes[-1].id) if changes else cursor
+    return entries, next_cursor or encode_position(*after), has_more
+
+
+def snapshot(chunk_size=1000):
+    """ Yields the feed cursor, then every artist, venue and show, from one snapshot
+
+    The cursor is the snapshot's xmin: changes from there on may already
+    be in the snapshot, and are applied again.
+    """
+    engine = db.session.get_bind(clause=select(Change.id))
+    with engine.connect().execution_options(isolation_level='REPEATABLE READ') as connection:
+        txid = connection.execute(select(HORIZON)).scalar()
+        yield {'cursor': encode_position(txid, 0)}
+        for kind, (view, columns) in DATA.items():
+            fields = [column.key for column in columns]
+            result = connection.execution_options(yield_per=chunk_size).execute(
+                select(*columns).order_by(columns[0]))
+            for row in result:
+                yield {'kind': kind, 'data': view.from_row(row).to_dict(fields)}
+
+
+# Compaction.
+
+
+def compact(keep, tombstone_ttl, interval=0, now=None):
+    """ Compacts the log and commits, returns (superseded, expired) counts
+
+    keep and tombstone_ttl are in seconds. Returns None, doing nothing,
+    while another process compacts or when the last compaction is less
+    than interval seconds old.
+    """
+    now = now or datetime.now()
+    changes = Change.__table__
+    later = changes.alias('later')
+    with primary_only():
+        if not db.session.execute(select(func.pg_try_advisory_xact_lock(COMPACT_LOCK))).scalar():
+            db.session.rollback()
+            return None
+        state = db.session.get(ChangeLogState, 1)
+        if state.compacted_at and state.compacted_at > now - timedelta(seconds=interval):
+            db.session.rollback()
+            return None
+
+        superseded = db.session.execute(
+            delete(changes)
+            .where(changes.c.changed_at < now - timedelta(seconds=keep),
+                   exists().where(later.c.kind == changes.c.kind,
+                                  later.c.entity_id == changes.c.entity_id,
+                                  tuple_(later.c.txid, later.c.id)
+                                  > tuple_(changes.c.txid, changes.c.id)))).rowcount
+        expired = db.session.execute(
+            delete(changes)
+            .where(changes.c.op == 'delete',
+                   changes.c.changed_at < now - timedelta(seconds=tombstone_ttl))
+            .returning(changes.c.txid, changes.c.id)).all()
+        if expired:
+            state.expired_txid, state.expired_id = max(
+                (state.expired_txid, state.expired_id), *(tuple(row) for row in expired))
+        state.compacted_at = now
+        db.session.commit()
+    return superseded, len(expired)
+
+
+def compact_with(config, interval=0):
+    return compact(config['CHANGELOG_COMPACT_AFTER'], config['CHANGELOG_TOMBSTONE_TTL'],
+                   interval=interval)
+
+
+_compacting = threading.Lock()
+_next_compaction = 0
+
+
+def compact_soon(app):
+    """ Compacts in a background thread, at most every CHANGELOG_COMPACT_INTERVAL seconds """
+    global _next_compaction
+    interval = app.config['CHANGELOG_COMPACT_INTERVAL']
+    if time.monotonic() < _next_compaction or not _compacting.acquire(blocking=False):
+        return
+    _next_compaction = time.monotonic() + interval
+    threading.Thread(target=_compact, args=(app, interval), daemon=True).start()
+
+
+def _compact(app, interval):
+    try:
+        with app.app_context():
+            compact_with(app.config, interval)
+    except Exception:
+        app.logger.exception('Change log compaction failed.')
+    finally:
+        _compacting.release()
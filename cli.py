@@ -0,0 +1,244 @@
+"""
+Command line tools, available as `flask fyyur <command>`
+"""
+# Imports
+
+import json
+
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+
+import bench
+import changelog
+from counters import recount, rollover
+from exporter import ENCODERS, EXPORTS, export, export_watermark
+from importer import FORMATS, IMPORTERS, import_file
+import loadgen
+import matching
+from models import db
+from plans import run as check_plans
+
+fyyur_cli = AppGroup('fyyur', help='Fyyur maintenance commands.')
+
+# Import.
+
+
+@fyyur_cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(IMPORTERS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS),
+              help='Input format, guessed from the extension by default.')
+@click.option('--batch-size', default=1000, show_default=True,
+              help='Records written per transaction.')
+@click.option('--rejects', 'rejects_path', type=click.Path(dir_okay=False),
+              help='Where rejected records go, PATH.rejects.ndjson by default.')
+@click.option('--restart', is_flag=True,
+              help='Ignore an existing checkpoint and start from the top.')
+def import_command(kind, path, fmt, batch_size, rejects_path, restart):
+    """ Stream artists, venues or shows from a CSV or NDJSON file """
+    def progress(checkpoint):
+        click.echo(f'{checkpoint.imported} imported, {checkpoint.rejected} rejected, '
+                   f'{checkpoint.offset} bytes read')
+
+    try:
+        checkpoint = import_file(kind, path, fmt=fmt, batch_size=batch_size,
+                                 rejects_path=rejects_path, restart=restart,
+                                 progress=progress)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+
+    click.echo(f'Done: {checkpoint.imported} {kind} imported, '
+               f'{checkpoint.rejected} rejected.')
+
+
+# Show counters.
+
+
+@fyyur_cli.command('rollover')
+def rollover_command():
+    """ Move shows that have started from upcoming to past counters; run from cron """
+    moved = rollover()
+    db.session.commit()
+    click.echo(f'{moved} shows moved to past.')
+
+
+@fyyur_cli.command('recount')
+def recount_command():
+    """ Rebuild every artist and venue show counter from the shows table """
+    recount()
+    db.session.commit()
+    click.echo('Show counters rebuilt.')
+
+
+# Change feed.
+
+
+@fyyur_cli.command('changes')
+@click.option('--after', help='Cursor printed by the previous run; the start of the log by default.')
+@click.option('--limit', default=1000, show_default=True, help='Most changes read.')
+@click.option('--snapshot', is_flag=True,
+              help='Print every artist, venue and show instead, after the cursor to follow on with.')
+@click.option('--output', '-o', type=click.File('w'), default='-',
+              help='Where the NDJSON goes, stdout by default.')
+def changes_command(after, limit, snapshot, output):
+    """ Print changes to artists, venues and shows as NDJSON, then the next cursor """
+    if snapshot:
+        for line in changelog.snapshot():
+            output.write(json.dumps(line) + '\n')
+        return
+    try:
+        entries, cursor, has_more = changelog.read(after, limit)
+    except ValueError as e:
+        raise click.UsageError(str(e))
+    except changelog.CursorExpired:
+        raise click.ClickException('The cursor has expired, start over with --snapshot.')
+    for entry in entries:
+        output.write(json.dumps(entry) + '\n')
+    output.write(json.dumps({'cursor': cursor, 'has_more': has_more}) + '\n')
+
+
+@fyyur_cli.command('compact-changes')
+def compact_changes_command():
+    """ Drop superseded changes and expired tombstones from the change log """
+    counts = changelog.compact_with(current_app.config)
+    if counts is None:
+        click.echo('Another process is compacting the change log.')
+    else:
+        click.echo(f'{counts[0]} superseded changes and {counts[1]} tombstones dropped.')
+
+
+# Matchmaking.
+
+
+@fyyur_cli.command('rebuild-matches')
+def rebuild_matches_command():
+    """ Rebuild the matchmaking index from every seeking artist and venue """
+    postings = matching.rebuild()
+    db.session.commit()
+    click.echo(f'{postings} postings indexed.')
+
+
+@fyyur_cli.command('matches')
+@click.argument('kind', type=click.Choice(sorted(matching.MODELS)))
+@click.argument('entity_id', type=int)
+@click.option('--limit', '-n', default=10, show_default=True)
+def matches_command(kind, entity_id, limit):
+    """ Print the best matching venues of an artist, or artists of a venue """
+    matches = matching.top_matches(kind, entity_id, limit,
+                                   current_app.config['MATCH_HORIZON_DAYS'])
+    if matches is None:
+        raise click.ClickException(f'There is no {kind[:-1]} {entity_id}.')
+    for match in matches:
+        click.echo(f"{match['score']:.3f}  {match['id']:>6}  {match['name']} "
+                   f"({match['city']}, {match['state']})")
+
+
+# Export.
+
+DATETIME_FORMATS = ['%Y-%m-%d', '%Y-%m-%dT%H:%M:%S', '%Y-%m-%d %H:%M:%S',
+                    '%Y-%m-%dT%H:%M:%S.%f']
+
+
+@fyyur_cli.command('export')
+@click.argument('kind', type=click.Choice(sorted(EXPORTS)))
+@click.option('--format', 'fmt', type=click.Choice(sorted(ENCODERS)),
+              default='ndjson', show_default=True)
+@click.option('--since', type=click.DateTime(DATETIME_FORMATS),
+              help='Only rows created or updated at or after this time.')
+@click.option('--output', '-o', type=click.File('w'), default='-',
+              help='Output file, stdout by default.')
+@click.option('--chunk-size', default=1000, show_default=True,
+              help='Rows fetched from the server-side cursor at a time.')
+def export_command(kind, fmt, since, output, chunk_size):
+    """ Stream artists, venues or shows as CSV, NDJSON or columnar chunks """
+    watermark = export_watermark()
+    for chunk in export(kind, fmt, since=since, chunk_size=chunk_size):
+        output.write(chunk)
+    click.echo(f'Next incremental run: --since {watermark.isoformat()}', err=True)
+
+
+# Query plans.
+
+
+@fyyur_cli.command('explain')
+@click.option('--artists', default=20000, show_default=True)
+@click.option('--venues', default=5000, show_default=True)
+@click.option('--shows', default=100000, show_default=True)
+@with_appcontext
+def explain_command(artists, venues, shows):
+    """ Fail when a hot route's query plan falls back to a Seq Scan
+
+    Seeds a synthetic dataset in a transaction that is rolled back.
+    """
+    failures = check_plans(current_app, artists=artists, venues=venues, shows=shows,
+                           report=click.echo)
+    if failures:
+        raise click.ClickException(f'{failures} routes use sequential scans.')
+
+
+# Benchmarks.
+
+
+@fyyur_cli.command('bench')
+@click.option('--sizes', default='1000,10000', show_default=True,
+              help='Comma-separated dataset sizes, in artists.')
+@click.option('--requests', default=50, show_default=True,
+              help='Requests per route and size.')
+@click.option('--route', 'routes', multiple=True, type=click.Choice(sorted(bench.ROUTES)),
+              help='Only benchmark these routes.')
+@click.option('--seed', default=0, show_default=True)
+@click.option('--output', '-o', type=click.File('w'), default='-',
+              help='Where the JSON report goes, stdout by default.')
+@click.confirmation_option(prompt='This empties artists, venues and shows. Continue?')
+@with_appcontext
+def bench_command(sizes, requests, routes, seed, output):
+    """ Benchmark every route against generated datasets, report JSON """
+    sizes = [int(size) for size in sizes.split(',')]
+    results = bench.run(current_app, sizes, requests=requests, routes=routes or None,
+                        seed=seed, report=lambda line: click.echo(line, err=True))
+    bench.write(results, output)
+
+
+# Load generation.
+
+
+def parse_mix(ctx, param, values):
+    mix = {}
+    for value in values:
+        route, _, weight = value.partition('=')
+        if route not in bench.ROUTES or not weight.isdigit():
+            raise click.BadParameter(f'expected ROUTE=WEIGHT with a known route, got {value}')
+        mix[route] = int(weight)
+    return mix
+
+
+@fyyur_cli.command('loadgen')
+@click.option('--url', help='Target a running server instead of starting one locally.')
+@click.option('--concurrency', '-c', default=8, show_default=True,
+              help='Concurrent client connections.')
+@click.option('--duration', '-d', default=30, show_default=True,
+              help='Seconds of measured load.')
+@click.option('--warmup', default=5, show_default=True,
+              help='Seconds of unmeasured load first.')
+@click.option('--mix', multiple=True, callback=parse_mix, metavar='ROUTE=WEIGHT',
+              help='Traffic mix, replacing the default one. Repeatable.')
+@click.option('--seed', default=0, show_default=True)
+@click.option('--output', '-o', type=click.File('w'), default='-',
+              help='Where the JSON report goes, stdout by default.')
+@with_appcontext
+def loadgen_command(url, concurrency, duration, warmup, mix, seed, output):
+    """ Replay a traffic mix over HTTP and report throughput and latency
+
+    The local server runs with CSRF checks off so the form POSTs go
+    through; a --url target must be configured the same way.
+    """
+    report = loadgen.run(current_app._get_current_object(), url=url, concurrency=concurrency, duration=duration,
+                         warmup=warmup, mix=mix or None, seed=seed)
+    click.echo(f"{report['requests_per_second']} requests/s, "
+               f"{report['error_rate']:.2%} errors", err=True)
+    for route, stats in report['routes'].items():
+        click.echo(f"  {route:<20} {stats['requests_per_second']:>8}/s  "
+                   f"p50 {stats['p50_ms']:>8}ms  p99 {stats['p99_ms']:>8}ms  "
+                   f"errors {stats['error_rate']:.2%}", err=True)
+    bench.write(report, output)
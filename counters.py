@@ -0,0 +1,131 @@
+"""
+Upcoming and past show counters on artists and venues
+
+Listings read artists.upcoming_shows_count and past_shows_count instead of
+aggregating shows. The counts are relative to a watermark, the rolled_at
+of the single show_counter_rollover row: shows starting after it are
+upcoming, the rest past.
+
+- count_shows() adjusts the counters in the transaction that inserts or
+  deletes shows.
+- rollover(), run periodically (`flask fyyur rollover` from cron), moves
+  the shows that started since the last run from upcoming to past and
+  advances the watermark.
+- recount() rebuilds every counter from the shows table.
+
+Writers hold a shared advisory lock and rollover/recount an exclusive
+one, so a show is never counted against a watermark that moves before
+it commits.
+
+The counters are derived from shows, so updating them keeps updated_at
+as it was: otherwise every booking, rollover and recount would mark
+artists and venues changed for incremental exports.
+"""
+# Imports
+
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import func, select, update
+
+from models import db, Artist, Venue, Show, ShowCounterRollover
+
+# Counters.
+
+ROLLOVER_LOCK = 0x5f7c0c01
+
+SHOW_COLUMN = {
+    Artist: Show.artist_id,
+    Venue: Show.venue_id,
+}
+
+
+def _lock(shared):
+    lock = func.pg_advisory_xact_lock_shared if shared else func.pg_advisory_xact_lock
+    db.session.execute(select(lock(ROLLOVER_LOCK)))
+
+
+def rolled_at():
+    """ Returns the current watermark """
+    return db.session.execute(select(ShowCounterRollover.rolled_at)).scalar_one()
+
+
+def count_shows(rows, sign=1):
+    """ Adds shows to their artists' and venues' counters, removes them with sign=-1
+
+    rows are (artist_id, venue_id, start_time). Call in the transaction
+    that inserts or deletes the shows; nothing is committed here.
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    _lock(shared=True)
+    watermark = rolled_at()
+
+    deltas = {Artist: defaultdict(lambda: [0, 0]), Venue: defaultdict(lambda: [0, 0])}
+    for artist_id, venue_id, start_time in rows:
+        slot = 0 if start_time > watermark else 1
+        deltas[Artist][artist_id][slot] += sign
+        deltas[Venue][venue_id][slot] += sign
+
+    for model, changes in deltas.items():
+        table = model.__table__
+        db.session.execute(
+            update(table)
+            .where(table.c.id == db.bindparam('entity_id'))
+            .values(upcoming_shows_count=table.c.upcoming_shows_count + db.bindparam('upcoming'),
+                    past_shows_count=table.c.past_shows_count + db.bindparam('past'),
+                    updated_at=table.c.updated_at),
+            [{'entity_id': entity_id, 'upcoming': upcoming, 'past': past}
+             for entity_id, (upcoming, past) in changes.items()])
+
+
+def rollover(now=None):
+    """ Moves shows started since the last rollover to past, returns how many
+
+    Only the shows between the old and the new watermark are read, through
+    the start_time index.
+    """
+    now = now or datetime.now()
+    _lock(shared=False)
+    watermark = rolled_at()
+    if now <= watermark:
+        return 0
+
+    moved = 0
+    for model, column in SHOW_COLUMN.items():
+        started = (select(column.label('entity_id'), func.count().label('started'))
+                   .where(Show.start_time > watermark, Show.start_time <= now)
+                   .group_by(column)
+                   .subquery())
+        result = db.session.execute(
+            update(model)
+            .where(model.id == started.c.entity_id)
+            .values(upcoming_shows_count=model.upcoming_shows_count - started.c.started,
+                    past_shows_count=model.past_shows_count + started.c.started,
+                    updated_at=model.updated_at)
+            .returning(started.c.started)
+            .execution_options(synchronize_session=False))
+        if model is Artist:
+            moved = sum(result.scalars())
+
+    db.session.execute(update(ShowCounterRollover).values(rolled_at=now))
+    return moved
+
+
+def recount(now=None):
+    """ Rebuilds every counter from the shows table and resets the watermark
+
+    One UPDATE per table, each count an index-only lookup per row.
+    """
+    now = now or datetime.now()
+    _lock(shared=False)
+    for model, column in SHOW_COLUMN.items():
+        shows = select(func.count()).select_from(Show).where(column == model.id)
+        db.session.execute(
+            update(model)
+            .values(upcoming_shows_count=shows.where(Show.start_time > now).scalar_subquery(),
+                    past_shows_count=shows.where(Show.start_time <= now).scalar_subquery(),
+                    updated_at=model.updated_at)
+            .execution_options(synchronize_session=False))
+    db.session.execute(update(ShowCounterRollover).values(rolled_at=now))
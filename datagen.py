@@ -0,0 +1,150 @@
+"""
+Seeded synthetic catalogue for benchmarks
+
+The same seed always produces the same artists, venues, shows and
+availability. Genres and states follow a Zipf-like popularity curve, so a
+few dominate the way they do in real listings, and each state has a
+handful of cities. Rows are written with executemany in chunks.
+"""
+# Imports
+
+import random
+from itertools import accumulate
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, text
+
+import changelog
+import matching
+from counters import recount
+from enums import Genre, State
+from models import db, Artist, Availability, Venue, Show
+
+# Distributions.
+
+CITIES_PER_STATE = 5
+
+CATALOGUE_TABLES = ('availability_rules', 'availability', 'shows', 'venues', 'artists')
+
+
+def zipf_weights(count, exponent=1.1):
+    """ Returns cumulative weights of 1/rank**exponent for count items """
+    return list(accumulate(1 / (rank ** exponent) for rank in range(1, count + 1)))
+
+
+class Generator:
+    """ Draws catalogue rows from one random.Random(seed) """
+
+    def __init__(self, seed=0, now=None):
+        self.random = random.Random(seed)
+        self.now = (now or datetime.now()).replace(minute=0, second=0, microsecond=0)
+        self.genres = [genre.name for genre in Genre]
+        self.genre_weights = zipf_weights(len(self.genres))
+        self.states = [state.value for state in State]
+        self.state_weights = zipf_weights(len(self.states))
+
+    def place(self):
+        state = self.random.choices(self.states, cum_weights=self.state_weights)[0]
+        return f'{state} City {self.random.randrange(CITIES_PER_STATE)}', state
+
+    def genre_list(self):
+        count = self.random.choice((1, 1, 1, 2, 2, 3))
+        return sorted(set(self.random.choices(self.genres, cum_weights=self.genre_weights, k=count)))
+
+    def artist(self, index):
+        city, state = self.place()
+        return {
+            'name': f'Artist {index}',
+            'city': city,
+            'state': state,
+            'phone': f'{self.random.randrange(200, 999)}-555-{index % 10000:04d}',
+            'genres': self.genre_list(),
+            'image_link': f'https://example.com/artists/{index}.jpg',
+            'facebook_link': f'https://www.facebook.com/artist{index}',
+            'seeking_venue': self.random.random() < 0.3,
+            'seeking_description': 'Looking for a venue' if index % 3 == 0 else None,
+        }
+
+    def venue(self, index):
+        city, state = self.place()
+        return {
+            'name': f'Venue {index}',
+            'city': city,
+            'state': state,
+            'address': f'{index} Main Street',
+            'phone': f'{self.random.randrange(200, 999)}-555-{index % 10000:04d}',
+            'genres': self.genre_list(),
+            'image_link': f'https://example.com/venues/{index}.jpg',
+            'facebook_link': f'https://www.facebook.com/venue{index}',
+            'seeking_talent': self.random.random() < 0.5,
+            'seeking_description': None,
+        }
+
+    def shows(self, count, artist_ids, venue_ids):
+        """ Yields count shows, a third in the past, none double booked
+
+        Popular artists and venues get more shows. Start times fall on
+        evening slots two hours apart, a show's length, from four months
+        back to eight months ahead.
+        """
+        artist_weights = zipf_weights(len(artist_ids), 0.8)
+        venue_weights = zipf_weights(len(venue_ids), 0.8)
+        taken_artists, taken_venues = set(), set()
+        made = 0
+        while made < count:
+            artist_id = self.random.choices(artist_ids, cum_weights=artist_weights)[0]
+            venue_id = self.random.choices(venue_ids, cum_weights=venue_weights)[0]
+            day = self.random.randrange(-120, 245)
+            start_time = self.now.replace(hour=0) + timedelta(
+                days=day, hours=self.random.choice((16, 18, 20, 22)))
+            if (artist_id, start_time) in taken_artists or (venue_id, start_time) in taken_venues:
+                continue
+            taken_artists.add((artist_id, start_time))
+            taken_venues.add((venue_id, start_time))
+            made += 1
+            yield {'artist_id': artist_id, 'venue_id': venue_id, 'start_time': start_time}
+
+    def slot(self, artist_id):
+        start_time = self.now + timedelta(days=self.random.randrange(0, 180),
+                                          hours=self.random.randrange(0, 12))
+        return {'artist_id': artist_id, 'start_time': start_time,
+                'end_time': start_time + timedelta(hours=self.random.choice((2, 4, 6, 8)))}
+
+
+# Loading.
+
+
+def _insert(model, rows, chunk_size=5000):
+    """ Inserts rows in chunks, returns their new ids in order """
+    ids = []
+    for start in range(0, len(rows), chunk_size):
+        ids.extend(db.session.execute(
+            insert(model).returning(model.id, sort_by_parameter_order=True),
+            rows[start:start + chunk_size]).scalars())
+    if model in changelog.KINDS:
+        changelog.record(changelog.KINDS[model], 'insert', ids)
+    return ids
+
+
+def clear_catalogue():
+    """ Empties every catalogue table and restarts their ids, expiring feed cursors """
+    db.session.execute(text(
+        f"TRUNCATE {', '.join(CATALOGUE_TABLES)} RESTART IDENTITY CASCADE"))
+    changelog.reset()
+
+
+def generate(artists, venues, shows, slots, seed=0):
+    """ Writes a synthetic catalogue and commits, returns the row counts """
+    generator = Generator(seed)
+    artist_ids = _insert(Artist, [generator.artist(i) for i in range(1, artists + 1)])
+    venue_ids = _insert(Venue, [generator.venue(i) for i in range(1, venues + 1)])
+    shows = min(shows, len(artist_ids) * 5 * 365, len(venue_ids) * 5 * 365)
+    _insert(Show, list(generator.shows(shows, artist_ids, venue_ids)))
+    _insert(Availability, [generator.slot(generator.random.choice(artist_ids))
+                           for _ in range(slots)])
+    recount()
+    matching.rebuild()
+    db.session.commit()
+    db.session.execute(text('ANALYZE match_postings, ' + ', '.join(CATALOGUE_TABLES)))
+    db.session.commit()
+    return {'artists': artists, 'venues': venues, 'shows': shows, 'slots': slots}
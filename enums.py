@@ -79,4 +79,11 @@ class State(enum.Enum):
     WY= 'WY'
     @classmethod
     def choices(cls):
-        return[(choice.name,choice.value)for choice in cls]
\ No newline at end of file
+        return[(choice.name,choice.value)for choice in cls]
+
+
+# Lookups, built once: names are what forms post and the database stores,
+# values are what pages show.
+GENRE_NAMES = frozenset(Genre.__members__)
+GENRE_LABELS = {genre.name: genre.value for genre in Genre}
+STATE_NAMES = frozenset(State.__members__)
@@ -1,9 +1,9 @@
 from datetime import datetime
 import re
 from flask_wtf import FlaskForm
-from wtforms import DateField, FieldList, FormField, StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, SubmitField, TimeField, ValidationError
-from wtforms.validators import DataRequired, URL
-from enums import State,Genre
+from wtforms import Form, DateField, FieldList, FormField, StringField, SelectField, SelectMultipleField, DateTimeField, BooleanField, SubmitField, TimeField, ValidationError
+from wtforms.validators import DataRequired, Optional, URL
+from enums import GENRE_NAMES, STATE_NAMES, State, Genre
 
 
 def is_valid_phone(number):
@@ -25,11 +25,11 @@ def validate_phone(self,field):
         raise ValidationError('Invalid phone number.')
 
 def validate_genres(self,field):
-    if not set(field.data).issubset(dict(Genre.choices()).keys()):
+    if not GENRE_NAMES.issuperset(field.data):
        raise ValidationError('Invalid genres.')
 
 def validate_state(self,field):
-    if field.data not in dict(State.choices()).keys():
+    if field.data not in STATE_NAMES:
        raise ValidationError('Invalid State.')
 
 def validate(self, **Kwargs):
@@ -126,9 +126,16 @@ class ArtistForm(FlaskForm):
             'seeking_description'
      )
 
-class AvailabilityEntryForm(FlaskForm):
+class AvailabilityEntryForm(Form):
+    """ One availability entry, nested in AvailabilityForm without its own CSRF token """
     date = DateField('Date', format='%Y-%m-%d', validators=[DataRequired()])
     start_time = TimeField('Start Time', format='%H:%M', validators=[DataRequired()])
+    end_time = TimeField('End Time', format='%H:%M', validators=[Optional()])
+    repeat_weekly = BooleanField('Repeat weekly')
+
+    def validate_end_time(self, field):
+        if field.data and self.start_time.data and field.data < self.start_time.data:
+            raise ValidationError('End time must not be before start time.')
 
 class AvailabilityForm(FlaskForm):
     entries = FieldList(FormField(AvailabilityEntryForm), min_entries=1)
@@ -0,0 +1,40 @@
+"""
+gunicorn settings, read with `gunicorn -c gunicorn.conf.py`
+
+Every worker is a process with its own connection pool, so throughput
+grows with WEB_CONCURRENCY until the database is the bottleneck; keep
+WEB_CONCURRENCY * (FYYUR_DB_POOL_SIZE + FYYUR_DB_MAX_OVERFLOW) under
+the server's max_connections.
+
+Some state stays per worker. Without FYYUR_CACHE_URL each worker fills
+its own detail page cache, so the hit rate drops as workers are added and
+more requests reach the database than with a single process; invalidations
+do reach every worker. The home page fragment and /cache/stats are per
+worker too. /metrics sums all workers through FYYUR_METRICS_DIR.
+"""
+# Imports
+
+import multiprocessing
+import os
+import tempfile
+
+# Server.
+
+wsgi_app = 'wsgi:app'
+bind = f"0.0.0.0:{os.environ.get('PORT', 5010)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 1))
+# Import the app once in the master, workers fork with it already loaded.
+preload_app = True
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+# Restart workers now and then, staggered, to bound slow leaks.
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 10000))
+max_requests_jitter = max_requests // 10
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')
+errorlog = '-'
+
+# App.
+
+# Workers save their metrics here and /metrics sums them, see metrics.py.
+# A fresh directory per server start, so the counters restart with it.
+os.environ.setdefault('FYYUR_METRICS_DIR', tempfile.mkdtemp(prefix='fyyur-metrics-'))
@@ -0,0 +1,297 @@
+"""
+Bulk import of artists, venues and shows from CSV or NDJSON files
+
+Files are read one record at a time. Records are validated with the same
+WTForms classes as the create pages, and written in batches with
+executemany, one transaction per batch. Rejected records go to a side
+file as NDJSON with their errors.
+
+Each batch also saves the byte offset it reaches to import_checkpoints,
+in the same transaction, so the offset and the rows committed never
+disagree: an interrupted import resumes at the first record it did not
+commit. The checkpoint is mirrored to a JSON file next to the input, for
+people and scripts watching the import. Show batches drop the detail
+pages of their artists and venues once committed.
+"""
+# Imports
+
+import csv
+import json
+import os
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.dialects.postgresql import insert as upsert
+from werkzeug.datastructures import MultiDict
+
+from booking import CONFLICT_MESSAGES, booked_slots
+from cache import invalidate
+import changelog
+import matching
+from counters import count_shows
+from forms import ArtistForm, VenueForm, ShowForm
+from models import db, Artist, ImportCheckpoint, Venue, Show
+from pages import page_cache
+
+# Readers.
+
+FORMATS = ('csv', 'ndjson')
+
+TRUE_VALUES = ('1', 'true', 't', 'yes', 'y', 'on')
+
+
+def guess_format(path):
+    """ Returns the format implied by the file extension, or None """
+    extension = os.path.splitext(path)[1].lower().lstrip('.')
+    return {'csv': 'csv', 'ndjson': 'ndjson', 'jsonl': 'ndjson'}.get(extension)
+
+
+def _lines(handle, position):
+    """ Yields decoded lines, keeping position[0] at the bytes consumed """
+    for line in iter(handle.readline, b''):
+        position[0] += len(line)
+        yield line.decode('utf-8')
+
+
+def read_records(path, fmt, offset=0):
+    """ Yields (record, offset after it) from a CSV or NDJSON file
+
+    CSV headers are read from the top of the file before seeking to
+    offset. Records are dicts of strings, or whatever an NDJSON line held.
+    """
+    with open(path, 'rb') as handle:
+        position = [0]
+        if fmt == 'csv':
+            header = next(csv.reader(_lines(handle, position)), None)
+            if header is None:
+                return
+            if offset > position[0]:
+                handle.seek(offset)
+                position[0] = offset
+            for values in csv.reader(_lines(handle, position)):
+                if values:
+                    yield dict(zip(header, values)), position[0]
+        else:
+            handle.seek(offset)
+            position[0] = offset
+            for line in _lines(handle, position):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Passed on as a string, which validation rejects.
+                    record = line.rstrip('\n')
+                yield record, position[0]
+
+
+# Validation.
+
+
+def to_formdata(record, form):
+    """ Returns record as the MultiDict a browser would have posted """
+    formdata = MultiDict()
+    for name, field in form._fields.items():
+        value = record.get(name)
+        if value is None:
+            continue
+        if field.type == 'SelectMultipleField':
+            if isinstance(value, str):
+                value = [item.strip() for item in value.split(',') if item.strip()]
+            for item in value:
+                formdata.add(name, item)
+        elif field.type == 'BooleanField':
+            if value is True or str(value).strip().lower() in TRUE_VALUES:
+                formdata.add(name, 'y')
+        else:
+            formdata.add(name, str(value))
+    return formdata
+
+
+def validate_record(form, record):
+    """ Returns (row, None) for a valid record, (None, errors) otherwise """
+    if not isinstance(record, dict):
+        return None, {'record': ['Expected an object.']}
+    formdata = to_formdata(record, form)
+    # A missing field would silently keep its default (ShowForm's
+    # start_time defaults to now), so required fields must be present.
+    missing = {name: ['This field is required.'] for name, field in form._fields.items()
+               if field.flags.required and name not in formdata}
+    if missing:
+        return None, missing
+    form.process(formdata)
+    if not form.validate():
+        return None, form.errors
+    return {name: value for name, value in form.data.items()
+            if name != 'csrf_token'}, None
+
+
+def check_shows(rows):
+    """ Returns {index: errors} for show rows that cannot be inserted """
+    errors = {}
+    for index, row in enumerate(rows):
+        try:
+            row['artist_id'] = int(row['artist_id'])
+            row['venue_id'] = int(row['venue_id'])
+        except (TypeError, ValueError):
+            errors[index] = {'artist_id': ['Artist and venue IDs must be integers.']}
+
+    valid = [row for index, row in enumerate(rows) if index not in errors]
+    known_artists = set(db.session.execute(
+        select(Artist.id).where(Artist.id.in_({row['artist_id'] for row in valid}))).scalars())
+    known_venues = set(db.session.execute(
+        select(Venue.id).where(Venue.id.in_({row['venue_id'] for row in valid}))).scalars())
+    taken_venues, taken_artists = booked_slots(
+        (row['artist_id'], row['venue_id'], row['start_time']) for row in valid)
+
+    for index, row in enumerate(rows):
+        if index in errors:
+            continue
+        artist_slot = (row['artist_id'], row['start_time'])
+        venue_slot = (row['venue_id'], row['start_time'])
+        if row['artist_id'] not in known_artists:
+            errors[index] = {'artist_id': [CONFLICT_MESSAGES['shows_artist_id_fkey']]}
+        elif row['venue_id'] not in known_venues:
+            errors[index] = {'venue_id': [CONFLICT_MESSAGES['shows_venue_id_fkey']]}
+        elif venue_slot in taken_venues:
+            errors[index] = {'start_time': [CONFLICT_MESSAGES['uq_shows_venue_start']]}
+        elif artist_slot in taken_artists:
+            errors[index] = {'start_time': [CONFLICT_MESSAGES['uq_shows_artist_start']]}
+        else:
+            taken_venues.add(venue_slot)
+            taken_artists.add(artist_slot)
+    return errors
+
+
+IMPORTERS = {
+    'artists': (Artist, ArtistForm),
+    'venues': (Venue, VenueForm),
+    'shows': (Show, ShowForm),
+}
+
+
+# Checkpoints.
+
+
+class Checkpoint:
+    """ Progress of the import of source, mirrored as JSON to path """
+    FIELDS = ('offset', 'imported', 'rejected', 'rejects_size', 'complete')
+
+    def __init__(self, source, path):
+        self.source = source
+        self.path = path
+        self.offset = 0
+        self.imported = 0
+        self.rejected = 0
+        # Length of the rejects file when the offset was saved.
+        self.rejects_size = 0
+        self.complete = False
+
+    @classmethod
+    def load(cls, source, path):
+        checkpoint = cls(source, path)
+        row = db.session.get(ImportCheckpoint, source)
+        if row is not None:
+            for name in cls.FIELDS:
+                setattr(checkpoint, name, getattr(row, name))
+        return checkpoint
+
+    @classmethod
+    def discard(cls, source, path):
+        """ Forgets the progress of source, committed at once """
+        db.session.execute(delete(ImportCheckpoint).where(ImportCheckpoint.path == source))
+        db.session.commit()
+        if os.path.exists(path):
+            os.remove(path)
+
+    def stage(self):
+        """ Writes the checkpoint in the current transaction, committed by the caller """
+        state = {name: getattr(self, name) for name in self.FIELDS}
+        db.session.execute(
+            upsert(ImportCheckpoint).values(path=self.source, **state)
+            .on_conflict_do_update(index_elements=[ImportCheckpoint.path],
+                                   set_={**state, 'updated_at': db.func.now()}))
+
+    def mirror(self):
+        """ Writes the JSON copy atomically, once the checkpoint is committed """
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w') as handle:
+            json.dump({name: getattr(self, name) for name in self.FIELDS}, handle)
+        os.replace(tmp, self.path)
+
+
+# Import.
+
+
+def import_file(kind, path, fmt=None, batch_size=1000, rejects_path=None,
+                restart=False, progress=None):
+    """ Imports path into the table for kind and returns the Checkpoint
+
+    progress, when given, is called with the checkpoint after each batch.
+    """
+    fmt = fmt or guess_format(path)
+    if fmt not in FORMATS:
+        raise ValueError(f'Cannot tell the format of {path}, pass csv or ndjson.')
+
+    model, form_class = IMPORTERS[kind]
+    form = form_class(formdata=None, meta={'csrf': False})
+    source, checkpoint_path = os.path.abspath(path), path + '.checkpoint'
+    if restart:
+        Checkpoint.discard(source, checkpoint_path)
+    checkpoint = Checkpoint.load(source, checkpoint_path)
+    if checkpoint.complete:
+        return checkpoint
+
+    rejects_path = rejects_path or path + '.rejects.ndjson'
+    with open(rejects_path, 'a' if checkpoint.offset else 'w') as rejects:
+        # Drops rejects written after the last checkpoint, they come again.
+        rejects.truncate(checkpoint.rejects_size)
+        batch, raw, rejected, offset = [], [], [], checkpoint.offset
+        for record, offset in read_records(path, fmt, checkpoint.offset):
+            row, errors = validate_record(form, record)
+            if errors:
+                rejected.append({'record': record, 'errors': errors})
+                continue
+            batch.append(row)
+            raw.append(record)
+            if len(batch) >= batch_size:
+                _write_batch(model, batch, raw, rejected, rejects, checkpoint, offset)
+                batch, raw, rejected = [], [], []
+                if progress:
+                    progress(checkpoint)
+
+        checkpoint.complete = True
+        _write_batch(model, batch, raw, rejected, rejects, checkpoint, offset)
+    return checkpoint
+
+
+def _write_batch(model, batch, raw, rejected, rejects, checkpoint, offset):
+    """ Inserts one batch and records the offset it ends at, in one transaction
+
+    rejected holds the records of the batch that failed validation. They
+    are written before the commit: should it not happen, the resumed
+    import truncates them away with the rest of the batch.
+    """
+    if model is Show and batch:
+        errors = check_shows(batch)
+        rejected += [{'record': raw[index], 'errors': errors[index]} for index in sorted(errors)]
+        batch = [row for index, row in enumerate(batch) if index not in errors]
+
+    if batch:
+        ids = db.session.execute(insert(model).returning(model.id), batch).scalars().all()
+        changelog.record(changelog.KINDS[model], 'insert', ids)
+        if model in matching.KINDS:
+            matching.reindex(model, ids)
+        if model is Show:
+            count_shows((row['artist_id'], row['venue_id'], row['start_time']) for row in batch)
+    rejects.writelines(json.dumps(reject) + '\n' for reject in rejected)
+    rejects.flush()
+    checkpoint.rejected += len(rejected)
+    checkpoint.rejects_size = rejects.tell()
+    checkpoint.imported += len(batch)
+    checkpoint.offset = offset
+    checkpoint.stage()
+    db.session.commit()
+    checkpoint.mirror()
+    if model is Show and batch:
+        invalidate(page_cache, artists=[row['artist_id'] for row in batch],
+                   venues=[row['venue_id'] for row in batch])
@@ -0,0 +1,173 @@
+"""
+Load generator for the full HTTP stack, run as `flask fyyur loadgen`
+
+The app is served by a threaded werkzeug server on a local port, or any
+running deployment is targeted with --url. Worker threads each hold a
+keep-alive connection and replay a weighted traffic mix of the routes in
+bench.ROUTES, with ids drawn from the catalogue in the database. After a
+warm-up, every response is recorded; the report gives sustained requests
+per second and, per route, latency percentiles and the error rate.
+"""
+# Imports
+
+import http.client
+import json
+import logging
+import threading
+import time
+from itertools import accumulate
+from urllib.parse import quote, urlencode, urlsplit
+
+from sqlalchemy import func, select
+from werkzeug.serving import make_server
+
+from bench import RequestFactory, build, percentile
+from models import db, Artist, Venue
+
+# Traffic.
+
+# Mostly home and detail views, some listings and searches, a few writes.
+DEFAULT_MIX = {
+    'index': 30,
+    'show_artist': 20,
+    'show_venue': 15,
+    'artists': 3,
+    'venues': 4,
+    'shows': 4,
+    'free_windows': 2,
+    'search_suggest': 5,
+    'search_artists': 4,
+    'search_venues': 3,
+    'search_city': 2,
+    'create_artist': 1,
+    'edit_artist': 1,
+    'create_venue': 1,
+    'edit_venue': 1,
+    'create_show': 2,
+    'set_availability': 1,
+}
+
+
+def encode(kwargs):
+    """ Returns (body, headers) for bench-style request kwargs """
+    headers = dict(kwargs.get('headers') or {})
+    if 'json' in kwargs:
+        headers['Content-Type'] = 'application/json'
+        return json.dumps(kwargs['json']).encode(), headers
+    if 'data' in kwargs:
+        headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        return urlencode(kwargs['data'], doseq=True).encode(), headers
+    return None, headers
+
+
+class Recorder:
+    """ Latencies and failures per route, one per worker thread """
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+
+    def record(self, route, seconds, ok):
+        self.latencies.setdefault(route, []).append(seconds)
+        if not ok:
+            self.errors[route] = self.errors.get(route, 0) + 1
+
+
+def worker(host, port, mix, factory, warmup_until, deadline, recorder):
+    routes = list(mix)
+    weights = list(accumulate(mix.values()))
+    connection = http.client.HTTPConnection(host, port, timeout=30)
+    while True:
+        started = time.monotonic()
+        if started >= deadline:
+            break
+        route = factory.random.choices(routes, cum_weights=weights)[0]
+        method, path, kwargs = build(route, factory)
+        body, headers = encode(kwargs)
+        try:
+            connection.request(method, quote(path, safe='/?=&'), body, headers)
+            response = connection.getresponse()
+            response.read()
+            ok = response.status < 400
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            connection = http.client.HTTPConnection(host, port, timeout=30)
+            ok = False
+        if started >= warmup_until:
+            recorder.record(route, time.monotonic() - started, ok)
+    connection.close()
+
+
+# Runs.
+
+
+def dataset():
+    """ Returns the id ranges the request factory draws from """
+    return {'artists': db.session.execute(select(func.max(Artist.id))).scalar() or 1,
+            'venues': db.session.execute(select(func.max(Venue.id))).scalar() or 1}
+
+
+def summarize(recorders, seconds):
+    latencies, errors = {}, {}
+    for recorder in recorders:
+        for route, values in recorder.latencies.items():
+            latencies.setdefault(route, []).extend(values)
+        for route, count in recorder.errors.items():
+            errors[route] = errors.get(route, 0) + count
+
+    total = sum(len(values) for values in latencies.values())
+    report = {'seconds': seconds, 'requests': total,
+              'requests_per_second': round(total / seconds, 1),
+              'error_rate': round(sum(errors.values()) / total, 4) if total else 0,
+              'routes': {}}
+    for route, values in sorted(latencies.items()):
+        values.sort()
+        report['routes'][route] = {
+            'requests': len(values),
+            'requests_per_second': round(len(values) / seconds, 1),
+            'p50_ms': round(percentile(values, 0.50) * 1000, 2),
+            'p90_ms': round(percentile(values, 0.90) * 1000, 2),
+            'p99_ms': round(percentile(values, 0.99) * 1000, 2),
+            'max_ms': round(values[-1] * 1000, 2),
+            'error_rate': round(errors.get(route, 0) / len(values), 4),
+        }
+    return report
+
+
+def run(app, url=None, concurrency=8, duration=30, warmup=5, mix=None, seed=0):
+    """ Generates load for duration seconds after warmup, returns the report """
+    mix = mix or DEFAULT_MIX
+    ids = dataset()
+    db.session.remove()
+
+    server = None
+    if url:
+        parts = urlsplit(url)
+        host, port = parts.hostname, parts.port or 80
+    else:
+        app.config.update(WTF_CSRF_ENABLED=False)
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        host, port = '127.0.0.1', server.server_port
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    warmup_until = time.monotonic() + warmup
+    deadline = warmup_until + duration
+    recorders = [Recorder() for _ in range(concurrency)]
+    threads = [threading.Thread(target=worker, args=(
+                   host, port, mix, RequestFactory(ids, seed + index),
+                   warmup_until, deadline, recorders[index]))
+               for index in range(concurrency)]
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        if server is not None:
+            server.shutdown()
+
+    report = summarize(recorders, duration)
+    report.update({'target': url or f'http://{host}:{port} (werkzeug, threaded)',
+                   'concurrency': concurrency, 'mix': mix})
+    return report
@@ -0,0 +1,161 @@
+"""
+Artist and venue matchmaking
+
+match_postings is an inverted index from (genre, state, city) to the
+artists seeking a venue and the venues seeking talent, one posting per
+genre. The after_flush hook below keeps it current: whenever a flush
+inserts or deletes an artist or venue, or changes its genres, location or
+seeking flag, that row's postings are rewritten in the same transaction.
+Bulk inserts call reindex(), and `flask fyyur rebuild-matches` rebuilds
+the whole index.
+
+top_matches() reads the postings of the source's genres in its state,
+one index range scan per genre, and ranks the candidates in the same
+statement. The score weighs the share of the source's genres a candidate
+shares, playing in the same city and, for artists, having availability
+in the next MATCH_HORIZON_DAYS.
+"""
+# Imports
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import (case, delete, event, false, func, insert, inspect, literal, or_, select,
+                        true)
+
+from models import db, Artist, Availability, AvailabilityRule, MatchPosting, Venue
+from replicas import RoutingSession
+
+KINDS = {Artist: 'artists', Venue: 'venues'}
+MODELS = {kind: model for model, kind in KINDS.items()}
+SEEKING = {Artist: Artist.seeking_venue, Venue: Venue.seeking_talent}
+# An artist is matched with venues and the other way round.
+COUNTERPART = {Artist: Venue, Venue: Artist}
+
+# Attributes the postings are derived from.
+INDEXED = ('genres', 'state', 'city', 'seeking_venue', 'seeking_talent')
+
+WEIGHTS = {'genres': 0.6, 'city': 0.25, 'availability': 0.15}
+
+# Indexing.
+
+
+def _postings(model, where=()):
+    """ Returns the SELECT of the postings of model rows matching where """
+    genre = func.unnest(model.genres).table_valued('genre').render_derived().lateral()
+    return (select(literal(KINDS[model]), genre.c.genre, model.state, model.city, model.id)
+            .select_from(model).join(genre, true())
+            .where(SEEKING[model], genre.c.genre.isnot(None), model.state.isnot(None),
+                   model.city.isnot(None), *where)
+            .distinct())
+
+
+def reindex(model, ids, connection=None):
+    """ Rewrites the postings of the artists or venues with ids """
+    ids = list(ids)
+    if not ids:
+        return
+    connection = connection or db.session.connection()
+    postings = MatchPosting.__table__
+    connection.execute(delete(postings).where(postings.c.kind == KINDS[model],
+                                              postings.c.entity_id.in_(ids)))
+    connection.execute(insert(postings).from_select(
+        ['kind', 'genre', 'state', 'city', 'entity_id'],
+        _postings(model, (model.id.in_(ids),))))
+
+
+def rebuild():
+    """ Rebuilds every posting in the current transaction, returns their count """
+    db.session.execute(delete(MatchPosting.__table__))
+    for model in KINDS:
+        db.session.execute(insert(MatchPosting.__table__).from_select(
+            ['kind', 'genre', 'state', 'city', 'entity_id'], _postings(model)))
+    return db.session.execute(select(func.count()).select_from(MatchPosting)).scalar()
+
+
+def _changes_postings(instance, op):
+    if op != 'update':
+        return True
+    attrs = inspect(instance).attrs
+    return any(name in attrs and attrs[name].history.has_changes() for name in INDEXED)
+
+
+@event.listens_for(RoutingSession, 'after_flush')
+def _reindex_flush(session, flush_context):
+    changed = {}
+    for op, instances in (('insert', session.new), ('update', session.dirty),
+                          ('delete', session.deleted)):
+        for instance in instances:
+            if type(instance) in KINDS and _changes_postings(instance, op):
+                changed.setdefault(type(instance), set()).add(instance.id)
+    for model, ids in changed.items():
+        # Reads the rows as just flushed; deleted ones select no postings.
+        reindex(model, ids, session.connection())
+
+
+# Matching.
+
+
+def has_availability(artist_id, since, until):
+    """ Returns a clause true when the artist has availability between since and until """
+    in_range = (select(Availability.id)
+                .where(Availability.artist_id == artist_id,
+                       Availability.end_time > since,
+                       Availability.start_time < until)
+                .exists())
+    in_rule = (select(AvailabilityRule.id)
+               .where(AvailabilityRule.artist_id == artist_id,
+                      AvailabilityRule.valid_from <= until.date(),
+                      or_(AvailabilityRule.valid_until.is_(None),
+                          AvailabilityRule.valid_until >= since.date()))
+               .exists())
+    return or_(in_range, in_rule)
+
+
+def top_matches(kind, entity_id, limit=10, horizon_days=30, now=None):
+    """ Returns the limit best matches of an artist or venue, None when it does not exist
+
+    Matches are dicts of the candidate's id, name, city, state, genres and
+    image_link, its score and what the score is made of. Candidates are
+    ranked on their postings alone, only the winners' rows are read.
+    """
+    model = MODELS[kind]
+    source = db.session.execute(
+        select(model.genres, model.state, model.city).where(model.id == entity_id)).first()
+    if source is None:
+        return None
+    genres = sorted(set(source.genres or ()))
+    if not genres or source.state is None:
+        return []
+
+    target = COUNTERPART[model]
+    candidates = (select(MatchPosting.entity_id,
+                         func.count().label('shared_genres'),
+                         func.bool_or(MatchPosting.city == source.city).label('same_city'))
+                  .where(MatchPosting.kind == KINDS[target],
+                         MatchPosting.genre.in_(genres),
+                         MatchPosting.state == source.state)
+                  .group_by(MatchPosting.entity_id)
+                  .subquery())
+    if target is Artist:
+        now = now or datetime.now()
+        available = has_availability(candidates.c.entity_id, now,
+                                     now + timedelta(days=horizon_days))
+    else:
+        # The artist's own availability is the same for every venue.
+        available = false()
+    scored = select(candidates, available.label('available')).subquery()
+    score = (scored.c.shared_genres * WEIGHTS['genres'] / len(genres)
+             + case((scored.c.same_city, WEIGHTS['city']), else_=0)
+             + case((scored.c.available, WEIGHTS['availability']), else_=0))
+    best = (select(scored, score.label('score'))
+            .order_by(score.desc(), scored.c.entity_id)
+            .limit(limit)
+            .subquery())
+
+    rows = db.session.execute(
+        select(target.id, target.name, target.city, target.state, target.genres,
+               target.image_link, best.c.shared_genres, best.c.same_city, best.c.available,
+               best.c.score)
+        .join(best, best.c.entity_id == target.id)
+        .order_by(best.c.score.desc(), target.id))
+    return [dict(row._mapping, score=round(row.score, 4)) for row in rows]
@@ -0,0 +1,270 @@
+"""
+Per-request SQL and latency instrumentation
+
+Flask request signals and SQLAlchemy engine events feed per-endpoint
+totals: a request latency histogram, SQL statement count and time, rows
+fetched and template render time. render() writes them in the Prometheus
+text format served at /metrics.
+
+A request that issues more statements than METRICS_QUERY_BUDGET or takes
+longer than METRICS_LATENCY_BUDGET seconds is logged as a warning.
+
+Totals are kept per process. With METRICS_DIR set, as gunicorn.conf.py
+does for its workers, every process also saves them there, at most every
+METRICS_SAVE_SECONDS and when it exits, and render() sums the files of
+all processes. A scrape then covers every worker whichever one answers
+it, and the totals of recycled workers stay counted.
+"""
+# Imports
+
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from flask import (before_render_template, request, request_finished,
+                   request_started, template_rendered)
+from sqlalchemy import event
+
+from models import db
+
+# Metrics.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+COUNTERS = (
+    ('sql_statements', 'fyyur_sql_statements_total', 'SQL statements executed.'),
+    ('sql_seconds', 'fyyur_sql_duration_seconds_total', 'Time spent executing SQL.'),
+    ('rows', 'fyyur_sql_rows_total', 'Rows returned or affected by SQL statements.'),
+    ('template_seconds', 'fyyur_template_render_seconds_total', 'Time spent rendering templates.'),
+    ('over_query_budget', 'fyyur_query_budget_exceeded_total',
+     'Requests that issued more statements than METRICS_QUERY_BUDGET.'),
+    ('over_latency_budget', 'fyyur_latency_budget_exceeded_total',
+     'Requests slower than METRICS_LATENCY_BUDGET.'),
+)
+
+# The stats of the request being handled. Threads start with an empty
+# context, so background work is never charged to a request.
+_current = ContextVar('fyyur_request_stats', default=None)
+
+
+class RequestStats:
+    """ What one request has done so far """
+    __slots__ = ('started', 'sql_statements', 'sql_seconds', 'rows',
+                 'template_seconds', 'template_started')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sql_statements = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.template_seconds = 0.0
+        self.template_started = None
+
+
+class EndpointMetrics:
+    """ Totals for one endpoint """
+    __slots__ = ('buckets', 'count', 'seconds') + tuple(name for name, _, _ in COUNTERS)
+
+    def __init__(self):
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.count = 0
+        self.seconds = 0.0
+        for name, _, _ in COUNTERS:
+            setattr(self, name, 0)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def add(self, totals):
+        """ Adds the to_dict() totals of another process """
+        self.buckets = [mine + theirs for mine, theirs in zip(self.buckets, totals['buckets'])]
+        for name in self.__slots__[1:]:
+            setattr(self, name, getattr(self, name) + totals[name])
+
+
+class Metrics:
+    """ Collects request metrics for one app, init_app() hooks it up """
+
+    def __init__(self, app=None):
+        self.endpoints = {}
+        self.directory = None
+        self._lock = threading.Lock()
+        self._path = None
+        self._pid = None
+        self._dirty = threading.Event()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.query_budget = app.config.get('METRICS_QUERY_BUDGET')
+        self.latency_budget = app.config.get('METRICS_LATENCY_BUDGET')
+        self.directory = app.config.get('METRICS_DIR')
+        self.save_seconds = app.config.get('METRICS_SAVE_SECONDS', 1)
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+
+        request_started.connect(self._request_started, app, weak=False)
+        request_finished.connect(self._request_finished, app, weak=False)
+        before_render_template.connect(self._before_render, app, weak=False)
+        template_rendered.connect(self._rendered, app, weak=False)
+
+        with app.app_context():
+            engines = list(db.engines.values())
+        for engine in engines:
+            event.listen(engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(engine, 'after_cursor_execute', self._after_cursor_execute)
+
+    # Hooks.
+
+    def _request_started(self, sender, **extra):
+        _current.set(RequestStats())
+
+    def _before_render(self, sender, template, context, **extra):
+        stats = _current.get()
+        if stats is not None:
+            stats.template_started = time.perf_counter()
+
+    def _rendered(self, sender, template, context, **extra):
+        stats = _current.get()
+        if stats is not None and stats.template_started is not None:
+            stats.template_seconds += time.perf_counter() - stats.template_started
+            stats.template_started = None
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if _current.get() is not None:
+            conn.info.setdefault('fyyur_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        stats = _current.get()
+        if stats is None or not conn.info.get('fyyur_started'):
+            return
+        stats.sql_statements += 1
+        stats.sql_seconds += time.perf_counter() - conn.info['fyyur_started'].pop()
+        # -1 for server-side cursors, whose rows are not known yet.
+        stats.rows += max(cursor.rowcount, 0)
+
+    def _request_finished(self, sender, response, **extra):
+        stats = _current.get()
+        if stats is None:
+            return
+        endpoint = request.endpoint or 'unmatched'
+        label = f"{request.method} {request.full_path.rstrip('?')}"
+        # Streamed bodies are rendered after this signal, the request is
+        # only complete once the server closes the response.
+        response.call_on_close(lambda: self._record(stats, endpoint, label))
+
+    def _record(self, stats, endpoint, label):
+        if _current.get() is stats:
+            _current.set(None)
+        seconds = time.perf_counter() - stats.started
+        over_queries = self.query_budget is not None and stats.sql_statements > self.query_budget
+        over_latency = self.latency_budget is not None and seconds > self.latency_budget
+
+        with self._lock:
+            totals = self.endpoints.get(endpoint)
+            if totals is None:
+                totals = self.endpoints[endpoint] = EndpointMetrics()
+            bucket = bisect_left(LATENCY_BUCKETS, seconds)
+            if bucket < len(LATENCY_BUCKETS):
+                totals.buckets[bucket] += 1
+            totals.count += 1
+            totals.seconds += seconds
+            totals.sql_statements += stats.sql_statements
+            totals.sql_seconds += stats.sql_seconds
+            totals.rows += stats.rows
+            totals.template_seconds += stats.template_seconds
+            totals.over_query_budget += over_queries
+            totals.over_latency_budget += over_latency
+        if self.directory:
+            self._start_saving()
+            self._dirty.set()
+
+        if over_queries or over_latency:
+            self.app.logger.warning(
+                '%s over budget: %.3fs, %d SQL statements (%.3fs), %d rows',
+                label, seconds, stats.sql_statements, stats.sql_seconds, stats.rows)
+
+    # Sharing between processes.
+
+    def _start_saving(self):
+        """ Starts this process's saver thread unless it runs already """
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            # Unique even when the pid of a recycled worker comes back.
+            self._path = os.path.join(self.directory, f'{self._pid}-{uuid.uuid4().hex}.json')
+        threading.Thread(target=self._save_loop, daemon=True).start()
+        atexit.register(self.save)
+
+    def _save_loop(self):
+        while True:
+            self._dirty.wait()
+            self._dirty.clear()
+            try:
+                self.save()
+            except OSError:
+                self.app.logger.exception('Could not save metrics to %s', self.directory)
+            time.sleep(self.save_seconds)
+
+    def save(self):
+        """ Writes this process's totals to its file in METRICS_DIR """
+        if self._path is None or self._pid != os.getpid():
+            return
+        with self._lock:
+            data = {endpoint: totals.to_dict() for endpoint, totals in self.endpoints.items()}
+        tmp = self._path + '.tmp'
+        with open(tmp, 'w') as handle:
+            json.dump(data, handle)
+        os.replace(tmp, self._path)
+
+    def _all_endpoints(self):
+        """ Returns {endpoint: EndpointMetrics} summed over every process """
+        endpoints = {}
+        if not self.directory:
+            with self._lock:
+                for endpoint, totals in self.endpoints.items():
+                    endpoints.setdefault(endpoint, EndpointMetrics()).add(totals.to_dict())
+            return endpoints
+        self.save()
+        for path in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                with open(path) as handle:
+                    data = json.load(handle)
+            except (OSError, ValueError):
+                continue
+            for endpoint, totals in data.items():
+                endpoints.setdefault(endpoint, EndpointMetrics()).add(totals)
+        return endpoints
+
+    # Exposition.
+
+    def render(self):
+        """ Returns every metric in the Prometheus text format """
+        endpoints = sorted(self._all_endpoints().items())
+        lines = ['# HELP fyyur_request_duration_seconds Request latency.',
+                 '# TYPE fyyur_request_duration_seconds histogram']
+        for endpoint, totals in endpoints:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, totals.buckets):
+                cumulative += count
+                lines.append(f'fyyur_request_duration_seconds_bucket'
+                             f'{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+            lines.append(f'fyyur_request_duration_seconds_bucket'
+                         f'{{endpoint="{endpoint}",le="+Inf"}} {totals.count}')
+            lines.append(f'fyyur_request_duration_seconds_sum{{endpoint="{endpoint}"}} {totals.seconds}')
+            lines.append(f'fyyur_request_duration_seconds_count{{endpoint="{endpoint}"}} {totals.count}')
+
+        for name, metric, help_text in COUNTERS:
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} counter')
+            for endpoint, totals in endpoints:
+                lines.append(f'{metric}{{endpoint="{endpoint}"}} {getattr(totals, name)}')
+        return '\n'.join(lines) + '\n'
@@ -97,6 +97,17 @@ def run_migrations_online():
     connectable = get_engine()
 
     with connectable.connect() as connection:
+        # Models mark what needs an extension with info={'extension': ...};
+        # compare them only where the extension is installed.
+        installed = set(connection.exec_driver_sql(
+            'SELECT extname FROM pg_extension').scalars())
+        connection.commit()
+
+        def include_object(object, name, type_, reflected, compare_to):
+            extension = getattr(object, 'info', {}).get('extension')
+            return extension is None or extension in installed
+
+        conf_args.setdefault('include_object', include_object)
         context.configure(
             connection=connection,
             target_metadata=get_metadata(),
@@ -0,0 +1,43 @@
+"""unique venue and artist start times on shows
+
+Revision ID: 5a9c7d1e4b62
+Revises: 1b6f0e3d8a25
+Create Date: 2026-10-18 13:20:09.441872
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5a9c7d1e4b62'
+down_revision = '1b6f0e3d8a25'
+branch_labels = None
+depends_on = None
+
+CONSTRAINTS = {
+    'uq_shows_venue_start': 'venue_id',
+    'uq_shows_artist_start': 'artist_id',
+}
+
+
+def upgrade():
+    bind = op.get_bind()
+    for name, column in CONSTRAINTS.items():
+        duplicates = bind.execute(sa.text(
+            f'SELECT {column}, start_time FROM shows '
+            f'GROUP BY {column}, start_time HAVING count(*) > 1 LIMIT 10')).all()
+        if duplicates:
+            raise RuntimeError(
+                f'Cannot add {name}: shows already double-booked on '
+                f'({column}, start_time) {duplicates}. Resolve them and rerun.')
+
+    with op.batch_alter_table('shows', schema=None) as batch_op:
+        for name, column in CONSTRAINTS.items():
+            batch_op.create_unique_constraint(name, [column, 'start_time'])
+
+
+def downgrade():
+    with op.batch_alter_table('shows', schema=None) as batch_op:
+        for name in CONSTRAINTS:
+            batch_op.drop_constraint(name, type_='unique')
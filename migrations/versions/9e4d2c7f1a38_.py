@@ -0,0 +1,43 @@
+"""updated_at on artists, venues and shows, created_at on shows
+
+Revision ID: 9e4d2c7f1a38
+Revises: 5a9c7d1e4b62
+Create Date: 2026-10-18 14:02:33.615094
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e4d2c7f1a38'
+down_revision = '5a9c7d1e4b62'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing rows count as changed at migration time, so the first
+    # incremental export after the upgrade picks everything up.
+    with op.batch_alter_table('shows', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('created_at', sa.DateTime(), nullable=True, server_default=sa.func.now()))
+
+    for table in ('artists', 'venues', 'shows'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True, server_default=sa.func.now()))
+            batch_op.create_index(f'ix_{table}_updated_at', ['updated_at'], unique=False)
+
+    # The models set these on insert, keep the schema free of defaults.
+    for table in ('artists', 'venues', 'shows'):
+        op.alter_column(table, 'updated_at', server_default=None)
+    op.alter_column('shows', 'created_at', server_default=None)
+
+
+def downgrade():
+    for table in ('artists', 'venues', 'shows'):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_index(f'ix_{table}_updated_at')
+            batch_op.drop_column('updated_at')
+
+    with op.batch_alter_table('shows', schema=None) as batch_op:
+        batch_op.drop_column('created_at')
@@ -0,0 +1,58 @@
+"""exclude overlapping shows of a venue or an artist
+
+Revision ID: b7d3e1a5c864
+Revises: 2c8e5b7f3a91
+Create Date: 2026-10-19 09:14:52.206417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d3e1a5c864'
+down_revision = '2c8e5b7f3a91'
+branch_labels = None
+depends_on = None
+
+# config.SHOW_DURATION_MINUTES at this revision.
+SLOT = "tsrange(start_time, start_time + interval '120 minutes')"
+
+CONSTRAINTS = {
+    'ex_shows_venue_overlap': 'venue_id',
+    'ex_shows_artist_overlap': 'artist_id',
+}
+
+
+def has_btree_gist():
+    """ btree_gist ships with contrib, which some local installs lack """
+    return op.get_bind().execute(sa.text(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'btree_gist'")).scalar() is not None
+
+
+def upgrade():
+    if not has_btree_gist():
+        # Only the unique start times are enforced there.
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+
+    bind = op.get_bind()
+    for name, column in CONSTRAINTS.items():
+        overlaps = bind.execute(sa.text(
+            f'SELECT a.{column}, a.start_time, b.start_time FROM shows a '
+            f'JOIN shows b ON b.{column} = a.{column} AND b.id > a.id '
+            f"AND b.start_time < a.start_time + interval '120 minutes' "
+            f"AND a.start_time < b.start_time + interval '120 minutes' LIMIT 10")).all()
+        if overlaps:
+            raise RuntimeError(
+                f'Cannot add {name}: shows already overlap on {column} {overlaps}. '
+                f'Resolve them and rerun.')
+
+    for name, column in CONSTRAINTS.items():
+        op.create_exclude_constraint(name, 'shows', (column, '='), (sa.text(SLOT), '&&'),
+                                     using='gist')
+
+
+def downgrade():
+    for name in CONSTRAINTS:
+        op.execute(f'ALTER TABLE shows DROP CONSTRAINT IF EXISTS {name}')
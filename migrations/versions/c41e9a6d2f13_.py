@@ -0,0 +1,46 @@
+"""trigram indexes on name and city, GIN index on genres
+
+Revision ID: c41e9a6d2f13
+Revises: 8d3f1c2a7b90
+Create Date: 2026-10-18 11:02:17.884520
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c41e9a6d2f13'
+down_revision = '8d3f1c2a7b90'
+branch_labels = None
+depends_on = None
+
+TABLES = ('artists', 'venues')
+
+
+def has_pg_trgm():
+    """ pg_trgm ships with contrib, which some local installs lack """
+    return op.get_bind().execute(sa.text(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")).scalar() is not None
+
+
+def upgrade():
+    trgm = has_pg_trgm()
+    if trgm:
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    for table in TABLES:
+        if trgm:
+            for column in ('name', 'city'):
+                op.create_index(f'ix_{table}_{column}_trgm', table, [column],
+                                unique=False, postgresql_using='gin',
+                                postgresql_ops={column: 'gin_trgm_ops'})
+        op.create_index(f'ix_{table}_genres', table, ['genres'],
+                        unique=False, postgresql_using='gin')
+
+
+def downgrade():
+    for table in TABLES:
+        op.drop_index(f'ix_{table}_genres', table_name=table)
+        for column in ('name', 'city'):
+            op.execute(f'DROP INDEX IF EXISTS ix_{table}_{column}_trgm')
@@ -0,0 +1,74 @@
+"""move artist availability from a JSON column to its own table
+
+Revision ID: e7a2b5c90d41
+Revises: c41e9a6d2f13
+Create Date: 2026-10-18 11:48:05.160273
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a2b5c90d41'
+down_revision = 'c41e9a6d2f13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    availability = op.create_table('availability',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('artist_id', sa.Integer(), nullable=False),
+    sa.Column('start_time', sa.DateTime(), nullable=False),
+    sa.Column('end_time', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['artist_id'], ['artists.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('availability', schema=None) as batch_op:
+        batch_op.create_index('ix_availability_artist_range', ['artist_id', 'start_time', 'end_time'], unique=False)
+
+    # Each JSON slot {"date", "start_time"} becomes a zero-length range,
+    # which keeps the exact-match booking rule. Unparseable slots were
+    # already ignored by the app and are dropped.
+    bind = op.get_bind()
+    rows = []
+    for artist_id, slots in bind.execute(sa.text(
+            'SELECT id, availability FROM artists WHERE availability IS NOT NULL')):
+        for slot in slots if isinstance(slots, list) else []:
+            try:
+                start = datetime.strptime(f"{slot['date']} {slot['start_time']}", '%Y-%m-%d %H:%M')
+            except (KeyError, TypeError, ValueError):
+                continue
+            rows.append({'artist_id': artist_id, 'start_time': start, 'end_time': start})
+    if rows:
+        op.bulk_insert(availability, rows)
+
+    with op.batch_alter_table('artists', schema=None) as batch_op:
+        batch_op.drop_column('availability')
+
+
+def downgrade():
+    with op.batch_alter_table('artists', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('availability', sa.JSON(), nullable=True))
+
+    op.execute("""
+        UPDATE artists SET availability = slots.availability
+        FROM (
+            SELECT artist_id,
+                   json_agg(json_build_object(
+                       'date', to_char(start_time, 'YYYY-MM-DD'),
+                       'start_time', to_char(start_time, 'HH24:MI'))
+                   ORDER BY start_time) AS availability
+            FROM availability
+            GROUP BY artist_id
+        ) AS slots
+        WHERE artists.id = slots.artist_id
+    """)
+
+    with op.batch_alter_table('availability', schema=None) as batch_op:
+        batch_op.drop_index('ix_availability_artist_range')
+
+    op.drop_table('availability')
@@ -1,12 +1,32 @@
 """
 Artist, Venue and Show models
+
+Relationships load lazily on access. Read-only pages do not load models
+at all, they select columns into the view models of views.py. db.session routes reads to the
+replicas, see replicas.py.
 """
 # Imports
 
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import ARRAY, JSON
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import ARRAY, ENUM, ExcludeConstraint
+
+from enums import Genre
+from replicas import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+# Genre names as a Postgres enum, created by the migrations.
+GENRE = ENUM(*Genre.__members__, name='genre', create_type=False)
 
-db = SQLAlchemy()
+# Marks schema items that only exist where the extension is installed: the
+# migrations skip them without it, and so does autogenerate (migrations/env.py).
+TRGM = {'extension': 'pg_trgm'}
+BTREE_GIST = {'extension': 'btree_gist'}
+
+# The time a show takes, config.SHOW_DURATION_MINUTES when the constraints
+# below were created.
+SHOW_SLOT = "tsrange(start_time, start_time + interval '120 minutes')"
 
 # Models.
 
@@ -14,23 +34,45 @@ db = SQLAlchemy()
 class Artist(db.Model):
     """ Artist Model"""
     __tablename__ = 'artists'
+    __table_args__ = (
+        db.Index('ix_artists_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}, info=TRGM),
+        db.Index('ix_artists_city_trgm', 'city', postgresql_using='gin',
+                 postgresql_ops={'city': 'gin_trgm_ops'}, info=TRGM),
+        db.Index('ix_artists_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_artists_updated_at', 'updated_at'),
+        db.Index('ix_artists_created_at', 'created_at'),
+        db.Index('ix_artists_state_city', 'state', 'city'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(ARRAY(db.String))
+    genres = db.Column(ARRAY(GENRE))
     website_link = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     seeking_venue = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(120))
-    availability = db.Column(JSON)
     created_at = db.Column(db.DateTime, default=db.func.now())
+    updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
+    # Maintained by counters.py, relative to the last rollover.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Bumped by every ORM update, the API's ETags are derived from it.
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+
+    venues = db.relationship('Venue', secondary='shows', viewonly=True)
+    shows = db.relationship('Show', back_populates='artist', cascade ="all,delete")
+    availability = db.relationship('Availability', back_populates='artist',
+                                   order_by='Availability.start_time',
+                                   cascade='all, delete-orphan')
+    availability_rules = db.relationship('AvailabilityRule', back_populates='artist',
+                                         cascade='all, delete-orphan')
 
-    venues = db.relationship('Venue', secondary='shows')
-    shows = db.relationship('Show', backref=('artists'),lazy='joined',cascade ="all,delete" )
+    __mapper_args__ = {'version_id_col': version}
 
     def to_dict(self):
         """ Returns a dictinary of artists """
@@ -40,13 +82,14 @@ class Artist(db.Model):
             'city': self.city,
             'state': self.state,
             'phone': self.phone,
-            'genres': self.genres.split(','), 
+            'genres': list(self.genres or ()),
             'image_link': self.image_link,
             'facebook_link': self.facebook_link,
             'website_link': self.website_link,
             'seeking_venue': self.seeking_venue,
             'seeking_description': self.seeking_description,
-            'availability' :self.availability,
+            'availability' : [slot.to_dict() for slot in self.availability],
+            'availability_rules' : [rule.to_dict() for rule in self.availability_rules],
         }
         
     def __repr__(self):
@@ -56,6 +99,16 @@ class Artist(db.Model):
 class Venue(db.Model):
     """ Venue Model """
     __tablename__ = 'venues'
+    __table_args__ = (
+        db.Index('ix_venues_name_trgm', 'name', postgresql_using='gin',
+                 postgresql_ops={'name': 'gin_trgm_ops'}, info=TRGM),
+        db.Index('ix_venues_city_trgm', 'city', postgresql_using='gin',
+                 postgresql_ops={'city': 'gin_trgm_ops'}, info=TRGM),
+        db.Index('ix_venues_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_venues_updated_at', 'updated_at'),
+        db.Index('ix_venues_created_at', 'created_at'),
+        db.Index('ix_venues_state_city', 'state', 'city'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -63,16 +116,24 @@ class Venue(db.Model):
     state = db.Column(db.String(120))
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(ARRAY(db.String))
+    genres = db.Column(ARRAY(GENRE))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website_link = db.Column(db.String(120))
     seeking_talent = db.Column(db.Boolean, nullable=False, default=False)
     seeking_description = db.Column(db.String(120))
     created_at = db.Column(db.DateTime, default=db.func.now())
+    updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
+    # Maintained by counters.py, relative to the last rollover.
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Bumped by every ORM update, the API's ETags are derived from it.
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+
+    artists = db.relationship('Artist', secondary='shows', viewonly=True)
+    shows = db.relationship('Show', back_populates='venue', cascade ="all,delete")
 
-    artists = db.relationship('Artist', secondary='shows')
-    shows = db.relationship('Show', backref=('venues') ,lazy='joined', cascade ="all,delete")
+    __mapper_args__ = {'version_id_col': version}
 
     def to_dict(self):
         """ Returns a dictinary of venues """
@@ -83,7 +144,7 @@ class Venue(db.Model):
             'state': self.state,
             'address': self.address,
             'phone': self.phone,
-            'genres': self.genres.split(','), 
+            'genres': list(self.genres or ()),
             'image_link': self.image_link,
             'facebook_link': self.facebook_link,
             'website_link': self.website_link,
@@ -98,6 +159,19 @@ class Venue(db.Model):
 class Show(db.Model):
     """ Show Model """
     __tablename__ = 'shows'
+    __table_args__ = (
+        db.Index('ix_shows_start_time_id', 'start_time', 'id'),
+        # A venue or an artist can only have one show starting at a given
+        # time. The constraints double as the per-venue/per-artist indexes.
+        db.UniqueConstraint('venue_id', 'start_time', name='uq_shows_venue_start'),
+        db.UniqueConstraint('artist_id', 'start_time', name='uq_shows_artist_start'),
+        # Nor shows that overlap, where btree_gist is installed.
+        ExcludeConstraint(('venue_id', '='), (text(SHOW_SLOT), '&&'),
+                          name='ex_shows_venue_overlap', using='gist', info=BTREE_GIST),
+        ExcludeConstraint(('artist_id', '='), (text(SHOW_SLOT), '&&'),
+                          name='ex_shows_artist_overlap', using='gist', info=BTREE_GIST),
+        db.Index('ix_shows_updated_at', 'updated_at'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     artist_id = db.Column(db.Integer, db.ForeignKey(
@@ -105,9 +179,14 @@ class Show(db.Model):
     venue_id = db.Column(db.Integer, db.ForeignKey(
         'venues.id'), nullable=False)
     start_time = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, default=db.func.now())
+    updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
+    version = db.Column(db.Integer, nullable=False, server_default='1')
+
+    venue = db.relationship('Venue', back_populates='shows')
+    artist = db.relationship('Artist', back_populates='shows')
 
-    venue = db.relationship('Venue')
-    artist = db.relationship('Artist')
+    __mapper_args__ = {'version_id_col': version}
 
     def show_artist(self):
         """ Returns a dictinary of artists for the show """
@@ -125,4 +204,139 @@ class Show(db.Model):
             'venue_name': self.venue.name,
             'venue_image_link': self.venue.image_link,
             'start_time': self.start_time.strftime('%Y-%m-%d %H:%M:%S')
-        }
\ No newline at end of file
+        }
+
+
+class ShowCounterRollover(db.Model):
+    """ ShowCounterRollover Model: the single row holding the counters' watermark
+
+    Shows starting after rolled_at are counted as upcoming, the others as past.
+    """
+    __tablename__ = 'show_counter_rollover'
+
+    id = db.Column(db.Integer, primary_key=True)
+    rolled_at = db.Column(db.DateTime, nullable=False)
+
+
+class Availability(db.Model):
+    """ Availability Model: a time range an artist can be booked in """
+    __tablename__ = 'availability'
+    __table_args__ = (
+        db.Index('ix_availability_artist_range', 'artist_id', 'start_time', 'end_time'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey(
+        'artists.id', ondelete='CASCADE'), nullable=False)
+    start_time = db.Column(db.DateTime, nullable=False)
+    end_time = db.Column(db.DateTime, nullable=False)
+
+    artist = db.relationship('Artist', back_populates='availability')
+
+    def to_dict(self):
+        """ Returns a dictinary of the availability range """
+        return {
+            'start_time': self.start_time.strftime('%Y-%m-%d %H:%M'),
+            'end_time': self.end_time.strftime('%Y-%m-%d %H:%M')
+        }
+
+
+class AvailabilityRule(db.Model):
+    """ AvailabilityRule Model: a weekly recurring time range """
+    __tablename__ = 'availability_rules'
+    __table_args__ = (
+        db.Index('ix_availability_rules_artist_weekday', 'artist_id', 'weekday', 'start_time'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    artist_id = db.Column(db.Integer, db.ForeignKey(
+        'artists.id', ondelete='CASCADE'), nullable=False)
+    # Monday is 0, as in date.weekday().
+    weekday = db.Column(db.SmallInteger, nullable=False)
+    start_time = db.Column(db.Time, nullable=False)
+    end_time = db.Column(db.Time, nullable=False)
+    valid_from = db.Column(db.Date, nullable=False)
+    valid_until = db.Column(db.Date)
+
+    artist = db.relationship('Artist', back_populates='availability_rules')
+
+    def to_dict(self):
+        """ Returns a dictinary of the weekly rule """
+        return {
+            'weekday': self.weekday,
+            'start_time': self.start_time.strftime('%H:%M'),
+            'end_time': self.end_time.strftime('%H:%M'),
+            'valid_from': self.valid_from.isoformat(),
+            'valid_until': self.valid_until.isoformat() if self.valid_until else None
+        }
+
+
+class Change(db.Model):
+    """ Change Model: one insert, update or delete of an artist, venue or show
+
+    Rows are only ever appended, in the transaction making the change, and
+    removed by compaction, see changelog.py.
+    """
+    __tablename__ = 'changes'
+    __table_args__ = (
+        db.Index('ix_changes_position', 'txid', 'id'),
+        db.Index('ix_changes_entity', 'kind', 'entity_id', 'txid', 'id'),
+    )
+
+    id = db.Column(db.BigInteger, primary_key=True)
+    # The writing transaction's id; rows are read in (txid, id) order.
+    txid = db.Column(db.BigInteger, nullable=False,
+                     server_default=db.text('pg_current_xact_id()::text::bigint'))
+    kind = db.Column(db.String(16), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=False)
+    op = db.Column(db.String(8), nullable=False)
+    changed_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+
+
+class ChangeLogState(db.Model):
+    """ ChangeLogState Model: the single row holding the change log's watermark
+
+    Tombstones up to (expired_txid, expired_id) have been dropped, so
+    cursors before it can no longer be served.
+    """
+    __tablename__ = 'change_log_state'
+
+    id = db.Column(db.Integer, primary_key=True)
+    expired_txid = db.Column(db.BigInteger, nullable=False, server_default='0')
+    expired_id = db.Column(db.BigInteger, nullable=False, server_default='0')
+    compacted_at = db.Column(db.DateTime)
+
+
+class ImportCheckpoint(db.Model):
+    """ ImportCheckpoint Model: how far the import of a file has got
+
+    Written in the transaction of each batch, so the offset always matches
+    the rows imported, see importer.py.
+    """
+    __tablename__ = 'import_checkpoints'
+
+    # Absolute path of the input file.
+    path = db.Column(db.String, primary_key=True)
+    offset = db.Column(db.BigInteger, nullable=False)
+    imported = db.Column(db.Integer, nullable=False)
+    rejected = db.Column(db.Integer, nullable=False)
+    rejects_size = db.Column(db.BigInteger, nullable=False)
+    complete = db.Column(db.Boolean, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False, server_default=db.func.now())
+
+
+class MatchPosting(db.Model):
+    """ MatchPosting Model: one genre of a seeking artist or venue
+
+    The inverted index of matching.py, keyed on (kind, genre, state, city).
+    """
+    __tablename__ = 'match_postings'
+    __table_args__ = (
+        db.Index('ix_match_postings_entity', 'kind', 'entity_id'),
+    )
+
+    kind = db.Column(db.String(16), primary_key=True)
+    genre = db.Column(GENRE, primary_key=True)
+    state = db.Column(db.String(120), primary_key=True)
+    city = db.Column(db.String(120), primary_key=True)
+    entity_id = db.Column(db.Integer, primary_key=True)
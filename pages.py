@@ -0,0 +1,51 @@
+"""
+Cached pages shared by the site and the API blueprints
+
+page_cache holds the artist and venue detail page view models,
+recent_listings the home page listings. Both blueprints drop them after
+their writes, so they live here rather than in app.py, which imports the
+blueprints.
+"""
+# Imports
+
+from flask import render_template
+from markupsafe import Markup
+from sqlalchemy import select
+
+from cache import Fragment, PageCache, invalidate
+from models import db, Artist, Venue, Show
+from queries import recently_listed
+
+page_cache = PageCache()
+
+# Home page.
+
+
+def render_recent_listings(app):
+    """ Returns the recently listed artists and venues as HTML """
+    with app.app_context():
+        recent_artists = recently_listed(Artist, 10)
+
+        recent_venues = recently_listed(Venue, 10)
+
+        return Markup(render_template('pages/recent_listings.html',
+                                      recent_artists=recent_artists, recent_venues=recent_venues))
+
+
+recent_listings = Fragment(render_recent_listings)
+
+# Detail pages.
+
+
+def invalidate_artist(artist_id):
+    """ Drops the artist's page and the pages of venues listing its shows """
+    venues = db.session.execute(
+        select(Show.venue_id).where(Show.artist_id == artist_id).distinct()).scalars()
+    invalidate(page_cache, artists=[artist_id], venues=venues)
+
+
+def invalidate_venue(venue_id):
+    """ Drops the venue's page and the pages of artists playing there """
+    artists = db.session.execute(
+        select(Show.artist_id).where(Show.venue_id == venue_id).distinct()).scalars()
+    invalidate(page_cache, artists=artists, venues=[venue_id])
@@ -0,0 +1,215 @@
+"""
+Query-plan regression check, run as `flask fyyur explain` and by tests/test_plans.py
+
+Inside one transaction that is always rolled back, a synthetic dataset is
+generated server-side and analyzed, then every hot route is dispatched on
+the same session while its statements are recorded. Each statement is
+run again under EXPLAIN, and any sequential scan on a table the route is
+not expected to read in full is reported.
+"""
+# Imports
+
+from datetime import datetime
+
+from sqlalchemy import event, text
+
+import matching
+from models import db
+from replicas import primary_only
+
+# Dataset.
+
+SEED_STATEMENTS = (
+    """
+    INSERT INTO artists (name, city, state, phone, genres, seeking_venue,
+                         created_at, updated_at)
+    SELECT 'Artist ' || i, 'City ' || (i % :cities),
+           (ARRAY['CA','NY','TX','WA','IL','FL','MA','CO','OR','GA'])[1 + i % 10],
+           '123-456-7890', ARRAY[(ARRAY['Jazz','Rock_n_Roll','Folk','Blues'])[1 + i % 4]]::genre[],
+           i % 3 = 0, localtimestamp - i * interval '1 minute', localtimestamp
+    FROM generate_series(1, :artists) AS i
+    """,
+    """
+    INSERT INTO venues (name, city, state, address, phone, genres, seeking_talent,
+                        created_at, updated_at)
+    SELECT 'Venue ' || i, 'City ' || (i % :cities),
+           (ARRAY['CA','NY','TX','WA','IL','FL','MA','CO','OR','GA'])[1 + i % 10],
+           i || ' Main St', '123-456-7890',
+           ARRAY[(ARRAY['Jazz','Rock_n_Roll','Folk','Blues'])[1 + i % 4]]::genre[],
+           i % 2 = 0, localtimestamp - i * interval '1 minute', localtimestamp
+    FROM generate_series(1, :venues) AS i
+    """,
+    # One show an hour from a year back, so no artist's or venue's shows overlap.
+    """
+    INSERT INTO shows (artist_id, venue_id, start_time, created_at, updated_at)
+    SELECT a.id, v.id, date_trunc('hour', localtimestamp) + (i - :shows / 2) * interval '1 hour',
+           localtimestamp, localtimestamp
+    FROM generate_series(1, :shows) AS i
+    JOIN (SELECT id, row_number() OVER (ORDER BY id) - 1 AS n FROM artists) a
+      ON a.n = i % :artists
+    JOIN (SELECT id, row_number() OVER (ORDER BY id) - 1 AS n FROM venues) v
+      ON v.n = i % :venues
+    """,
+    """
+    INSERT INTO availability (artist_id, start_time, end_time)
+    SELECT id, date_trunc('day', localtimestamp) + (id % 30) * interval '1 day',
+           date_trunc('day', localtimestamp) + (id % 30) * interval '1 day' + interval '6 hours'
+    FROM artists
+    """,
+    """
+    INSERT INTO availability_rules (artist_id, weekday, start_time, end_time, valid_from)
+    SELECT id, id % 7, time '18:00', time '23:00', current_date FROM artists
+    """,
+    # A change log entry per row, as if every row had been inserted through the app.
+    """
+    INSERT INTO changes (kind, entity_id, op)
+    SELECT 'artists', id, 'insert' FROM artists
+    UNION ALL SELECT 'venues', id, 'insert' FROM venues
+    UNION ALL SELECT 'shows', id, 'insert' FROM shows
+    """,
+)
+
+ANALYZE = ('ANALYZE artists, venues, shows, availability, availability_rules, match_postings, '
+           'changes')
+
+
+def seed(artists, venues, shows, cities):
+    """ Generates the dataset in the current transaction """
+    params = {'artists': artists, 'venues': venues, 'shows': shows, 'cities': cities}
+    for statement in SEED_STATEMENTS:
+        db.session.execute(text(statement), params)
+    matching.rebuild()
+    db.session.execute(text(ANALYZE))
+
+
+# Routes.
+
+# (method, path, form data, tables the route legitimately reads in full)
+HOT_ROUTES = (
+    ('GET', '/', None, ()),
+    ('GET', '/artists', None, ('artists',)),
+    ('GET', '/venues', None, ()),
+    ('GET', '/venues?page=3', None, ()),
+    ('GET', '/shows', None, ()),
+    ('GET', '/shows?when=upcoming', None, ()),
+    ('GET', '/shows?when=past', None, ()),
+    ('GET', '/artists/{artist_id}', None, ()),
+    ('GET', '/venues/{venue_id}', None, ()),
+    ('GET', '/artists/{artist_id}/free_windows?n=10', None, ()),
+    ('GET', '/search/suggest?q=Artist 12', None, ()),
+    ('GET', '/api/v1/artists', None, ()),
+    ('GET', '/api/v1/venues?after=100', None, ()),
+    ('GET', '/api/v1/artists/{artist_id}', None, ()),
+    ('GET', '/api/v1/venues/{venue_id}', None, ()),
+    ('GET', '/api/v1/shows', None, ()),
+    ('GET', '/api/v1/shows/{show_id}', None, ()),
+    ('GET', '/api/v1/artists/{artist_id}/availability', None, ()),
+    # change_log_state is a single row.
+    ('GET', '/api/v1/changes', None, ('change_log_state',)),
+    ('GET', '/api/v1/venues/browse?genre=Jazz&state=CA', None, ()),
+    # Availability is probed for every candidate, hashed in one pass when many.
+    ('GET', '/api/v1/venues/{venue_id}/matches', None, ('availability', 'availability_rules')),
+    ('POST', '/artists/search', {'search_term': 'Artist 123'}, ()),
+    ('POST', '/venues/search', {'search_term': 'Venue 12'}, ()),
+    ('POST', '/search', {'city': 'City 7', 'state': 'CA'}, ()),
+)
+
+# Routes whose plans depend on pg_trgm, skipped where it is not installed.
+TRIGRAM_ROUTES = ('/search/suggest', '/artists/search', '/venues/search')
+
+
+def has_trigram_indexes():
+    """ Returns True when the trigram indexes exist """
+    return db.session.execute(text(
+        "SELECT 1 FROM pg_indexes WHERE indexname = 'ix_artists_name_trgm'")).scalar() is not None
+
+
+def record_statements(app, method, path, data):
+    """ Dispatches one request on the current session, returns its statements """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        with app.test_request_context(path, method=method, data=data):
+            response = app.full_dispatch_request()
+            response.get_data()
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+    return response.status_code, statements
+
+
+# Plans.
+
+
+def seq_scans(plan):
+    """ Yields the relation names read by Seq Scan nodes of a JSON plan """
+    if plan.get('Node Type') == 'Seq Scan':
+        yield plan['Relation Name']
+    for child in plan.get('Plans', ()):
+        yield from seq_scans(child)
+
+
+def explain(statement, parameters):
+    """ Returns the JSON plan of a recorded statement """
+    cursor = db.session.connection().connection.cursor()
+    try:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+        return cursor.fetchone()[0][0]['Plan']
+    finally:
+        cursor.close()
+
+
+def check_routes(app, routes=HOT_ROUTES, report=print):
+    """ Explains every statement of routes, returns the number of failures """
+    app.config['WTF_CSRF_ENABLED'] = False
+    trigram = has_trigram_indexes()
+    ids = {'artist_id': db.session.execute(text('SELECT max(id) FROM artists')).scalar(),
+           'venue_id': db.session.execute(text('SELECT max(id) FROM venues')).scalar(),
+           'show_id': db.session.execute(text('SELECT max(id) FROM shows')).scalar()}
+    failures = 0
+
+    for method, path, data, full_scans in routes:
+        path = path.format(**ids)
+        if not trigram and path.split('?')[0] in TRIGRAM_ROUTES:
+            report(f'SKIP {method} {path}: pg_trgm is not installed')
+            continue
+
+        status, statements = record_statements(app, method, path, data)
+        problems = []
+        if status >= 400:
+            problems.append(f'answered {status}')
+        for statement, parameters in statements:
+            if not statement.lstrip().upper().startswith('SELECT'):
+                continue
+            scanned = set(seq_scans(explain(statement, parameters))) - set(full_scans)
+            if scanned:
+                problems.append(f"Seq Scan on {', '.join(sorted(scanned))}:\n    "
+                                + ' '.join(statement.split()))
+
+        if problems:
+            failures += 1
+            report(f'FAIL {method} {path}')
+            for problem in problems:
+                report('  ' + problem)
+        else:
+            report(f'ok   {method} {path} ({len(statements)} statements)')
+    return failures
+
+
+def run(app, artists=20000, venues=5000, shows=100000, cities=500, report=print,
+        routes=HOT_ROUTES):
+    """ Seeds, checks every route and rolls everything back, returns the failures """
+    started = datetime.now()
+    # The seeded rows only exist in this transaction on the primary.
+    with primary_only():
+        try:
+            seed(artists, venues, shows, cities)
+            report(f'Seeded {artists} artists, {venues} venues, {shows} shows '
+                   f'in {(datetime.now() - started).total_seconds():.1f}s')
+            return check_routes(app, routes, report=report)
+        finally:
+            db.session.rollback()
@@ -0,0 +1,315 @@
+"""
+Read queries used by the controllers
+
+Pages are built from the selected columns into the view models of
+views.py, never from ORM instances.
+"""
+# Imports
+
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from datetime import datetime
+from itertools import groupby
+
+from sqlalchemy import and_, cast, func, select, true, tuple_
+
+from models import db, Artist, Venue, Show
+from views import ArtistView, ShowSummary, VenueView
+
+# Artists and venues.
+
+ARTIST_COLUMNS = (Artist.id, Artist.name, Artist.city, Artist.state, Artist.phone,
+                  Artist.genres, Artist.image_link, Artist.facebook_link,
+                  Artist.website_link, Artist.seeking_venue, Artist.seeking_description)
+VENUE_COLUMNS = (Venue.id, Venue.name, Venue.city, Venue.state, Venue.address, Venue.phone,
+                 Venue.genres, Venue.image_link, Venue.facebook_link,
+                 Venue.website_link, Venue.seeking_talent, Venue.seeking_description)
+VIEWS = {Artist: ArtistView, Venue: VenueView}
+
+
+def split_shows(rows, now):
+    """ Returns (past, upcoming) ShowSummary lists of rows ordered by start_time """
+    past, upcoming = [], []
+    for row in rows:
+        (past if row.start_time <= now else upcoming).append(ShowSummary.from_row(row))
+    return past, upcoming
+
+
+def with_shows(view, rows, now):
+    view.past_shows, view.upcoming_shows = split_shows(rows, now)
+    view.past_shows_count = len(view.past_shows)
+    view.upcoming_shows_count = len(view.upcoming_shows)
+    return view
+
+
+def artist_detail(artist_id, now):
+    """ Returns the ArtistView of the artist page, None for an unknown id """
+    row = db.session.execute(select(*ARTIST_COLUMNS).where(Artist.id == artist_id)).first()
+    if row is None:
+        return None
+    shows = db.session.execute(
+        select(Show.id, Show.start_time, Show.venue_id, Venue.name.label('venue_name'),
+               Venue.image_link.label('venue_image_link'))
+        .join(Venue, Venue.id == Show.venue_id)
+        .where(Show.artist_id == artist_id)
+        .order_by(Show.start_time, Show.id))
+    return with_shows(ArtistView.from_row(row), shows, now)
+
+
+def venue_detail(venue_id, now):
+    """ Returns the VenueView of the venue page, None for an unknown id """
+    row = db.session.execute(select(*VENUE_COLUMNS).where(Venue.id == venue_id)).first()
+    if row is None:
+        return None
+    shows = db.session.execute(
+        select(Show.id, Show.start_time, Show.artist_id, Artist.name.label('artist_name'),
+               Artist.image_link.label('artist_image_link'))
+        .join(Artist, Artist.id == Show.artist_id)
+        .where(Show.venue_id == venue_id)
+        .order_by(Show.start_time, Show.id))
+    return with_shows(VenueView.from_row(row), shows, now)
+
+
+def views_of(model, *columns, where=(), order_by=(), limit=None):
+    """ Returns the views of model rows with only columns selected """
+    stmt = select(*columns).where(*where).order_by(*order_by).limit(limit)
+    return [VIEWS[model].from_row(row) for row in db.session.execute(stmt)]
+
+
+def all_artists():
+    """ Returns every artist's id and name for the /artists listing """
+    return views_of(Artist, Artist.id, Artist.name)
+
+
+def recently_listed(model, limit):
+    """ Returns the limit newest artists or venues """
+    return views_of(model, model.id, model.name, model.image_link, model.created_at,
+                    order_by=(model.created_at.desc(),), limit=limit)
+
+
+def in_area(model, city, state):
+    """ Returns the artists or venues of one city """
+    return views_of(model, model.id, model.name, model.image_link, model.city, model.state,
+                    where=(model.city == city, model.state == state))
+
+
+# Venues.
+
+
+def venue_areas_statement(page=1, per_page=None):
+    """ Returns the grouped venue listing query
+
+    One row per venue: city, state, id, name and the number of upcoming
+    shows, read from the maintained counter. Areas are paginated before
+    the join, one extra area is selected so the caller can tell whether a
+    next page exists. Both steps use the (state, city) index; the forms
+    require city and state, so the plain equality join loses no venue.
+    """
+    areas = (select(Venue.city, Venue.state)
+             .group_by(Venue.state, Venue.city)
+             .order_by(Venue.state, Venue.city))
+    if per_page:
+        areas = areas.limit(per_page + 1).offset((page - 1) * per_page)
+    areas = areas.subquery('areas')
+
+    return (select(Venue.city, Venue.state, Venue.id, Venue.name,
+                   Venue.upcoming_shows_count.label('num_upcoming_shows'))
+            .join(areas, and_(Venue.state == areas.c.state,
+                              Venue.city == areas.c.city))
+            .order_by(Venue.state, Venue.city, Venue.id))
+
+
+def venue_areas(page=1, per_page=None):
+    """ Returns (areas, has_next) for the /venues listing """
+    rows = db.session.execute(venue_areas_statement(page, per_page))
+
+    areas = []
+    for (city, state), venues in groupby(rows, key=lambda row: (row.city, row.state)):
+        areas.append({
+            'city': city,
+            'state': state,
+            'venues': [VenueView(id=venue.id, name=venue.name,
+                                 upcoming_shows_count=venue.num_upcoming_shows)
+                       for venue in venues]
+        })
+
+    has_next = bool(per_page) and len(areas) > per_page
+    if has_next:
+        areas = areas[:per_page]
+
+    return areas, has_next
+
+
+# Shows.
+
+SHOW_FILTERS = ('all', 'upcoming', 'past')
+
+
+def encode_cursor(start_time, show_id):
+    """ Returns an opaque ?after= cursor for a (start_time, id) position """
+    raw = f'{start_time.isoformat()}|{show_id}'.encode()
+    return urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """ Returns the (start_time, id) position of a cursor
+
+    Raises ValueError for anything that is not a cursor we issued.
+    """
+    try:
+        raw = urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        start_time, show_id = raw.split('|')
+        return datetime.fromisoformat(start_time), int(show_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f'Invalid cursor {cursor!r}') from e
+
+
+def shows_statement(when='all', after=None, limit=None, now=None):
+    """ Returns the keyset query behind the /shows listing
+
+    Shows are ordered on (start_time, id), newest first for past shows.
+    after is a decoded cursor; rows strictly beyond it are returned.
+    """
+    now = now or datetime.now()
+    descending = when == 'past'
+
+    stmt = (select(Show.id, Show.start_time,
+                   Show.venue_id, Venue.name.label('venue_name'),
+                   Venue.image_link.label('venue_image_link'),
+                   Show.artist_id, Artist.name.label('artist_name'),
+                   Artist.image_link.label('artist_image_link'))
+            .join(Venue, Venue.id == Show.venue_id)
+            .join(Artist, Artist.id == Show.artist_id))
+
+    if when == 'upcoming':
+        stmt = stmt.where(Show.start_time > now)
+    elif when == 'past':
+        stmt = stmt.where(Show.start_time <= now)
+
+    if after is not None:
+        position = tuple_(Show.start_time, Show.id)
+        stmt = stmt.where(position < tuple_(*after) if descending
+                          else position > tuple_(*after))
+
+    if descending:
+        stmt = stmt.order_by(Show.start_time.desc(), Show.id.desc())
+    else:
+        stmt = stmt.order_by(Show.start_time, Show.id)
+
+    if limit:
+        stmt = stmt.limit(limit)
+    return stmt
+
+
+class ShowPage:
+    """ One page of the /shows listing, fetched while it is rendered
+
+    Iterating yields ShowSummary views of rows read from a server-side
+    cursor as they are needed, so
+    memory stays flat no matter how many shows exist. next_cursor is
+    known once iteration has finished, which is when a streamed
+    template reaches the pager below the list. The cursor is closed even
+    when iteration stops early, e.g. as the client disconnects mid-stream.
+    """
+
+    def __init__(self, when='all', after=None, per_page=50, yield_per=100):
+        if when not in SHOW_FILTERS:
+            raise ValueError(f'Unknown show filter {when!r}')
+        self.when = when
+        self.after = decode_cursor(after) if after else None
+        self.per_page = per_page
+        self.yield_per = yield_per
+        self.has_next = False
+        self._last = None
+
+    def __iter__(self):
+        stmt = shows_statement(self.when, self.after, limit=self.per_page + 1)
+        rows = db.session.execute(
+            stmt.execution_options(yield_per=min(self.yield_per, self.per_page + 1)))
+        try:
+            for count, row in enumerate(rows):
+                if count == self.per_page:
+                    self.has_next = True
+                    break
+                self._last = row
+                yield ShowSummary.from_row(row)
+        finally:
+            rows.close()
+
+    @property
+    def next_cursor(self):
+        """ Cursor of the following page, None on the last page """
+        if not self.has_next:
+            return None
+        return encode_cursor(self._last.start_time, self._last.id)
+
+
+
+# Faceted browse.
+
+SEEKING = {Artist: Artist.seeking_venue, Venue: Venue.seeking_talent}
+
+# GROUPING() of (genre, state, city, seeking) for each grouping set, a bit
+# is set for every column the set leaves out.
+GENRE_SET, STATE_SET, CITY_SET, SEEKING_SET = 0b0111, 0b1011, 0b1001, 0b1110
+
+
+def facet_filters(model, genres=(), state=None, city=None, seeking=None, any_genre=False):
+    """ Returns the WHERE clauses selecting the artists or venues of a browse
+
+    Genres must all be present, or one of them with any_genre; both the
+    containment (@>) and the overlap (&&) are served by the GIN index on
+    genres. State and city use the (state, city) index.
+    """
+    where = []
+    if genres:
+        wanted = cast(list(genres), model.genres.type)
+        where.append(model.genres.overlap(wanted) if any_genre else model.genres.contains(wanted))
+    if state is not None:
+        where.append(model.state == state)
+    if city is not None:
+        where.append(model.city == city)
+    if seeking is not None:
+        where.append(SEEKING[model] == seeking)
+    return where
+
+
+def facet_counts(model, where=(), limit=None):
+    """ Returns (total, facets) of the rows matching where, in one query
+
+    Each row is joined to its genres with a NULL put in front, numbered by
+    WITH ORDINALITY, then GROUPING SETS count genres over the genre copies
+    and state, city and seeking over the NULL ones, in a single pass.
+    facets maps each facet to its limit most frequent values, as {'value',
+    'count'} dicts; city values also carry their state.
+    """
+    seeking = SEEKING[model]
+    tags = (func.unnest(func.array_prepend(None, model.genres))
+            .table_valued('genre', with_ordinality='position')
+            .render_derived(name='tags').lateral())
+    stmt = (select(func.grouping(tags.c.genre, model.state, model.city, seeking).label('set'),
+                   tags.c.genre, model.state, model.city, seeking.label('seeking'),
+                   func.count().filter(tags.c.position == 1).label('rows'),
+                   func.count().filter(tags.c.position > 1).label('tagged'))
+            .select_from(model).join(tags, true())
+            .where(*where)
+            .group_by(func.grouping_sets(tags.c.genre, model.state,
+                                         tuple_(model.state, model.city), seeking)))
+
+    total = 0
+    facets = {'genres': [], 'state': [], 'city': [], seeking.key: []}
+    for row in db.session.execute(stmt):
+        if row.set == GENRE_SET:
+            if row.genre is None:
+                total = row.rows
+            else:
+                facets['genres'].append({'value': row.genre, 'count': row.tagged})
+        elif row.set == STATE_SET:
+            facets['state'].append({'value': row.state, 'count': row.rows})
+        elif row.set == CITY_SET:
+            facets['city'].append({'value': row.city, 'state': row.state, 'count': row.rows})
+        elif row.set == SEEKING_SET:
+            facets[seeking.key].append({'value': row.seeking, 'count': row.rows})
+    for name, values in facets.items():
+        values.sort(key=lambda value: (-value['count'], str(value['value'])))
+        del values[limit:]
+    return total, facets
@@ -0,0 +1,174 @@
+"""
+Read replica routing
+
+SQLALCHEMY_BINDS entries named replica_<n> are read replicas of the
+primary database. RoutingSession, the class of db.session, sends the
+SELECTs of GET and HEAD requests to a replica, each session to the next
+one round-robin. Everything else goes to the primary:
+    - requests with any other method, CLI commands and background work
+    - SELECT ... FOR UPDATE, and any statement that is not a SELECT
+    - the rest of a session once it has sent one of those
+    - everything inside a primary_only() block
+    - every request from a client for REPLICA_STICKY_SECONDS after one of
+      its requests wrote, flagged by a cookie, so it reads its own writes
+      despite replication lag
+
+A session connects to its replica as soon as it picks one, so a replica
+that cannot be reached costs no request: it is marked down, the session
+tries the next one, and after REPLICA_RETRY_SECONDS one session tries it
+again. With no replica reachable, reads fall back to the primary. A
+replica that drops connections mid-request is marked down too.
+"""
+# Imports
+
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from flask import has_request_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+
+# Routing.
+
+REPLICA_PREFIX = 'replica_'
+READ_METHODS = ('GET', 'HEAD')
+STICKY_COOKIE = 'fyyur_primary'
+
+_primary_only = ContextVar('fyyur_primary_only', default=False)
+
+
+@contextmanager
+def primary_only():
+    """ Sends every statement in the block to the primary """
+    token = _primary_only.set(True)
+    try:
+        yield
+    finally:
+        _primary_only.reset(token)
+
+
+def may_write(clause):
+    """ Returns False for a plain SELECT, the only statement a replica takes """
+    return (clause is None or not clause.is_select
+            or getattr(clause, '_for_update_arg', None) is not None)
+
+
+class Replicas:
+    """ Round-robin over the healthy replicas, init_app() hooks it up """
+
+    def __init__(self, app=None):
+        self.keys = ()
+        self._next = 0
+        self._down_until = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', 5)
+        self.retry_seconds = app.config.get('REPLICA_RETRY_SECONDS', 10)
+        self.keys = tuple(sorted(key for key in app.config.get('SQLALCHEMY_BINDS', {})
+                                 if key.startswith(REPLICA_PREFIX)))
+        self._down_until = {}
+
+        with app.app_context():
+            engines = app.extensions['sqlalchemy'].engines
+            for key in self.keys:
+                event.listen(engines[key], 'handle_error', partial(self._handle_error, key))
+        app.after_request(self._after_request)
+
+    # Health.
+
+    def status(self):
+        """ Returns 'up' or 'down' for every replica """
+        now = time.monotonic()
+        with self._lock:
+            return {key: 'down' if self._down_until.get(key, 0) > now else 'up'
+                    for key in self.keys}
+
+    def mark_down(self, key):
+        with self._lock:
+            self._down_until[key] = time.monotonic() + self.retry_seconds
+        self.app.logger.warning('Replica %s is unreachable, reading from the others.', key)
+
+    def mark_up(self, key):
+        with self._lock:
+            was_down = self._down_until.pop(key, None) is not None
+        if was_down:
+            self.app.logger.warning('Replica %s is reachable again.', key)
+
+    def _handle_error(self, key, context):
+        # Failed connects and dropped connections, not statement errors.
+        if context.connection is None or context.is_disconnect:
+            self.mark_down(key)
+
+    def choose(self):
+        """ Returns the key of the next replica to try, None when all are down """
+        now = time.monotonic()
+        with self._lock:
+            for _ in self.keys:
+                key = self.keys[self._next]
+                self._next = (self._next + 1) % len(self.keys)
+                down_until = self._down_until.get(key)
+                if down_until is None:
+                    return key
+                if down_until <= now:
+                    # Other sessions keep skipping it while this one retries.
+                    self._down_until[key] = now + self.retry_seconds
+                    return key
+        return None
+
+    # Requests.
+
+    def reads_replica(self, session):
+        """ Returns True when the current request may read from a replica """
+        return (bool(self.keys) and not session.info.get('primary') and not _primary_only.get()
+                and has_request_context() and request.method in READ_METHODS
+                and STICKY_COOKIE not in request.cookies)
+
+    def _after_request(self, response):
+        if self.keys and self.app.extensions['sqlalchemy'].session().info.get('primary'):
+            response.set_cookie(STICKY_COOKIE, '1', max_age=self.sticky_seconds,
+                                httponly=True, samesite='Lax')
+        return response
+
+
+replicas = Replicas()
+
+
+class RoutingSession(Session):
+    """ Session that reads from the replicas when replicas.reads_replica() allows """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and replicas.keys:
+            if may_write(clause):
+                self.info['primary'] = True
+            elif replicas.reads_replica(self):
+                engine = self._replica()
+                if engine is not None:
+                    return engine
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _replica(self):
+        """ Returns the replica this session reads from, connecting on first use """
+        engine = self.info.get('replica')
+        if engine is not None:
+            return engine
+        for _ in replicas.keys:
+            key = replicas.choose()
+            if key is None:
+                return None
+            try:
+                self.connection(bind_arguments={'bind': self._db.engines[key]})
+            except DBAPIError:
+                # Marked down by the handle_error hook, try the next one.
+                continue
+            replicas.mark_up(key)
+            engine = self.info['replica'] = self._db.engines[key]
+            return engine
+        return None
@@ -0,0 +1,85 @@
+"""
+Name search and autocomplete for artists and venues
+
+Matching uses ILIKE, which the trigram GIN indexes on name serve. Results
+are ranked exact match first, then prefix, then by where the term
+appears, and carry the maintained upcoming-show counter and the total
+match count from the same statement.
+
+Terms shorter than MIN_TERM_LENGTH match nothing: they hold no whole
+trigram, so the index cannot narrow them down and the query would read
+and count every row.
+"""
+# Imports
+
+from sqlalchemy import case, func, select
+
+from models import db, Artist, Venue
+from queries import VIEWS
+
+# Search.
+
+# The trigram length.
+MIN_TERM_LENGTH = 3
+
+
+def escape_like(term):
+    """ Escapes LIKE wildcards so the term is matched literally """
+    return (term.replace('\\', '\\\\')
+                .replace('%', '\\%')
+                .replace('_', '\\_'))
+
+
+def search_statement(model, term, limit):
+    """ Returns the ranked name search query for Artist or Venue """
+    term = (term or '').strip()
+    escaped = escape_like(term)
+
+    rank = case(
+        (func.lower(model.name) == term.lower(), 0),
+        (model.name.ilike(escaped + '%', escape='\\'), 1),
+        else_=2)
+
+    return (select(model.id, model.name,
+                   model.upcoming_shows_count.label('num_upcoming_shows'),
+                   func.count().over().label('total'))
+            .where(model.name.ilike('%' + escaped + '%', escape='\\'))
+            .order_by(rank,
+                      func.strpos(func.lower(model.name), term.lower()),
+                      func.length(model.name),
+                      model.id)
+            .limit(limit))
+
+
+def search_by_name(model, term, limit):
+    """ Returns {'count': total matches, 'data': views of the top ranked rows} """
+    if len((term or '').strip()) < MIN_TERM_LENGTH:
+        return {'count': 0, 'data': []}
+    rows = db.session.execute(search_statement(model, term, limit)).all()
+    return {
+        'count': rows[0].total if rows else 0,
+        'data': [VIEWS[model](id=row.id, name=row.name,
+                              upcoming_shows_count=row.num_upcoming_shows) for row in rows]
+    }
+
+
+def suggest_statement(model, prefix, limit):
+    """ Returns the name prefix query behind /search/suggest """
+    return (select(model.id, model.name)
+            .where(model.name.ilike(escape_like(prefix) + '%', escape='\\'))
+            .order_by(func.length(model.name), model.name)
+            .limit(limit))
+
+
+def suggest(prefix, limit):
+    """ Returns artist and venue names starting with prefix """
+    prefix = (prefix or '').strip()
+    if len(prefix) < MIN_TERM_LENGTH:
+        return {'artists': [], 'venues': []}
+
+    return {
+        'artists': [{'id': row.id, 'name': row.name} for row in
+                    db.session.execute(suggest_statement(Artist, prefix, limit))],
+        'venues': [{'id': row.id, 'name': row.name} for row in
+                   db.session.execute(suggest_statement(Venue, prefix, limit))],
+    }
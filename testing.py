@@ -0,0 +1,46 @@
+"""
+Helpers for tests
+
+count_queries() records every statement sent to the database, and
+assert_num_queries() fails when a route emits more (or fewer) than
+expected, which is how N+1 regressions show up.
+"""
+# Imports
+
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from models import db
+
+# Query counting.
+
+
+@contextmanager
+def count_queries(app):
+    """ Collects the SQL statements executed while the block runs """
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def assert_num_queries(client, url, expected, method='get', **kwargs):
+    """ Requests url with the test client and checks the statement count """
+    with count_queries(client.application) as statements:
+        response = client.open(url, method=method.upper(), **kwargs)
+        # Streamed responses only run their queries as the body is read.
+        response.get_data()
+
+    assert len(statements) == expected, (
+        f'{method.upper()} {url} emitted {len(statements)} statements, '
+        f'expected {expected}:\n' + '\n'.join(statements))
+    return response
@@ -0,0 +1,69 @@
+"""
+Fixtures shared by the tests
+
+The tests run against the database of DATABASE_URL, migrated to head.
+Rows they create only exist in a transaction that is rolled back: the
+session runs on one connection, where commits only release savepoints.
+"""
+# Imports
+
+import pytest
+from sqlalchemy import text
+
+from app import create_app
+from models import db
+from pages import page_cache
+from plans import seed
+from replicas import RoutingSession, primary_only
+
+# Fixtures.
+
+
+class JoinedSession(RoutingSession):
+    """ Sends every statement to the connection the session was made with """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind or self.bind, **kwargs)
+
+
+@pytest.fixture(scope='session')
+def app():
+    app = create_app()
+    # One process: the page cache need not wait for invalidation broadcasts.
+    app.config.update(TESTING=True, WTF_CSRF_ENABLED=False, CACHE_BROADCAST=False)
+    page_cache.init_app(app)
+    return app
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def seeded(app):
+    """ Seeds a small catalogue on the primary, yields the highest ids
+
+    Requests made while it is active share its app context, so they run
+    on the same session and see the uncommitted rows. Whatever they
+    commit is rolled back with the seed.
+    """
+    with app.app_context(), primary_only(), db.engine.connect() as connection:
+        transaction = connection.begin()
+        session = db.session
+        db.session = db._make_scoped_session({
+            'class_': JoinedSession, 'bind': connection,
+            'join_transaction_mode': 'create_savepoint'})
+        try:
+            seed(artists=500, venues=100, shows=5000, cities=20)
+            # Into the connection's transaction, out of reach of a test's rollback().
+            db.session.commit()
+            page_cache.clear()
+            yield {'artist_id': db.session.execute(text('SELECT max(id) FROM artists')).scalar(),
+                   'venue_id': db.session.execute(text('SELECT max(id) FROM venues')).scalar(),
+                   'show_id': db.session.execute(text('SELECT max(id) FROM shows')).scalar()}
+        finally:
+            db.session.remove()
+            db.session = session
+            transaction.rollback()
+            page_cache.clear()
@@ -0,0 +1,69 @@
+"""
+JSON API conditional requests: 304 on If-None-Match, If-Match on PATCH
+"""
+# Seeded venues have no facebook_link, which the form requires.
+FACEBOOK = 'https://www.facebook.com/venue'
+
+# Tests.
+
+
+def test_matching_if_none_match_gets_304(client, seeded):
+    url = f"/api/v1/venues/{seeded['venue_id']}"
+    tag = client.get(url).headers['ETag']
+
+    response = client.get(url, headers={'If-None-Match': tag})
+
+    assert response.status_code == 304
+    assert response.headers['ETag'] == tag
+    assert response.get_data() == b''
+    assert client.get(url, headers={'If-None-Match': '"other"'}).status_code == 200
+
+
+def test_fields_give_a_different_etag(client, seeded):
+    url = f"/api/v1/venues/{seeded['venue_id']}"
+
+    assert client.get(url).headers['ETag'] != client.get(url + '?fields=name').headers['ETag']
+
+
+def test_patch_without_if_match_gets_428(client, seeded):
+    response = client.patch(f"/api/v1/venues/{seeded['venue_id']}", json={'city': 'Houston'})
+
+    assert response.status_code == 428
+    assert 'If-Match' in response.json['error']
+
+
+def test_patch_with_a_stale_if_match_gets_412(client, seeded):
+    url = f"/api/v1/venues/{seeded['venue_id']}"
+    stale = client.get(url).headers['ETag']
+    assert client.patch(url, headers={'If-Match': stale},
+                        json={'city': 'Houston', 'facebook_link': FACEBOOK}).status_code == 200
+
+    response = client.patch(url, headers={'If-Match': stale}, json={'city': 'Austin'})
+
+    assert response.status_code == 412
+    assert client.get(url).json['city'] == 'Houston'
+
+
+def test_patch_returns_the_resource_with_its_new_etag(client, seeded):
+    url = f"/api/v1/venues/{seeded['venue_id']}"
+    tag = client.get(url).headers['ETag']
+
+    response = client.patch(url, headers={'If-Match': tag},
+                            json={'city': 'Houston', 'facebook_link': FACEBOOK})
+
+    assert response.status_code == 200
+    assert response.json['city'] == 'Houston'
+    assert response.headers['ETag'] != tag
+    assert response.headers['ETag'] == client.get(url).headers['ETag']
+
+
+def test_patch_rejects_unknown_and_invalid_fields(client, seeded):
+    url = f"/api/v1/venues/{seeded['venue_id']}"
+    tag = client.get(url).headers['ETag']
+
+    unknown = client.patch(url, headers={'If-Match': tag}, json={'version': 7})
+    invalid = client.patch(url, headers={'If-Match': tag}, json={'facebook_link': 'not a url'})
+
+    assert unknown.status_code == 400
+    assert invalid.status_code == 400
+    assert 'facebook_link' in invalid.json['fields']
@@ -0,0 +1,74 @@
+"""
+Availability engine: interval index and free windows, no database needed
+"""
+# Imports
+
+from collections import namedtuple
+from datetime import date, datetime, time, timedelta
+
+from availability import ArtistSchedule, IntervalIndex
+
+Rule = namedtuple('Rule', 'weekday start_time end_time valid_from valid_until')
+
+DURATION = timedelta(minutes=120)
+
+
+def at(hour, minute=0, day=3):
+    return datetime(2031, 3, day, hour, minute)
+
+# Interval index.
+
+
+def test_intervals_are_merged_and_sorted():
+    index = IntervalIndex([(5, 7), (1, 2), (2, 3), (6, 9)])
+
+    assert list(index) == [(1, 3), (5, 9)]
+
+
+def test_covers_includes_both_ends():
+    index = IntervalIndex([(1, 3), (5, 9)])
+
+    assert [index.covers(point) for point in (0, 1, 3, 4, 5, 9, 10)] \
+        == [False, True, True, False, True, True, False]
+
+
+def test_overlapping_and_since():
+    index = IntervalIndex([(1, 3), (5, 9), (12, 14)])
+
+    assert list(index.overlapping(3, 6)) == [(1, 3), (5, 9)]
+    assert list(index.overlapping(10, 11)) == []
+    assert list(index.since(6)) == [(6, 9), (12, 14)]
+
+# Schedule.
+
+
+def test_free_windows_are_bookable_start_times():
+    schedule = ArtistSchedule([(at(0), at(23, 59))], [], [at(20)], DURATION)
+
+    assert schedule.free_windows(at(0), 10, timedelta(days=1)) \
+        == [(at(0), at(18)), (at(22), at(23, 59))]
+
+
+def test_free_windows_skip_shows_just_before_since():
+    schedule = ArtistSchedule([(at(12), at(18))], [], [at(11)], DURATION)
+
+    assert schedule.free_windows(at(12), 10, timedelta(days=1)) == [(at(13), at(18))]
+
+
+def test_weekly_rules_expand_within_their_validity():
+    # 2031-03-03 is a Monday.
+    rule = Rule(0, time(18), time(23), date(2031, 3, 10), date(2031, 3, 17))
+    schedule = ArtistSchedule([], [rule], [at(20, day=17)], DURATION)
+
+    assert schedule.free_windows(at(0), 10, timedelta(days=28)) \
+        == [(at(18, day=10), at(23, day=10)), (at(22, day=17), at(23, day=17))]
+    assert schedule.covers(at(19, day=10))
+    assert not schedule.covers(at(19, day=3))
+    assert not schedule.covers(at(19, day=24))
+
+
+def test_free_windows_stop_at_count():
+    ranges = [(at(10, day=day), at(12, day=day)) for day in range(3, 10)]
+    schedule = ArtistSchedule(ranges, [], [], DURATION)
+
+    assert len(schedule.free_windows(at(0), 3, timedelta(days=30))) == 3
@@ -0,0 +1,144 @@
+"""
+Batch booking: every entry gets a status, overlaps are conflicts
+"""
+# Imports
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import select, text
+from sqlalchemy.exc import IntegrityError
+
+from booking import Slots, booking_conflict, parse_entry
+from models import db, Show
+
+# Helpers.
+
+
+def insert_show(artist_id, venue_id, start_time):
+    """ Returns the conflict message of inserting the show, None when it went in """
+    try:
+        with db.session.begin_nested():
+            db.session.add(Show(artist_id=artist_id, venue_id=venue_id, start_time=start_time))
+    except IntegrityError as e:
+        return booking_conflict(e)
+
+
+def seeded_show(show_id):
+    return db.session.execute(
+        select(Show.artist_id, Show.venue_id, Show.start_time).where(Show.id == show_id)).one()
+
+
+def has_constraint(name):
+    return db.session.execute(
+        text('SELECT 1 FROM pg_constraint WHERE conname = :name'), {'name': name}).first()
+
+# Tests.
+
+
+def test_parse_entry_reads_local_times():
+    assert parse_entry({'artist_id': '1', 'venue_id': 2, 'start_time': '2031-03-03T20:30:00'}) \
+        == (1, 2, datetime(2031, 3, 3, 20, 30))
+
+
+@pytest.mark.parametrize('start_time', ['2031-03-03T20:30:00+00:00', '2031-03-03T20:30:00Z'])
+def test_parse_entry_rejects_utc_offsets(start_time):
+    with pytest.raises(ValueError, match='UTC offset'):
+        parse_entry({'artist_id': 1, 'venue_id': 2, 'start_time': start_time})
+
+
+def test_batch_entry_with_utc_offset_is_invalid(client, seeded):
+    response = client.post('/shows/batch', json=[{
+        'artist_id': seeded['artist_id'], 'venue_id': seeded['venue_id'],
+        'start_time': '2031-03-03T20:30:00+00:00'}])
+
+    assert response.status_code == 200
+    assert response.json['results'][0]['status'] == 'invalid'
+
+
+def test_slots_overlap_within_the_duration():
+    slots = Slots(timedelta(minutes=120))
+    for hour in (20, 12, 16):
+        slots.add((1, datetime(2031, 3, 3, hour)))
+
+    assert (1, datetime(2031, 3, 3, 21, 59)) in slots
+    assert (1, datetime(2031, 3, 3, 10, 1)) in slots
+    assert (1, datetime(2031, 3, 3, 14)) not in slots
+    assert (1, datetime(2031, 3, 3, 22)) not in slots
+    assert (2, datetime(2031, 3, 3, 20)) not in slots
+
+
+def test_same_start_at_a_venue_is_a_venue_conflict(seeded):
+    show = seeded_show(seeded['show_id'])
+
+    assert insert_show(seeded['artist_id'] - 1, show.venue_id, show.start_time) \
+        == 'The venue already has a show at that time.'
+
+
+def test_same_start_for_an_artist_is_an_artist_conflict(seeded):
+    show = seeded_show(seeded['show_id'])
+
+    assert insert_show(show.artist_id, show.venue_id - 1, show.start_time) \
+        == 'The artist already has a show at that time.'
+
+
+def test_overlapping_start_is_a_conflict(seeded):
+    if not has_constraint('ex_shows_venue_overlap'):
+        pytest.skip('btree_gist is not installed, only equal starts are refused')
+    show = seeded_show(seeded['show_id'])
+
+    assert insert_show(seeded['artist_id'] - 1, show.venue_id,
+                       show.start_time + timedelta(minutes=90)) \
+        == 'The venue already has a show at that time.'
+
+
+def test_unknown_artist_is_reported(seeded):
+    assert insert_show(seeded['artist_id'] + 1, seeded['venue_id'], datetime(2035, 1, 1, 20)) \
+        == 'There is no artist with that ID.'
+    assert booking_conflict(ValueError('not an IntegrityError')) is None
+
+
+def rule_day(artist_id):
+    """ Returns a day in 2035 on which the seeded weekly rule of artist_id applies """
+    day = datetime(2035, 1, 1)
+    return day + timedelta(days=(artist_id % 7 - day.weekday()) % 7)
+
+
+def test_batch_gives_every_entry_a_status(client, seeded):
+    artist_id, venue_id = seeded['artist_id'], seeded['venue_id']
+    # Seven ids apart, so both artists' weekly rules fall on the same day.
+    other_artist_id = artist_id - 7
+    day = rule_day(artist_id)
+    entry = lambda artist, venue, start: {'artist_id': artist, 'venue_id': venue,
+                                          'start_time': start.isoformat()}
+
+    response = client.post('/shows/batch', json=[
+        entry(artist_id, venue_id, day.replace(hour=20)),
+        entry(artist_id, venue_id - 1, day.replace(hour=21)),
+        entry(other_artist_id, venue_id, day.replace(hour=21, minute=30)),
+        entry(artist_id, venue_id, day.replace(hour=20) + timedelta(days=1)),
+        entry(artist_id + 1, venue_id, day.replace(hour=20)),
+        {'artist_id': 'x', 'venue_id': venue_id, 'start_time': day.isoformat()},
+        'not an object',
+    ])
+
+    assert response.status_code == 201
+    assert response.json['created'] == 1
+    results = response.json['results']
+    assert [result['status'] for result in results] \
+        == ['created', 'conflict', 'conflict', 'unavailable', 'invalid', 'invalid', 'invalid']
+    assert results[1]['error'] == 'The artist already has a show at that time.'
+    assert results[2]['error'] == 'The venue already has a show at that time.'
+    assert results[4]['error'] == 'There is no artist with that ID.'
+    assert db.session.get(Show, results[0]['id']).start_time == day.replace(hour=20)
+
+    again = client.post('/shows/batch', json=[
+        entry(artist_id, venue_id - 2, day.replace(hour=19))])
+    assert again.status_code == 200
+    assert again.json['results'][0]['status'] == 'conflict'
+
+
+def test_batch_rejects_malformed_payloads(app, client, seeded):
+    assert client.post('/shows/batch', json={'not': 'a list'}).status_code == 400
+    too_many = [{}] * (app.config['SHOW_BATCH_LIMIT'] + 1)
+    assert client.post('/shows/batch', json=too_many).status_code == 413
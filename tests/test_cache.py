@@ -0,0 +1,148 @@
+"""
+Page cache: a build that overlaps an invalidation must not be stored, and
+writes drop the pages they change
+"""
+# Imports
+
+import threading
+import time
+
+import pytest
+from flask import Flask
+from sqlalchemy import select
+
+from cache import PageCache, detail_key, read_refreshing, read_through
+from models import db, Show
+from pages import page_cache
+
+# Fixtures.
+
+
+@pytest.fixture
+def cache():
+    app = Flask(__name__)
+    app.config['CACHE_BROADCAST'] = False
+    return PageCache(app)
+
+
+def blocked_build(value, started, release):
+    def build():
+        started.set()
+        release.wait(5)
+        return value, None
+    return build
+
+# Tests.
+
+
+def test_build_overlapping_a_delete_is_not_stored(cache):
+    started, release = threading.Event(), threading.Event()
+    results = []
+    reader = threading.Thread(target=lambda: results.append(read_through(
+        cache, 'k', blocked_build('Austin', started, release), 300)))
+    reader.start()
+    started.wait(5)
+
+    cache.delete('k')
+    release.set()
+    reader.join(5)
+
+    assert results == ['Austin']
+    assert cache.get('k') is None
+    assert read_through(cache, 'k', lambda: ('Houston', None), 300) == 'Houston'
+    assert cache.get('k') == 'Houston'
+
+
+def test_misses_after_a_delete_do_not_join_the_stale_build(cache):
+    started, release = threading.Event(), threading.Event()
+    reader = threading.Thread(target=read_through, args=(
+        cache, 'k', blocked_build('Austin', started, release), 300))
+    reader.start()
+    started.wait(5)
+
+    cache.delete('k')
+    assert read_through(cache, 'k', lambda: ('Houston', None), 300) == 'Houston'
+    release.set()
+    reader.join(5)
+
+    assert cache.get('k') == 'Houston'
+
+
+def test_forgotten_generations_still_reject_stale_builds(cache):
+    generation = cache.generation('k')
+    cache.delete(*(f'other:{n}' for n in range(PageCache.MAX_GENERATIONS + 1)))
+
+    cache.set('k', 'Austin', 300, generation)
+
+    assert cache.get('k') is None
+
+
+def test_failed_broadcast_is_logged_not_raised(cache, caplog):
+    class Unreachable:
+        listening = True
+
+        def publish(self, keys):
+            raise OSError('connection refused')
+
+    cache.broadcast = Unreachable()
+    cache.set('k', 'Austin', 300)
+
+    cache.delete('k')
+
+    assert cache.backend.get('k') is None
+    assert 'Could not broadcast the deletion of k' in caplog.text
+
+
+def test_stale_entry_is_served_while_rebuilt_in_the_background(cache):
+    app = Flask(__name__)
+    builds = []
+
+    def build():
+        builds.append(len(builds))
+        return 'Houston'
+
+    assert read_refreshing(app, cache, 'k', build, 60) == 'Houston'
+    cache.set('k', {'value': 'Austin', 'built_at': time.time() - 120}, 300)
+
+    assert read_refreshing(app, cache, 'k', build, 60) == 'Austin'
+    deadline = time.monotonic() + 5
+    while cache.get('k')['value'] != 'Houston' and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert read_refreshing(app, cache, 'k', build, 60) == 'Houston'
+    assert builds == [0, 1]
+
+
+# Invalidation by writes.
+
+
+def mentions_houston(client, kind, entity_id):
+    page = client.get(f'/{kind}/{entity_id}').get_data(as_text=True)
+    return 'Houston' in page
+
+
+def test_editing_an_artist_drops_its_cached_page(client, seeded):
+    artist_id = seeded['artist_id']
+    assert not mentions_houston(client, 'artists', artist_id)
+    assert page_cache.get(detail_key('artist', artist_id)) is not None
+
+    response = client.post(f'/artists/{artist_id}/edit', data={
+        'name': 'Renamed', 'city': 'Houston', 'state': 'TX', 'phone': '713-555-0100',
+        'genres': 'Jazz'}, follow_redirects=True)
+
+    assert 'successfully updated' in response.get_data(as_text=True)
+    assert mentions_houston(client, 'artists', artist_id)
+
+
+def test_patching_a_venue_drops_the_pages_of_artists_playing_there(client, seeded):
+    artist_id, venue_id = db.session.execute(
+        select(Show.artist_id, Show.venue_id).where(Show.id == seeded['show_id'])).one()
+    assert not mentions_houston(client, 'artists', artist_id)
+    tag = client.get(f'/api/v1/venues/{venue_id}').headers['ETag']
+
+    # Seeded venues have no facebook_link, which the form requires.
+    response = client.patch(f'/api/v1/venues/{venue_id}', headers={'If-Match': tag}, json={
+        'city': 'Houston', 'facebook_link': 'https://www.facebook.com/venue'})
+
+    assert response.status_code == 200
+    assert page_cache.get(detail_key('artist', artist_id)) is None
+    assert page_cache.get(detail_key('venue', venue_id)) is None
@@ -0,0 +1,86 @@
+"""
+Change feed: snapshot access, cursors and the horizon
+"""
+# Imports
+
+import json
+
+import pytest
+from sqlalchemy import delete, insert, update
+
+import changelog
+from models import db, Change, ChangeLogState
+
+# Fixtures.
+
+
+@pytest.fixture
+def feed(client, monkeypatch):
+    """ Returns a reader of /api/v1/changes, which compacts nothing while testing """
+    # Compaction runs on a thread, which must not share the seeded connection.
+    monkeypatch.setattr(changelog, 'compact_soon', lambda app: None)
+    return lambda cursor: client.get('/api/v1/changes', query_string={'after': cursor})
+
+# Tests.
+
+
+@pytest.mark.parametrize('token, headers, status', [
+    (None, {'Authorization': 'Bearer secret'}, 404),
+    ('secret', {}, 401),
+    ('secret', {'Authorization': 'Bearer wrong'}, 401),
+])
+def test_snapshot_requires_the_export_token(app, client, seeded, monkeypatch,
+                                            token, headers, status):
+    monkeypatch.setitem(app.config, 'EXPORT_TOKEN', token)
+
+    assert client.get('/api/v1/changes/snapshot', headers=headers).status_code == status
+
+
+def test_snapshot_starts_with_the_cursor(app, client, monkeypatch):
+    # Not seeded: the snapshot reads committed rows, on a connection of its own.
+    monkeypatch.setitem(app.config, 'EXPORT_TOKEN', 'secret')
+
+    response = client.get('/api/v1/changes/snapshot',
+                          headers={'Authorization': 'Bearer secret'})
+
+    lines = response.get_data(as_text=True).splitlines()
+    assert response.status_code == 200
+    assert 'cursor' in json.loads(lines[0])
+    assert {json.loads(line)['kind'] for line in lines[1:]} <= {'artists', 'venues', 'shows'}
+
+
+def test_garbage_cursor_gets_400(feed, seeded):
+    response = feed('not a cursor')
+
+    assert response.status_code == 400
+    assert 'cursor' in response.json['error']
+
+
+def test_cursor_before_the_compacted_log_gets_410(feed, seeded):
+    db.session.execute(update(ChangeLogState).values(expired_txid=2 ** 62, expired_id=0))
+
+    response = feed(changelog.encode_position(1, 1))
+
+    assert response.status_code == 410
+    assert 'snapshot' in response.json['error']
+
+
+def test_change_committed_behind_an_open_transaction_is_not_served(feed, seeded):
+    # The seeded transaction stays open, so a change committed meanwhile by
+    # another connection is above the horizon until it finishes.
+    with db.engine.begin() as connection:
+        change = connection.execute(
+            insert(Change).values(kind='artists', entity_id=seeded['artist_id'], op='update')
+            .returning(Change.txid, Change.id)).one()
+    try:
+        cursor = changelog.encode_position(change.txid, change.id - 1)
+
+        response = feed(cursor)
+
+        assert response.status_code == 200
+        assert response.json['data'] == []
+        assert response.json['next'] == cursor
+        assert not response.json['has_more']
+    finally:
+        with db.engine.begin() as connection:
+            connection.execute(delete(Change).where(Change.id == change.id))
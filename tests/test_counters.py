@@ -0,0 +1,74 @@
+"""
+Show counters: kept in step with the shows, without touching updated_at
+"""
+# Imports
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+
+from counters import count_shows, recount, rolled_at, rollover
+from models import db, Artist, Venue, Show
+
+# Helpers.
+
+
+def counters(model, entity_id):
+    return db.session.execute(
+        select(model.upcoming_shows_count, model.past_shows_count, model.updated_at)
+        .where(model.id == entity_id)).one()
+
+
+def counted(model, entity_id, now):
+    """ Returns (upcoming, past) counted from the shows table """
+    column = Show.artist_id if model is Artist else Show.venue_id
+    shows = select(func.count()).where(column == entity_id)
+    return (db.session.execute(shows.where(Show.start_time > now)).scalar(),
+            db.session.execute(shows.where(Show.start_time <= now)).scalar())
+
+# Tests.
+
+
+def test_recount_matches_the_shows(seeded):
+    now = datetime.now()
+    recount(now)
+
+    for model, entity_id in ((Artist, seeded['artist_id']), (Venue, seeded['venue_id'])):
+        upcoming, past, _ = counters(model, entity_id)
+        assert (upcoming, past) == counted(model, entity_id, now)
+    assert rolled_at() == now
+
+
+def test_count_shows_adds_and_removes_without_touching_updated_at(seeded):
+    artist_id, venue_id = seeded['artist_id'], seeded['venue_id']
+    recount()
+    before = counters(Artist, artist_id)
+    future, past = datetime.now() + timedelta(days=400), datetime.now() - timedelta(days=400)
+
+    count_shows([(artist_id, venue_id, future), (artist_id, venue_id, past)])
+    after = counters(Artist, artist_id)
+    assert (after.upcoming_shows_count, after.past_shows_count) \
+        == (before.upcoming_shows_count + 1, before.past_shows_count + 1)
+    assert after.updated_at == before.updated_at
+
+    count_shows([(artist_id, venue_id, future)], sign=-1)
+    assert counters(Artist, artist_id).upcoming_shows_count == before.upcoming_shows_count
+
+
+def test_rollover_moves_started_shows_to_past(seeded):
+    artist_id = seeded['artist_id']
+    watermark = datetime.now()
+    recount(watermark)
+    before = counters(Artist, artist_id)
+    later = watermark + timedelta(days=30)
+
+    moved = rollover(later)
+
+    after = counters(Artist, artist_id)
+    started = before.upcoming_shows_count - after.upcoming_shows_count
+    assert moved > 0 and started > 0
+    assert after.past_shows_count == before.past_shows_count + started
+    assert (after.upcoming_shows_count, after.past_shows_count) \
+        == counted(Artist, artist_id, later)
+    assert after.updated_at == before.updated_at
+    assert rollover(later) == 0
@@ -0,0 +1,105 @@
+"""
+Faceted browse: the page, total and facet counts of the matching rows
+"""
+# Imports
+
+from collections import Counter
+
+import pytest
+from sqlalchemy import select
+
+from models import db, Venue
+
+URL = '/api/v1/venues/browse'
+
+# API_MAX_PAGE_SIZE
+PAGE = 200
+
+# Helpers.
+
+
+def venues():
+    return db.session.execute(
+        select(Venue.id, Venue.genres, Venue.state, Venue.city, Venue.seeking_talent)
+        .order_by(Venue.id)).all()
+
+
+def ranked(counts):
+    """ Returns {'value', 'count'} dicts of counts the way the API orders them """
+    return sorted(({'value': value, 'count': count} for value, count in counts.items()),
+                  key=lambda value: (-value['count'], str(value['value'])))
+
+
+def expected(rows):
+    """ Returns (total, facets) of rows, counted in Python """
+    return len(rows), {
+        'genres': ranked(Counter(genre for row in rows for genre in row.genres or ())),
+        'state': ranked(Counter(row.state for row in rows)),
+        'city': Counter((row.state, row.city) for row in rows),
+        'seeking_talent': ranked(Counter(row.seeking_talent for row in rows)),
+    }
+
+
+def browse(client, **args):
+    response = client.get(URL, query_string={'limit': PAGE, **args})
+    assert response.status_code == 200, response.json
+    return response.json
+
+# Fixtures.
+
+
+@pytest.fixture
+def unlimited(app, monkeypatch):
+    monkeypatch.setitem(app.config, 'FACET_LIMIT', 1000)
+
+# Tests.
+
+
+@pytest.mark.parametrize('args, keep', [
+    ({}, lambda row: True),
+    ({'genre': 'Jazz'}, lambda row: 'Jazz' in (row.genres or ())),
+    ({'genre': ['Jazz', 'Blues']}, lambda row: {'Jazz', 'Blues'} <= set(row.genres or ())),
+    ({'genre': ['Jazz', 'Blues'], 'genre_match': 'any'},
+     lambda row: {'Jazz', 'Blues'} & set(row.genres or ())),
+    ({'state': 'CA', 'seeking': 'true'}, lambda row: row.state == 'CA' and row.seeking_talent),
+    ({'state': 'CA', 'city': 'City 10'}, lambda row: (row.state, row.city) == ('CA', 'City 10')),
+])
+def test_browse_matches_every_filter(client, seeded, unlimited, args, keep):
+    # One venue with both genres, so all and any differ.
+    db.session.get(Venue, seeded['venue_id']).genres = ['Jazz', 'Blues']
+    db.session.commit()
+    rows = [row for row in venues() if keep(row)]
+    total, facets = expected(rows)
+    assert rows
+
+    body = browse(client, **args)
+
+    assert [venue['id'] for venue in body['data']] == [row.id for row in rows][:PAGE]
+    assert (body['next'] is not None) == (len(rows) > PAGE)
+    assert body['total'] == total
+    cities = body['facets'].pop('city')
+    assert Counter({(city['state'], city['value']): city['count'] for city in cities}) \
+        == facets.pop('city')
+    assert body['facets'] == facets
+
+
+def test_facets_keep_the_most_frequent_values(app, client, seeded, monkeypatch):
+    monkeypatch.setitem(app.config, 'FACET_LIMIT', 2)
+
+    facets = browse(client)['facets']
+
+    assert all(len(values) <= 2 for values in facets.values())
+    assert facets['genres'] == ranked(
+        Counter(genre for row in venues() for genre in row.genres or ()))[:2]
+
+
+@pytest.mark.parametrize('args, error', [
+    ({'genre': 'Polka'}, 'Unknown genres Polka.'),
+    ({'seeking': 'maybe'}, 'seeking must be true or false.'),
+    ({'genre_match': 'some'}, 'genre_match must be all or any.'),
+])
+def test_bad_filters_get_400(client, seeded, args, error):
+    response = client.get(URL, query_string=args)
+
+    assert response.status_code == 400
+    assert response.json['error'] == error
@@ -0,0 +1,91 @@
+"""
+Bulk import: resuming never repeats a committed batch or its rejects
+"""
+# Imports
+
+import csv
+
+import pytest
+from sqlalchemy import select
+
+import importer
+from cache import detail_key
+from models import db, Artist
+from pages import page_cache
+
+# Helpers.
+
+
+def write_artists(path, count):
+    """ Writes count artists, every fifth with an invalid state """
+    with open(path, 'w', newline='') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(['name', 'city', 'state', 'phone', 'genres', 'facebook_link'])
+        for n in range(count):
+            writer.writerow([f'Imported {n}', 'Austin', 'ZZ' if n % 5 == 0 else 'TX',
+                             '512-555-0100', 'Jazz', 'https://www.facebook.com/imported'])
+
+
+def imported_names():
+    return db.session.execute(
+        select(Artist.name).where(Artist.name.like('Imported %'))).scalars().all()
+
+
+def crash_on(monkeypatch, method, call):
+    """ Makes Checkpoint.method raise on its call-th call """
+    real, calls = getattr(importer.Checkpoint, method), []
+
+    def crashing(self):
+        calls.append(1)
+        if len(calls) == call:
+            raise KeyboardInterrupt
+        return real(self)
+    monkeypatch.setattr(importer.Checkpoint, method, crashing)
+
+# Tests.
+
+
+@pytest.mark.parametrize('method', ['stage', 'mirror'])
+def test_resume_after_a_crash_imports_every_record_once(seeded, tmp_path, monkeypatch, method):
+    # Crashing in stage() loses the batch's commit, in mirror() the file copy.
+    path = str(tmp_path / 'artists.csv')
+    write_artists(path, 25)
+    crash_on(monkeypatch, method, 2)
+    with pytest.raises(KeyboardInterrupt):
+        importer.import_file('artists', path, batch_size=4)
+    db.session.rollback()
+    monkeypatch.undo()
+
+    checkpoint = importer.import_file('artists', path, batch_size=4)
+
+    names = imported_names()
+    assert sorted(names) == sorted(f'Imported {n}' for n in range(25) if n % 5)
+    assert (checkpoint.imported, checkpoint.rejected, checkpoint.complete) == (20, 5, True)
+    with open(path + '.rejects.ndjson') as rejects:
+        assert len(rejects.readlines()) == 5
+
+
+def test_completed_import_is_not_repeated_unless_restarted(seeded, tmp_path):
+    path = str(tmp_path / 'artists.csv')
+    write_artists(path, 6)
+    importer.import_file('artists', path)
+
+    assert importer.import_file('artists', path).imported == 4
+    assert len(imported_names()) == 4
+    importer.import_file('artists', path, restart=True)
+    assert len(imported_names()) == 8
+
+
+def test_show_batches_drop_cached_detail_pages(client, seeded, tmp_path):
+    artist_id, venue_id = seeded['artist_id'], seeded['venue_id']
+    assert client.get(f'/artists/{artist_id}').status_code == 200
+    assert page_cache.get(detail_key('artist', artist_id)) is not None
+    path = str(tmp_path / 'shows.csv')
+    with open(path, 'w', newline='') as handle:
+        writer = csv.writer(handle)
+        writer.writerow(['artist_id', 'venue_id', 'start_time'])
+        writer.writerow([artist_id, venue_id, '2035-01-01 20:00:00'])
+
+    assert importer.import_file('shows', path).imported == 1
+    assert page_cache.get(detail_key('artist', artist_id)) is None
+    assert '2035' in client.get(f'/artists/{artist_id}').get_data(as_text=True)
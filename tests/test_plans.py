@@ -0,0 +1,32 @@
+"""
+Hot routes must keep using indexes on a large dataset, see plans.py
+"""
+# Imports
+
+from sqlalchemy import text
+
+import plans
+from models import db
+from replicas import primary_only
+
+# Tests.
+
+
+def test_hot_routes_avoid_sequential_scans(app):
+    lines = []
+    with app.app_context():
+        failures = plans.run(app, report=lines.append)
+    assert failures == 0, '\n'.join(lines)
+
+
+def test_sequential_scan_fails_the_check(app):
+    lines = []
+    with app.app_context(), primary_only():
+        # Rolled back with the dataset by plans.run().
+        for setting in ('enable_indexscan', 'enable_indexonlyscan', 'enable_bitmapscan'):
+            db.session.execute(text(f'SET LOCAL {setting} = off'))
+        failures = plans.run(app, artists=2000, venues=500, shows=10000, report=lines.append,
+                             routes=[('GET', '/shows', None, ())])
+    assert failures == 1
+    assert any(line.startswith('  Seq Scan on ') and 'shows' in line for line in lines), \
+        '\n'.join(lines)
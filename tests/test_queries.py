@@ -0,0 +1,47 @@
+"""
+Statements per request must not grow with the data, which is how N+1
+queries show up, and streamed pages must not leave cursors open
+"""
+# Imports
+
+import pytest
+from sqlalchemy import text
+
+from models import db
+from queries import ShowPage
+from testing import assert_num_queries
+
+# Tests.
+
+
+@pytest.mark.parametrize('url, expected', [
+    ('/artists', 1),
+    ('/venues', 1),
+    ('/shows', 1),
+    # Detail pages are built on a cache miss: the page, its shows and availability.
+    ('/artists/{artist_id}', 4),
+    ('/venues/{venue_id}', 2),
+    ('/api/v1/artists', 1),
+    ('/api/v1/artists/{artist_id}', 1),
+    ('/api/v1/venues/{venue_id}', 1),
+    ('/api/v1/shows', 1),
+    ('/api/v1/shows/{show_id}', 1),
+])
+def test_statements_per_request(client, seeded, url, expected):
+    response = assert_num_queries(client, url.format(**seeded), expected)
+    assert response.status_code == 200
+
+
+def open_cursors():
+    return db.session.execute(text('SELECT count(*) FROM pg_cursors')).scalar()
+
+
+def test_show_page_closes_its_cursor_when_abandoned(seeded):
+    shows = iter(ShowPage(per_page=50, yield_per=5))
+    next(shows)
+    assert open_cursors() == 1
+
+    # What the WSGI server does when the client disconnects mid-stream.
+    shows.close()
+
+    assert open_cursors() == 0
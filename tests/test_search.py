@@ -0,0 +1,34 @@
+"""
+Name search: terms too short for the trigram index are not run
+"""
+# Imports
+
+import pytest
+
+from testing import assert_num_queries
+
+# Tests.
+
+
+@pytest.mark.parametrize('term', ['', ' ', 'a', 'Ar '])
+def test_short_terms_find_nothing_without_a_query(client, seeded, term):
+    assert_num_queries(client, '/artists/search', 0, method='post', data={'search_term': term})
+    response = assert_num_queries(client, f'/search/suggest?q={term}', 0)
+
+    assert response.json == {'artists': [], 'venues': []}
+
+
+def test_search_ranks_the_exact_match_first(client, seeded):
+    response = assert_num_queries(client, '/venues/search', 1, method='post',
+                                  data={'search_term': 'Venue 1'})
+
+    page = response.get_data(as_text=True)
+    assert page.index('<h5>Venue 1</h5>') < page.index('<h5>Venue 10</h5>')
+
+
+def test_suggest_lists_names_by_prefix(client, seeded):
+    response = assert_num_queries(client, '/search/suggest?q=Artist 12', 2)
+
+    names = [artist['name'] for artist in response.json['artists']]
+    assert names[0] == 'Artist 12'
+    assert all(name.startswith('Artist 12') for name in names)
@@ -0,0 +1,87 @@
+"""
+View models for pages and the JSON API
+
+ArtistView, VenueView and ShowSummary are plain slotted objects built
+straight from SQL result rows, so read-only routes never create ORM
+instances or touch the identity map. Fields a query did not select are
+None. to_dict() gives the JSON form, served by the API and stored by
+the detail page cache; from_dict() reads it back.
+"""
+# Imports
+
+from datetime import datetime
+
+# Views.
+
+
+def _encode(value):
+    if isinstance(value, View):
+        return value.to_dict()
+    if isinstance(value, list):
+        return [_encode(item) for item in value]
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+class View:
+    """ Base class: one slot per field, set from keyword arguments """
+    __slots__ = ()
+    # field: function turning its to_dict() form back into the value
+    DECODERS = {}
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
+
+    @classmethod
+    def from_row(cls, row):
+        """ Returns the view of a result row, matching columns by label """
+        return cls(**row._mapping)
+
+    @classmethod
+    def from_dict(cls, data):
+        view = cls(**data)
+        for name, decode in cls.DECODERS.items():
+            value = getattr(view, name)
+            if value is not None:
+                setattr(view, name, decode(value))
+        return view
+
+    def to_dict(self, fields=None):
+        """ Returns the JSON-able form of fields, every field by default """
+        return {name: _encode(getattr(self, name)) for name in fields or self.__slots__}
+
+    def __repr__(self):
+        return f'<{type(self).__name__} {getattr(self, "id", None)}>'
+
+
+def _shows(items):
+    return [ShowSummary.from_dict(item) for item in items]
+
+
+class ShowSummary(View):
+    """ A show as listed on /shows and on artist and venue pages """
+    __slots__ = ('id', 'start_time', 'artist_id', 'artist_name', 'artist_image_link',
+                 'venue_id', 'venue_name', 'venue_image_link')
+    DECODERS = {'start_time': datetime.fromisoformat}
+
+
+class ArtistView(View):
+    """ An artist, with its shows on the detail page """
+    __slots__ = ('id', 'name', 'city', 'state', 'phone', 'genres', 'image_link',
+                 'facebook_link', 'website_link', 'seeking_venue', 'seeking_description',
+                 'created_at', 'upcoming_shows_count', 'past_shows_count',
+                 'upcoming_shows', 'past_shows', 'availability_data')
+    DECODERS = {'created_at': datetime.fromisoformat,
+                'upcoming_shows': _shows, 'past_shows': _shows}
+
+
+class VenueView(View):
+    """ A venue, with its shows on the detail page """
+    __slots__ = ('id', 'name', 'city', 'state', 'address', 'phone', 'genres', 'image_link',
+                 'facebook_link', 'website_link', 'seeking_talent', 'seeking_description',
+                 'created_at', 'upcoming_shows_count', 'past_shows_count',
+                 'upcoming_shows', 'past_shows')
+    DECODERS = {'created_at': datetime.fromisoformat,
+                'upcoming_shows': _shows, 'past_shows': _shows}
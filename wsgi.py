@@ -0,0 +1,12 @@
+"""
+WSGI entry point, e.g. `gunicorn -c gunicorn.conf.py`
+
+The app is created once at import. With preload_app the master imports
+it before forking; the os.register_at_fork() hook in app.py disposes the
+inherited connection pools in every worker.
+"""
+# Imports
+
+from app import create_app
+
+app = create_app()